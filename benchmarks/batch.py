@@ -0,0 +1,94 @@
+"""Run the batch runner end to end against the stub OpenAI batch API.
+
+Generates a synthetic corpus, starts ``stub_openai`` and files the corpus
+with ``python -m ai_filer --batch``, then checks how many documents were
+filed and how many batch requests the stub ran::
+
+    python -m benchmarks.batch --docs 20 --batch-latency 1
+
+``--fail-marker`` makes the stub fail the requests whose prompt contains
+some text, and ``--timeout`` below ``--batch-latency`` cancels the jobs,
+to check that the documents whose requests failed stay in the watch
+folder. The exit status is non-zero when the number of filed documents is
+not the expected one (all of them, unless ``--expect`` says otherwise).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from benchmarks import corpus
+from benchmarks.stub_openai import StubOpenAI
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='benchmarks.batch',
+                                     description='File a synthetic corpus through the stub OpenAI batch API.')
+    parser.add_argument('--docs', type=int, default=8, help='number of documents')
+    parser.add_argument('--pages', type=int, default=2, help='pages per document')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed')
+    parser.add_argument('--batch-latency', type=float, default=0.5, help='seconds before a stub batch completes')
+    parser.add_argument('--poll-interval', type=float, default=0.1, help='batch_poll_interval')
+    parser.add_argument('--timeout', type=float, default=60.0, help='batch_timeout')
+    parser.add_argument('--max-requests', type=int, default=1000, help='batch_max_requests')
+    parser.add_argument('--fail-marker', help='fail the batch requests whose prompt contains this text')
+    parser.add_argument('--expect', type=int, help='number of documents expected to be filed (default: all)')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='ai_filer_bench_batch_')
+    stub = StubOpenAI(batch_latency=args.batch_latency, fail_marker=args.fail_marker).start()
+    saved = dict(os.environ)
+    try:
+        watch_folder = os.path.join(workdir, 'watch')
+        dest_folder = os.path.join(workdir, 'filed')
+        corpus.generate(watch_folder, 'text', args.docs, args.pages, seed=args.seed)
+        corpus.create_filing_tree(dest_folder)
+        os.environ.update({
+            'HOME': workdir,
+            'WATCH_FOLDER': watch_folder,
+            'DEST_FOLDER': dest_folder,
+            'MODEL': 'openai',
+            'OPENAI_API_KEY': 'stub',
+            'OPENAI_BASE_URL': stub.url,
+            'USE_MAC_KEYRING': 'false',
+            'BATCH_POLL_INTERVAL': str(args.poll_interval),
+            'BATCH_TIMEOUT': str(args.timeout),
+            'BATCH_MAX_REQUESTS': str(args.max_requests),
+        })
+        os.environ.pop('TESTING', None)
+
+        from ai_filer.main import main as ai_filer_main
+
+        start = time.perf_counter()
+        ai_filer_main(['--batch'])
+        elapsed = time.perf_counter() - start
+        remaining = len([f for f in os.listdir(watch_folder) if f.endswith('.pdf')])
+        results = {
+            'parameters': vars(args),
+            'seconds': round(elapsed, 3),
+            'filed': args.docs - remaining,
+            'left_in_watch_folder': remaining,
+            'batch_requests': dict(stub.calls),
+            'files_left_on_stub': len(stub.files),
+        }
+    finally:
+        stub.stop()
+        os.environ.clear()
+        os.environ.update(saved)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    expected = args.docs if args.expect is None else args.expect
+    if results['filed'] != expected or results['files_left_on_stub']:
+        print(f"Filed {results['filed']} documents, expected {expected}; "
+              f"{results['files_left_on_stub']} uploads were not deleted", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Synthetic PDF corpora for the benchmarks.
+
+Documents are generated deterministically from a seed, as text-layer PDFs
+(real text drawn with a standard font), scanned PDFs (one grayscale JPEG
+per page and no text layer) or mixed PDFs (alternating pages). The PDFs
+are written by hand so the corpus doesn't depend on a PDF library.
+"""
+import io
+import os
+import random
+
+KINDS = ('text', 'scanned', 'mixed')
+
+# Document types the corpus is drawn from, with the folder they belong in
+TOPICS = [
+    ('Thames Water', 'water bill', 'Bills/Water'),
+    ('Octopus Energy', 'electricity bill', 'Bills/Energy'),
+    ('Camden Council', 'council tax bill', 'Tax/Council Tax'),
+    ('HMRC', 'self assessment tax return', 'Tax/Income Tax'),
+    ('Barclays', 'bank statement', 'Bank/Statements'),
+    ('Aviva', 'home insurance renewal', 'Insurance/Home'),
+    ('NHS', 'appointment letter', 'Medical'),
+    ('DVLA', 'vehicle tax reminder', 'Car'),
+]
+
+_FILLER = ('account reference payment due date amount balance period charges usage total customer '
+           'service address notice please contact details summary previous statement direct debit').split()
+
+_PAGE_WIDTH = 612
+_PAGE_HEIGHT = 792
+_LINES_PER_PAGE = 40
+
+
+def _page_lines(rng: random.Random, organization: str, document_type: str, page: int) -> list[str]:
+    lines = [f"{organization} - {document_type}", f"Page {page}"]
+    while len(lines) < _LINES_PER_PAGE:
+        words = rng.choices(_FILLER, k=rng.randint(6, 11))
+        lines.append(' '.join(words) + f" {rng.randint(1, 9999)}.{rng.randint(0, 99):02d}")
+    return lines
+
+
+def _escape(text: str) -> bytes:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').encode('latin-1', 'replace')
+
+
+def _text_stream(lines: list[str]) -> bytes:
+    parts = [b'BT /F1 11 Tf 14 TL 54 750 Td']
+    for line in lines:
+        parts.append(b'(' + _escape(line) + b') Tj T*')
+    parts.append(b'ET')
+    return b'\n'.join(parts)
+
+
+def _scanned_image(lines: list[str], dpi: int) -> tuple[bytes, int, int]:
+    """Render page lines into a grayscale JPEG, like a scanner would."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    scale = dpi / 72
+    width, height = int(_PAGE_WIDTH * scale), int(_PAGE_HEIGHT * scale)
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=int(11 * scale))
+    except TypeError:
+        font = ImageFont.load_default()
+    y = 42 * scale
+    for line in lines:
+        draw.text((54 * scale, y), line, fill=0, font=font)
+        y += 14 * scale
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=75)
+    return buffer.getvalue(), width, height
+
+
+class _PdfBuilder:
+    """Minimal PDF writer: numbered objects, a classic xref table and a trailer."""
+
+    def __init__(self):
+        self.objects = []
+
+    def add(self, body: bytes) -> int:
+        self.objects.append(body)
+        return len(self.objects)
+
+    def set(self, number: int, body: bytes):
+        self.objects[number - 1] = body
+
+    def add_stream(self, dictionary: bytes, data: bytes) -> int:
+        return self.add(b'<< ' + dictionary + b' /Length %d >>\nstream\n' % len(data) + data + b'\nendstream')
+
+    def write(self, path: str):
+        out = io.BytesIO()
+        out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(self.objects, start=1):
+            offsets.append(out.tell())
+            out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+        xref = out.tell()
+        out.write(b'xref\n0 %d\n0000000000 65535 f\r\n' % (len(self.objects) + 1))
+        for offset in offsets:
+            out.write(b'%010d 00000 n\r\n' % offset)
+        out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.objects) + 1, xref))
+        with open(path, 'wb') as f:
+            f.write(out.getvalue())
+
+
+def write_pdf(path: str, kind: str, pages: int, rng: random.Random, dpi: int = 150) -> str:
+    """Write one synthetic document and return the folder it belongs in.
+
+    Args:
+        path (str): Where to write the PDF.
+        kind (str): 'text', 'scanned' or 'mixed'.
+        pages (int): Number of pages.
+        rng (random.Random): Source of the document's content.
+        dpi (int): Resolution of scanned pages.
+    """
+    organization, document_type, folder = rng.choice(TOPICS)
+    pdf = _PdfBuilder()
+    catalog = pdf.add(b'')
+    pages_number = pdf.add(b'')
+    font = pdf.add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    kids = []
+    for page in range(1, pages + 1):
+        lines = _page_lines(rng, organization, document_type, page)
+        scanned = kind == 'scanned' or (kind == 'mixed' and page % 2 == 0)
+        if scanned:
+            jpeg, width, height = _scanned_image(lines, dpi)
+            image = pdf.add_stream(
+                b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+                b'/BitsPerComponent 8 /Filter /DCTDecode' % (width, height), jpeg)
+            contents = pdf.add_stream(b'', b'q %d 0 0 %d 0 0 cm /Im1 Do Q' % (_PAGE_WIDTH, _PAGE_HEIGHT))
+            resources = b'<< /XObject << /Im1 %d 0 R >> >>' % image
+        else:
+            contents = pdf.add_stream(b'', _text_stream(lines))
+            resources = b'<< /Font << /F1 %d 0 R >> >>' % font
+        kids.append(pdf.add(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>'
+            % (pages_number, _PAGE_WIDTH, _PAGE_HEIGHT, resources, contents)))
+
+    pdf.set(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % pages_number)
+    pdf.set(pages_number, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+            % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)))
+    pdf.write(path)
+    return folder
+
+
+def generate(folder: str, kind: str, docs: int, pages: int, seed: int = 0, dpi: int = 150) -> list[str]:
+    """Write a corpus of synthetic PDFs into a folder.
+
+    Args:
+        folder (str): Where to write the PDFs.
+        kind (str): 'text', 'scanned', 'mixed' or 'all' to cycle through the three.
+        docs (int): Number of documents.
+        pages (int): Pages per document.
+        seed (int): Seed, so the same arguments give the same corpus.
+        dpi (int): Resolution of scanned pages.
+
+    Returns:
+        list[str]: Paths of the generated PDFs.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        doc_kind = KINDS[i % len(KINDS)] if kind == 'all' else kind
+        path = os.path.join(folder, f"{doc_kind}-{i:04d}.pdf")
+        write_pdf(path, doc_kind, pages, rng, dpi)
+        paths.append(path)
+    return paths
+
+
+def create_filing_tree(root: str, extra: int = 0):
+    """Create the folders the corpus files into, plus ``extra`` unrelated ones."""
+    for _, _, folder in TOPICS:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    for i in range(extra):
+        os.makedirs(os.path.join(root, f"Archive/{i // 100:03d}/Folder {i:05d}"), exist_ok=True)
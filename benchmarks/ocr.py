@@ -0,0 +1,128 @@
+"""Benchmark the OCR preprocessing steps on synthetic phone-photo pages.
+
+Pages are drawn like a phone photo of a letter: colour, high resolution,
+slightly rotated, unevenly lit and noisy, with a few blank pages mixed in.
+Each page is run through ``_ocr_page`` with and without preprocessing::
+
+    python -m benchmarks.ocr --pages 10 --megapixels 12
+
+When Tesseract is installed the OCR time and the fraction of the page's
+words recovered are reported for both. Without it only the preprocessing
+itself is timed, with the pixel count it leaves for Tesseract.
+"""
+import os
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+from benchmarks import corpus
+from benchmarks.run import _stats
+from ai_filer.providers.preprocess import STEPS, preprocess
+
+
+def _photo(path: str, lines: list[str], megapixels: float, rng: random.Random):
+    """Draw page lines as a colour phone photo and save it as a PNG."""
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    # Letter proportions
+    height = int((megapixels * 1e6 * 792 / 612) ** 0.5)
+    width = int(height * 612 / 792)
+    scale = width / 612
+    page = Image.new('RGB', (width, height), (246, 241, 228))
+    draw = ImageDraw.Draw(page)
+    try:
+        font = ImageFont.load_default(size=int(11 * scale))
+    except TypeError:
+        font = ImageFont.load_default()
+    y = 42 * scale
+    for line in lines:
+        draw.text((54 * scale, y), line, fill=(30, 30, 60), font=font)
+        y += 14 * scale
+
+    # A shadow falling across the page, and sensor noise
+    shade = Image.linear_gradient('L').resize((width, height)).point(lambda level: 255 - level // 4)
+    page = Image.composite(page, Image.new('RGB', page.size, (0, 0, 0)), shade)
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    page = Image.blend(page, noise, 0.08).filter(ImageFilter.GaussianBlur(0.8))
+    page.rotate(rng.uniform(-3, 3), resample=Image.Resampling.BICUBIC, expand=True,
+                fillcolor=(170, 160, 150)).save(path)
+
+
+def _words(text: str) -> set[str]:
+    return {word.lower().strip('.,-') for word in text.split() if len(word) > 2}
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='benchmarks.ocr', description='Benchmark OCR preprocessing.')
+    parser.add_argument('--pages', type=int, default=6, help='number of pages with text')
+    parser.add_argument('--blank', type=int, default=2, help='number of blank pages')
+    parser.add_argument('--megapixels', type=float, default=12.0, help='size of each photo')
+    parser.add_argument('--steps', default=','.join(STEPS), help='preprocessing steps to benchmark')
+    parser.add_argument('--max-pixels', type=int, default=3500, help='longer side after downscaling')
+    parser.add_argument('--blank-ink', type=float, default=0.002, help='ink fraction below which a page is blank')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    from PIL import Image
+    from ai_filer.providers.ocr import _ocr_page
+    from ai_filer.providers.preprocess import parse_steps
+
+    args = parse_args(argv)
+    steps = parse_steps(args.steps)
+    tesseract = shutil.which('tesseract') is not None
+    rng = random.Random(args.seed)
+    samples = {'preprocess': [], 'ocr_raw': [], 'ocr_preprocessed': []}
+    pixels = {'raw': 0, 'preprocessed': 0}
+    recall = {'raw': [], 'preprocessed': []}
+    skipped = 0
+
+    with tempfile.TemporaryDirectory(prefix='ai_filer_bench_ocr_') as workdir:
+        pages = []
+        for number in range(args.pages + args.blank):
+            organization, document_type, _ = rng.choice(corpus.TOPICS)
+            lines = corpus._page_lines(rng, organization, document_type, number + 1) if number < args.pages else []
+            path = os.path.join(workdir, f"page{number}.png")
+            _photo(path, lines, args.megapixels, rng)
+            pages.append((path, lines))
+
+        for path, lines in pages:
+            with Image.open(path) as image:
+                image.load()
+                pixels['raw'] += image.width * image.height
+                start = time.perf_counter()
+                result = preprocess(image, steps, max_pixels=args.max_pixels, blank_ink=args.blank_ink)
+                samples['preprocess'].append(time.perf_counter() - start)
+            if result is None:
+                skipped += 1
+            else:
+                pixels['preprocessed'] += result.width * result.height
+
+            if not tesseract:
+                continue
+            expected = _words(' '.join(lines))
+            for name, options in (('raw', ()), ('preprocessed', (steps, args.max_pixels, args.blank_ink))):
+                start = time.perf_counter()
+                text = _ocr_page(path, *options)
+                samples[f"ocr_{name}"].append(time.perf_counter() - start)
+                if expected:
+                    recall[name].append(len(expected & _words(text)) / len(expected))
+
+    results = {
+        'parameters': vars(args),
+        'tesseract': tesseract,
+        'blank_pages_skipped': skipped,
+        'megapixels': {name: round(value / 1e6, 1) for name, value in pixels.items()},
+        'timings': {name: _stats(values) for name, values in samples.items()},
+    }
+    if tesseract:
+        results['word_recall'] = {name: round(sum(values) / len(values), 3) if values else None
+                                  for name, values in recall.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Benchmark ai_filer against a synthetic corpus and a stub Ollama server.
+
+Measures, for a generated corpus:
+
+- per-stage latency of OCR (``OCR.extract_text_from_pdf``), the provider
+  calls (summarize, classify, generate filename) and the FileManager
+  operations (``get_tree_of_filing_system``, ``file_pdf``), each timed on
+  its own;
+- end-to-end throughput of a full ``ai_filer`` run over the corpus;
+- peak RSS of the process and of its worker processes;
+- the number of LLM calls the stub received, by kind.
+
+Results are printed (or written) as JSON, so runs can be compared::
+
+    python -m benchmarks.run --docs 20 --pages 5 --kind all --latency 0.05 --output before.json
+
+Everything runs in a temporary directory with ``HOME`` pointed at it, so
+the user's ``~/.config/aifiler`` is never read.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import platform
+import statistics
+import tempfile
+from benchmarks import corpus
+from benchmarks.stub_ollama import StubOllama
+
+
+def _stats(samples: list[float]) -> dict:
+    """Summarize latency samples in milliseconds."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'total_ms': round(sum(ordered) * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def _timed(samples: list[float], func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def _peak_rss_mb(who) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'tesseract': shutil.which('tesseract') is not None,
+        'pdftoppm': shutil.which('pdftoppm') is not None,
+    }
+
+
+def _configure(workdir: str, stub: StubOllama, args) -> tuple[str, str]:
+    """Point ai_filer at the benchmark folders and the stub through the environment."""
+    watch_folder = os.path.join(workdir, 'watch')
+    dest_folder = os.path.join(workdir, 'filed')
+    os.makedirs(watch_folder, exist_ok=True)
+    corpus.create_filing_tree(dest_folder, extra=args.extra_folders)
+    os.environ.update({
+        'HOME': workdir,
+        'WATCH_FOLDER': watch_folder,
+        'DEST_FOLDER': dest_folder,
+        'MODEL': 'stub',
+        'OLLAMA_HOST': stub.url,
+        'CACHE_ENABLED': str(args.cache).lower(),
+        'COMBINED_MODE': str(args.combined).lower(),
+        'RUNNER': args.runner,
+    })
+    os.environ.pop('TESTING', None)
+    return watch_folder, dest_folder
+
+
+def bench_stages(workdir: str, stub: StubOllama, paths: list[str]) -> dict:
+    """Time each stage on its own, one document at a time."""
+    from ai_filer.main import get_config_from_file_or_env
+    from ai_filer.file_manager import FileManager
+    from ai_filer.providers.ocr import OCR
+    from ai_filer.providers.ollama_provider import OllamaProvider
+
+    config = get_config_from_file_or_env()
+    ocr = OCR(config)
+    provider = OllamaProvider(config)
+    file_manager = FileManager(config)
+    samples = {name: [] for name in ('ocr', 'summarize', 'classify', 'generate_filename', 'tree', 'file_pdf')}
+    text_chars = 0
+    stub.reset()
+
+    try:
+        tree = _timed(samples['tree'], file_manager.get_tree_of_filing_system, config['dest_folder'])
+        # A second call measures the warm path, with the index already on disk
+        _timed(samples['tree'], file_manager.get_tree_of_filing_system, config['dest_folder'])
+
+        staging = os.path.join(workdir, 'staging')
+        os.makedirs(staging, exist_ok=True)
+        for path in paths:
+            text = _timed(samples['ocr'], ocr.extract_text_from_pdf, path)
+            text_chars += len(text)
+            summary = _timed(samples['summarize'], provider.summarize_text, text or 'empty document')
+            category = _timed(samples['classify'], provider.classify_document, summary, tree)
+            filename = _timed(samples['generate_filename'], provider.generate_filename, text or summary)
+
+            # file_pdf removes its input, so file a copy
+            copy = shutil.copy(path, staging)
+            metadata = {'Summary': summary, 'Category': category, 'OCRText': text}
+            _timed(samples['file_pdf'], file_manager.file_pdf, copy, filename, category, metadata)
+    finally:
+        provider.close()
+        file_manager.close()
+
+    return {
+        'stages': {name: _stats(values) for name, values in samples.items()},
+        'text_chars': text_chars,
+        'llm_calls': dict(stub.calls),
+    }
+
+
+def bench_end_to_end(watch_folder: str, stub: StubOllama, paths: list[str]) -> dict:
+    """File the whole corpus with a normal ai_filer run."""
+    from ai_filer.main import main
+    from ai_filer.metrics import METRICS
+
+    for path in paths:
+        shutil.copy(path, watch_folder)
+    stub.reset()
+    start = time.perf_counter()
+    main([])
+    elapsed = time.perf_counter() - start
+    remaining = len([f for f in os.listdir(watch_folder) if f.endswith('.pdf')])
+    return {
+        'seconds': round(elapsed, 3),
+        'docs_per_second': round(len(paths) / elapsed, 3) if elapsed else None,
+        'filed': len(paths) - remaining,
+        'llm_calls': dict(stub.calls),
+        'llm_prompt_chars': stub.prompt_chars,
+        # What ai_filer itself exported for the run
+        'metrics': METRICS.summary(),
+    }
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='benchmarks.run', description='Benchmark ai_filer on a synthetic corpus.')
+    parser.add_argument('--docs', type=int, default=10, help='number of documents')
+    parser.add_argument('--pages', type=int, default=3, help='pages per document')
+    parser.add_argument('--kind', choices=corpus.KINDS + ('all',), default='all', help='kind of PDFs to generate')
+    parser.add_argument('--dpi', type=int, default=150, help='resolution of scanned pages')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed')
+    parser.add_argument('--extra-folders', type=int, default=0,
+                        help='unrelated folders to add to the filing system, to benchmark large trees')
+    parser.add_argument('--latency', type=float, default=0.0, help='stub LLM latency per call, in seconds')
+    parser.add_argument('--per-char', type=float, default=0.0, help='extra stub latency per prompt character')
+    parser.add_argument('--runner', choices=('pipeline', 'async'), default='pipeline')
+    parser.add_argument('--cache', action='store_true', help='enable the result cache')
+    parser.add_argument('--combined', action='store_true', help='use combined mode (one LLM call per document)')
+    parser.add_argument('--skip-stages', action='store_true', help='only run the end-to-end benchmark')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--keep', action='store_true', help="don't delete the working directory")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='ai_filer_bench_')
+    stub = StubOllama(latency=args.latency, per_char=args.per_char).start()
+    home = os.environ.get('HOME')
+    try:
+        watch_folder, _ = _configure(workdir, stub, args)
+        start = time.perf_counter()
+        paths = corpus.generate(os.path.join(workdir, 'corpus'), args.kind, args.docs, args.pages,
+                                seed=args.seed, dpi=args.dpi)
+        corpus_seconds = time.perf_counter() - start
+
+        results = {
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+            'environment': _environment(),
+            'corpus': {
+                'seconds': round(corpus_seconds, 3),
+                'bytes': sum(os.path.getsize(path) for path in paths),
+            },
+        }
+        if not args.skip_stages:
+            results['isolated'] = bench_stages(workdir, stub, paths)
+        results['end_to_end'] = bench_end_to_end(watch_folder, stub, paths)
+        results['peak_rss_mb'] = {
+            'self': _peak_rss_mb(resource.RUSAGE_SELF),
+            'children': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    finally:
+        stub.stop()
+        if home is not None:
+            os.environ['HOME'] = home
+        if args.keep:
+            print(f"Working directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
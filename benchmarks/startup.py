@@ -0,0 +1,89 @@
+"""Startup-time budget for ``python -m ai_filer`` when there is nothing to file.
+
+Under cron most runs find an empty watch folder, so their whole cost is
+interpreter startup and imports. This runs ``python -m ai_filer`` a few
+times against an empty watch folder and fails when the median wall time
+exceeds the budget::
+
+    python -m benchmarks.startup --budget 0.5
+
+The slowest imports of one extra ``-X importtime`` run are reported too,
+to show what to make lazy when the budget is exceeded.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+
+def _environment(workdir: str) -> dict:
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    env.update({
+        'HOME': workdir,
+        'WATCH_FOLDER': os.path.join(workdir, 'watch'),
+        'DEST_FOLDER': os.path.join(workdir, 'filed'),
+        'PYTHONPATH': os.pathsep.join(filter(None, [src, env.get('PYTHONPATH')])),
+    })
+    env.pop('TESTING', None)
+    return env
+
+
+def _slowest_imports(env: dict, count: int) -> list[dict]:
+    """Return the modules that took longest to import themselves, excluding their imports, in milliseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'ai_filer'], env=env,
+                            capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append({'module': name.strip(), 'ms': round(int(own) / 1000, 1),
+                        'cumulative_ms': round(int(cumulative) / 1000, 1)})
+    return sorted(imports, key=lambda entry: -entry['ms'])[:count]
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='benchmarks.startup',
+                                     description='Check the startup time of an ai_filer run with no work to do.')
+    parser.add_argument('--runs', type=int, default=5, help='number of timed runs')
+    parser.add_argument('--budget', type=float, default=0.5, help='maximum median wall time, in seconds')
+    parser.add_argument('--imports', type=int, default=10, help='number of slowest imports to report')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix='ai_filer_startup_') as workdir:
+        env = _environment(workdir)
+        os.makedirs(env['WATCH_FOLDER'])
+        os.makedirs(env['DEST_FOLDER'])
+
+        # Untimed first run, so every timed run sees warm file system caches and bytecode
+        subprocess.run([sys.executable, '-m', 'ai_filer'], env=env, capture_output=True, check=True)
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'ai_filer'], env=env, capture_output=True, check=True)
+            samples.append(time.perf_counter() - start)
+        slowest = _slowest_imports(env, args.imports)
+
+    median = statistics.median(samples)
+    print(json.dumps({
+        'budget_seconds': args.budget,
+        'median_seconds': round(median, 4),
+        'min_seconds': round(min(samples), 4),
+        'max_seconds': round(max(samples), 4),
+        'slowest_imports': slowest,
+    }, indent=2))
+    if median > args.budget:
+        print(f"Startup took {median:.3f}s, over the {args.budget:.3f}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Local stand-in for an Ollama server.
+
+Speaks enough of the ``/api/generate`` protocol for ai_filer: plain and
+streamed responses, and JSON responses when a ``format`` schema is sent.
+Every request waits ``latency`` seconds before answering (plus
+``per_char`` seconds per prompt character, to mimic prefill), and calls
+are counted per kind of prompt.
+
+Run on its own with ``python -m benchmarks.stub_ollama --port 11434``.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY = "This is a bill from Thames Water. It shows the water charges for the last quarter."
+FILENAME = "Thames Water Bill Q1"
+TEXT = "Thames Water\nWater bill\nCharges for the quarter: 112.40"
+
+
+def _prompt_kind(prompt: str, schema) -> str:
+    if schema:
+        return 'analyze'
+    if 'extract all the text content' in prompt:
+        return 'extract'
+    if 'document naming assistant' in prompt:
+        return 'filename'
+    if 'document classification' in prompt:
+        return 'classify'
+    if 'one part of a longer document' in prompt:
+        return 'summarize_chunk'
+    if 'notes written about consecutive parts' in prompt:
+        return 'summarize_reduce'
+    return 'summarize'
+
+
+def _first_directory(prompt: str) -> str:
+    match = re.search(r'Available Directories:\**\n"([^"]+)"', prompt)
+    return match.group(1) if match else 'Unsorted'
+
+
+def _response(kind: str, prompt: str) -> str:
+    """Canned answer to a prompt of the given kind."""
+    if kind == 'analyze':
+        return json.dumps({'summary': SUMMARY, 'category': _first_directory(prompt), 'filename': FILENAME})
+    if kind == 'classify':
+        return _first_directory(prompt)
+    if kind == 'filename':
+        return FILENAME
+    if kind == 'extract':
+        return TEXT
+    return SUMMARY
+
+
+class StubOllama:
+    """Threaded HTTP server answering Ollama generate requests."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, per_char: float = 0.0):
+        """Initialize the server. Port 0 picks a free port."""
+        self.latency = latency
+        self.per_char = per_char
+        self.calls = Counter()
+        self.prompt_chars = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are separate writes; with Nagle on, delayed ACKs add ~40 ms per call
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path != '/api/generate':
+                    self._send(404, {'error': 'not found'})
+                    return
+                self._send(200, stub.generate(body), stream=body.get('stream', True))
+
+            def _send(self, status: int, payload, stream: bool = False):
+                if stream and status == 200:
+                    # NDJSON, word by word, then a final done message
+                    words = payload['response'].split(' ')
+                    lines = [{'model': payload['model'], 'response': word + (' ' if i < len(words) - 1 else ''),
+                              'done': False} for i, word in enumerate(words)]
+                    lines.append({**payload, 'response': ''})
+                    data = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+                    content_type = 'application/x-ndjson'
+                else:
+                    data = json.dumps(payload).encode()
+                    content_type = 'application/json'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def generate(self, request: dict) -> dict:
+        """Build the response to one generate request."""
+        prompt = request.get('prompt', '')
+        schema = request.get('format')
+        kind = _prompt_kind(prompt, schema)
+        with self.lock:
+            self.calls[kind] += 1
+            self.prompt_chars += len(prompt)
+        time.sleep(self.latency + self.per_char * len(prompt))
+
+        response = _response(kind, prompt)
+        return {
+            'model': request.get('model', 'stub'),
+            'created_at': '2024-01-01T00:00:00Z',
+            'response': response,
+            'done': True,
+            'done_reason': 'stop',
+            'prompt_eval_count': len(prompt) // 4,
+            'eval_count': len(response) // 4,
+        }
+
+    def reset(self):
+        """Clear the call counters."""
+        with self.lock:
+            self.calls.clear()
+            self.prompt_chars = 0
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-ollama', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub Ollama server for benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--per-char', type=float, default=0.0, help='extra seconds per prompt character')
+    args = parser.parse_args()
+    stub = StubOllama(args.host, args.port, args.latency, args.per_char)
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
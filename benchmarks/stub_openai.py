@@ -0,0 +1,257 @@
+"""Local stand-in for the OpenAI files, batches and chat completions endpoints.
+
+Speaks enough of the API for ai_filer's batch runner: files are uploaded,
+read back and deleted, and a batch created from a JSONL request file
+completes ``batch_latency`` seconds later with an output file of canned
+chat completions (see ``stub_ollama``). Requests whose prompt contains
+``fail_marker`` fail, so partial failures can be tried out. Online chat
+completions are answered too. Calls are counted per kind of prompt.
+
+Run on its own with ``python -m benchmarks.stub_openai --port 8080`` and
+point ai_filer at it with ``OPENAI_BASE_URL=http://127.0.0.1:8080/v1``.
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.stub_ollama import _prompt_kind, _response
+
+
+def _prompt(body: dict) -> str:
+    """Text of the user message of a chat completion request, without any attached files."""
+    content = body['messages'][-1]['content']
+    if isinstance(content, str):
+        return content
+    return '\n'.join(part.get('text', '') for part in content if part.get('type') == 'text')
+
+
+def _completion(body: dict, prompt: str) -> dict:
+    text = _response(_prompt_kind(prompt, body.get('response_format')), prompt)
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'stub'),
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': text}}],
+        'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(text) // 4,
+                  'total_tokens': (len(prompt) + len(text)) // 4},
+    }
+
+
+class StubOpenAI:
+    """Threaded HTTP server answering OpenAI file, batch and chat completion requests."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, batch_latency: float = 0.0,
+                 fail_marker: str = None):
+        """Initialize the server. Port 0 picks a free port."""
+        self.batch_latency = batch_latency
+        self.fail_marker = fail_marker
+        self.calls = Counter()
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content':
+                    self._send_file(parts[2])
+                elif parts[:2] == ['v1', 'batches'] and len(parts) == 3:
+                    self._send(*stub.get_batch(parts[2]))
+                else:
+                    self._send(404, {'error': {'message': 'not found'}})
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                parts = self.path.strip('/').split('/')
+                if parts == ['v1', 'files']:
+                    self._send(*stub.upload(self.headers['Content-Type'], data))
+                elif parts == ['v1', 'batches']:
+                    self._send(*stub.create_batch(json.loads(data)))
+                elif parts[:2] == ['v1', 'batches'] and len(parts) == 4 and parts[3] == 'cancel':
+                    self._send(*stub.cancel_batch(parts[2]))
+                elif parts == ['v1', 'chat', 'completions']:
+                    body = json.loads(data)
+                    prompt = _prompt(body)
+                    with stub.lock:
+                        stub.calls[_prompt_kind(prompt, body.get('response_format'))] += 1
+                    self._send(200, _completion(body, prompt))
+                else:
+                    self._send(404, {'error': {'message': 'not found'}})
+
+            def do_DELETE(self):
+                parts = self.path.strip('/').split('/')
+                if parts[:2] == ['v1', 'files'] and len(parts) == 3:
+                    with stub.lock:
+                        found = stub.files.pop(parts[2], None) is not None
+                    self._send(200 if found else 404, {'id': parts[2], 'object': 'file', 'deleted': found})
+                else:
+                    self._send(404, {'error': {'message': 'not found'}})
+
+            def _send_file(self, file_id: str):
+                with stub.lock:
+                    file = stub.files.get(file_id)
+                if file is None:
+                    self._send(404, {'error': {'message': f"No such file: {file_id}"}})
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(file['data'])))
+                self.end_headers()
+                self.wfile.write(file['data'])
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _add_file(self, filename: str, purpose: str, data: bytes) -> dict:
+        file = {'id': f"file-{uuid.uuid4().hex[:12]}", 'object': 'file', 'bytes': len(data),
+                'created_at': int(time.time()), 'filename': filename, 'purpose': purpose, 'status': 'processed'}
+        with self.lock:
+            self.files[file['id']] = {**file, 'data': data}
+        return file
+
+    def upload(self, content_type: str, data: bytes) -> tuple[int, dict]:
+        """Store a file sent as multipart form data."""
+        message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + data)
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        if 'file' not in fields:
+            return 400, {'error': {'message': 'file is required'}}
+        filename, content = fields['file']
+        purpose = fields.get('purpose', (None, b''))[1].decode()
+        return 200, self._add_file(filename or 'upload', purpose, content)
+
+    def create_batch(self, body: dict) -> tuple[int, dict]:
+        """Create a batch job from an uploaded JSONL request file."""
+        with self.lock:
+            file = self.files.get(body.get('input_file_id'))
+        if file is None:
+            return 400, {'error': {'message': f"No such file: {body.get('input_file_id')}"}}
+        batch = {
+            'id': f"batch_{uuid.uuid4().hex[:12]}", 'object': 'batch', 'endpoint': body['endpoint'],
+            'input_file_id': file['id'], 'completion_window': body['completion_window'],
+            'created_at': int(time.time()), 'status': 'in_progress', 'output_file_id': None,
+            'error_file_id': None, 'errors': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        }
+        requests = [json.loads(line) for line in file['data'].decode().splitlines() if line.strip()]
+        batch['request_counts']['total'] = len(requests)
+        with self.lock:
+            self.batches[batch['id']] = {'batch': batch, 'requests': requests, 'created': time.time(),
+                                         'done_at': time.time() + self.batch_latency}
+        return 200, batch
+
+    def get_batch(self, batch_id: str) -> tuple[int, dict]:
+        """Return a batch job, finishing it once its latency has passed."""
+        with self.lock:
+            job = self.batches.get(batch_id)
+        if job is None:
+            return 404, {'error': {'message': f"No such batch: {batch_id}"}}
+        if job['batch']['status'] == 'in_progress' and time.time() >= job['done_at']:
+            self._finish(job, 'completed')
+        elif job['batch']['status'] == 'cancelling':
+            self._finish(job, 'cancelled')
+        return 200, job['batch']
+
+    def cancel_batch(self, batch_id: str) -> tuple[int, dict]:
+        """Cancel a batch job. It stops on the next poll, with the share of its requests it had run by now."""
+        with self.lock:
+            job = self.batches.get(batch_id)
+        if job is None:
+            return 404, {'error': {'message': f"No such batch: {batch_id}"}}
+        if job['batch']['status'] == 'in_progress':
+            elapsed = time.time() - job['created']
+            share = min(1.0, elapsed / self.batch_latency) if self.batch_latency else 1.0
+            job['requests'] = job['requests'][:int(len(job['requests']) * share)]
+            job['batch']['status'] = 'cancelling'
+        return 200, job['batch']
+
+    def _finish(self, job: dict, status: str):
+        output, errors = [], []
+        for request in job['requests']:
+            prompt = _prompt(request['body'])
+            kind = _prompt_kind(prompt, request['body'].get('response_format'))
+            with self.lock:
+                self.calls[f"batch_{kind}"] += 1
+            if self.fail_marker and self.fail_marker in prompt:
+                errors.append({'id': f"batch_req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id'],
+                               'response': {'status_code': 400, 'body': {'error': {'message': 'stub failure'}}},
+                               'error': None})
+                continue
+            output.append({'id': f"batch_req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id'],
+                           'response': {'status_code': 200, 'body': _completion(request['body'], prompt)},
+                           'error': None})
+
+        batch = job['batch']
+        for key, lines in (('output_file_id', output), ('error_file_id', errors)):
+            if lines:
+                data = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+                batch[key] = self._add_file(f"{batch['id']}_{key}.jsonl", 'batch_output', data)['id']
+        batch['request_counts'] = {'total': len(output) + len(errors), 'completed': len(output),
+                                   'failed': len(errors)}
+        batch['status'] = status
+        batch[f"{status}_at"] = int(time.time())
+
+    def reset(self):
+        """Clear the call counters."""
+        with self.lock:
+            self.calls.clear()
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-openai', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub OpenAI server for benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--batch-latency', type=float, default=0.0, help='seconds before a batch completes')
+    parser.add_argument('--fail-marker', help='fail the batch requests whose prompt contains this text')
+    args = parser.parse_args()
+    stub = StubOpenAI(args.host, args.port, args.batch_latency, args.fail_marker)
+    print(f"Stub OpenAI listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
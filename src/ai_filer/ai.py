@@ -1,7 +1,44 @@
+import os
+import json
+import asyncio
+from loguru import logger
 from ai_filer.types import Config
-from ai_filer.providers.openai_provider import OpenAIProvider
-from ai_filer.providers.gemini_provider import GeminiProvider
-from ai_filer.providers.ollama_provider import OllamaProvider
+from ai_filer.cache import ResultCache, sha256_file, sha256_text, prompt_hash
+from ai_filer.metrics import METRICS
+from ai_filer.shortlist import Shortlister
+from ai_filer.classifier import FastClassifier
+from ai_filer.providers.registry import get_provider_class
+
+# Prompt templates each stage depends on; editing one invalidates that stage's cached results
+STAGE_PROMPTS = {
+    'extract': ['perform_ocr.txt'],
+    'summarize': ['summarize.txt', 'summarize_local.txt', 'summarize_chunk.txt', 'summarize_reduce.txt'],
+    'classify': ['classify.txt'],
+    'filename': ['describe.txt'],
+    'analyze': ['analyze.txt'],
+}
+
+
+def text_budget(config: Config) -> int:
+    """Return how many characters of a document's text the LLM calls read, or 0 for all of it.
+
+    ``text_budget_tokens`` is converted with the same four characters per
+    token the rate limiter estimates with; when both are set the smaller wins.
+    """
+    budgets = [config['text_budget_chars'], config['text_budget_tokens'] * 4]
+    return min((budget for budget in budgets if budget > 0), default=0)
+
+
+def _complete_analysis(result: dict) -> str | None:
+    """The combined analysis as JSON to cache, or None when a field is missing.
+
+    A missing field means the call failed or gave something invalid, which
+    may not happen again, so only complete analyses are cached.
+    """
+    if all(result.get(field) for field in ('summary', 'category', 'filename')):
+        return json.dumps(result)
+    return None
+
 
 class AI:
     """Class to handle all AI/LLM interactions."""
@@ -10,27 +47,247 @@ class AI:
         """Initialize the AI with the specified model."""
         self.config = config
 
-        # Initialize the appropriate provider
-        if self.config['model'] == 'openai':
-            self.provider = OpenAIProvider(config)
-        elif self.config['model'] == 'gemini':
-            self.provider = GeminiProvider(config)
-        else:
-            # Assume it's an Ollama model
-            self.provider = OllamaProvider(config)
+        # Initialize the appropriate provider; only its module and SDK are imported
+        self.provider = get_provider_class(self.config['model'])(config)
+        # Only providers that extract page by page can stop at the budget
+        self.text_budget = text_budget(config) if self.provider.extracts_pages else 0
+
+        self.cache = None
+        if self.config['cache_enabled']:
+            self.cache = ResultCache(
+                os.path.join(config['watch_folder'], '.ai_filer', 'cache.sqlite'),
+                max_entries=config['cache_max_entries'],
+                max_age_days=config['cache_max_age_days'])
+        # Also reads every prompt template into the process-wide prompt cache up front
+        self.prompt_hashes = {stage: prompt_hash(*names) for stage, names in STAGE_PROMPTS.items()}
+        # Narrows large filing trees down to likely directories before classification
+        self.shortlist = Shortlister(os.path.join(config['watch_folder'], '.ai_filer', 'history.jsonl'),
+                                     config['shortlist_size'])
+        # Files routine documents like the ones filed before without an LLM call
+        self.fast_classifier = FastClassifier(os.path.join(config['watch_folder'], '.ai_filer', 'classifier.json'),
+                                              config['fast_classify_threshold'])
+
+    def _sub_keys(self, stage: str, content_hash: str) -> tuple:
+        return content_hash, stage, self.provider.name, self.provider.model, self.prompt_hashes[stage]
+
+    def cached(self, stage: str, content_hash: str) -> str:
+        """Return the cached result of a stage, or None.
+
+        Args:
+            stage (str): The pipeline stage name.
+            content_hash (str): Hash of the stage input.
+        """
+        if not self.cache:
+            return None
+        value = self.cache.get(ResultCache.make_key(*self._sub_keys(stage, content_hash)))
+        METRICS.inc('ai_filer_cache_requests_total', stage=stage, result='miss' if value is None else 'hit')
+        if value is not None:
+            logger.debug(f"Using cached {stage} result")
+        return value
+
+    def remember(self, stage: str, content_hash: str, value: str):
+        """Cache the result of a stage. Failed or empty results are not cached, so they are retried next time."""
+        if self.cache and value:
+            sub_keys = self._sub_keys(stage, content_hash)
+            self.cache.set(ResultCache.make_key(*sub_keys), value, *sub_keys)
+
+    def _cached(self, stage: str, content_hash: str, compute):
+        """Return the cached result of a stage, or compute and store it.
+
+        Args:
+            stage (str): The pipeline stage name.
+            content_hash (str): Hash of the stage input.
+            compute: Callable producing the result on a cache miss.
+        """
+        if not self.cache:
+            return compute()
+
+        value = self.cached(stage, content_hash)
+        if value is None:
+            value = compute()
+            self.remember(stage, content_hash, value)
+        return value
+
+    async def _acached(self, stage: str, content_hash: str, compute):
+        """Async variant of _cached. ``compute`` returns an awaitable."""
+        if not self.cache:
+            return await compute()
+
+        value = await asyncio.to_thread(self.cached, stage, content_hash)
+        if value is None:
+            value = await compute()
+            await asyncio.to_thread(self.remember, stage, content_hash, value)
+        return value
 
     def summarize_document(self, text: str = None, pdf_file: str = None) -> str:
         """Summarize a document's content."""
-        return self.provider.summarize_document(text=text, pdf_file=pdf_file)
+        content_hash = sha256_file(pdf_file) if pdf_file else sha256_text(text or '')
+        return self._cached('summarize', content_hash,
+                            lambda: self.provider.summarize_document(text=text, pdf_file=pdf_file))
 
     def extract_text_from_pdf(self, pdf_file: str) -> str:
         """Extract text from a PDF file."""
-        return self.provider.extract_text_from_pdf(pdf_file)
+        return self._cached('extract', sha256_file(pdf_file),
+                            lambda: self.provider.extract_text_from_pdf(pdf_file))
+
+    def extract_leading_text(self, pdf_file: str) -> str:
+        """Extract the text the LLM calls need: the first pages of a PDF, up to the text budget.
 
-    def classify_document(self, summary: str, tree: list[str]) -> str:
-        """Classify a document based on its summary."""
-        return self.provider.classify_document(summary, tree)
+        Without a budget, or with a provider that reads whole PDFs, this is
+        the text of the whole document.
+        """
+        if not self.text_budget:
+            return self.extract_text_from_pdf(pdf_file)
+        content_hash = sha256_text(sha256_file(pdf_file), f"first {self.text_budget} chars")
+        return self._cached('extract', content_hash,
+                            lambda: self.provider.extract_text_from_pdf(pdf_file, self.text_budget))
+
+    def is_partial_text(self, text: str) -> bool:
+        """Return whether text from extract_leading_text was cut off at the budget, so more pages may follow."""
+        return bool(self.text_budget) and len(text or '') >= self.text_budget
+
+    def classify_document(self, summary: str, tree) -> str:
+        """Classify a document based on its summary.
+
+        Summaries close to documents filed before are classified locally;
+        only the rest go to the LLM.
+        """
+        category = self.fast_classifier.predict(summary, tree)
+        if category:
+            return category
+        return self._cached('classify', sha256_text(summary, str(tree)),
+                            lambda: self.provider.classify_document(
+                                summary, self.shortlist.candidates(summary, tree)))
 
     def generate_filename(self, text: str) -> str:
         """Generate a descriptive filename for a document."""
-        return self.provider.generate_filename(text)
+        return self._cached('filename', sha256_text(text),
+                            lambda: self.provider.generate_filename(text))
+
+    def analyze_document(self, text: str, pdf_file: str, tree) -> tuple[str, str, str]:
+        """Summarize, classify and name a document, using one combined LLM call where possible.
+
+        Only the fields the combined call fails to produce, or that fail
+        validation, fall back to the individual per-step calls. Text too long
+        for a single prompt goes straight to the per-step calls, which
+        summarize it in chunks.
+
+        Returns:
+            tuple[str, str, str]: The summary, category and filename.
+        """
+        result = {'summary': None, 'category': None, 'filename': None}
+        if text and len(self.provider.split_text(text)) == 1:
+            fresh = {}
+
+            def analyze():
+                fresh.update(self.provider.analyze_document(text, self.shortlist.candidates(text, tree)))
+                return _complete_analysis(fresh)
+
+            cached = self._cached('analyze', sha256_text(text, str(tree)), analyze)
+            result = json.loads(cached) if cached else {**result, **fresh}
+
+        summary = result['summary']
+        if not summary:
+            logger.info("Combined analysis gave no summary, summarizing separately")
+            summary = self.summarize_document(text=text, pdf_file=pdf_file)
+
+        category = result['category']
+        if not category:
+            logger.info("Combined analysis gave no valid category, classifying separately")
+            category = self.classify_document(summary, tree)
+
+        filename = result['filename']
+        if not filename:
+            logger.info("Combined analysis gave no filename, generating it separately")
+            filename = self.generate_filename(summary)
+
+        return summary, category, filename
+
+    async def asummarize_document(self, text: str = None, pdf_file: str = None) -> str:
+        """Summarize a document's content asynchronously."""
+        if pdf_file:
+            content_hash = await asyncio.to_thread(sha256_file, pdf_file)
+        else:
+            content_hash = sha256_text(text or '')
+        return await self._acached('summarize', content_hash,
+                                   lambda: self.provider.asummarize_document(text=text, pdf_file=pdf_file))
+
+    async def aextract_text_from_pdf(self, pdf_file: str) -> str:
+        """Extract text from a PDF file asynchronously."""
+        content_hash = await asyncio.to_thread(sha256_file, pdf_file)
+        return await self._acached('extract', content_hash,
+                                   lambda: self.provider.aextract_text_from_pdf(pdf_file))
+
+    async def aextract_leading_text(self, pdf_file: str) -> str:
+        """Extract the first pages of a PDF asynchronously. See extract_leading_text."""
+        if not self.text_budget:
+            return await self.aextract_text_from_pdf(pdf_file)
+        content_hash = sha256_text(await asyncio.to_thread(sha256_file, pdf_file), f"first {self.text_budget} chars")
+        return await self._acached('extract', content_hash,
+                                   lambda: self.provider.aextract_text_from_pdf(pdf_file, self.text_budget))
+
+    async def aclassify_document(self, summary: str, tree) -> str:
+        """Classify a document based on its summary asynchronously. See classify_document."""
+        category = await asyncio.to_thread(self.fast_classifier.predict, summary, tree)
+        if category:
+            return category
+
+        async def classify():
+            candidates = await asyncio.to_thread(self.shortlist.candidates, summary, tree)
+            return await self.provider.aclassify_document(summary, candidates)
+
+        return await self._acached('classify', sha256_text(summary, str(tree)), classify)
+
+    async def agenerate_filename(self, text: str) -> str:
+        """Generate a descriptive filename for a document asynchronously."""
+        return await self._acached('filename', sha256_text(text),
+                                   lambda: self.provider.agenerate_filename(text))
+
+    async def aanalyze_document(self, text: str, pdf_file: str, tree) -> tuple[str, str, str]:
+        """Async variant of analyze_document."""
+        result = {'summary': None, 'category': None, 'filename': None}
+        if text and len(self.provider.split_text(text)) == 1:
+            fresh = {}
+
+            async def analyze():
+                candidates = await asyncio.to_thread(self.shortlist.candidates, text, tree)
+                fresh.update(await self.provider.aanalyze_document(text, candidates))
+                return _complete_analysis(fresh)
+
+            cached = await self._acached('analyze', sha256_text(text, str(tree)), analyze)
+            result = json.loads(cached) if cached else {**result, **fresh}
+
+        summary = result['summary']
+        if not summary:
+            logger.info("Combined analysis gave no summary, summarizing separately")
+            summary = await self.asummarize_document(text=text, pdf_file=pdf_file)
+
+        category = result['category']
+        if not category:
+            logger.info("Combined analysis gave no valid category, classifying separately")
+            category = await self.aclassify_document(summary, tree)
+
+        filename = result['filename']
+        if not filename:
+            logger.info("Combined analysis gave no filename, generating it separately")
+            filename = await self.agenerate_filename(summary)
+
+        return summary, category, filename
+
+    def set_ocr_executor(self, executor):
+        """Run CPU-bound local OCR in the given process pool."""
+        self.provider.set_ocr_executor(executor)
+
+    def record_filing(self, summary: str, category: str):
+        """Remember where a document was filed, to shortlist directories for similar ones."""
+        self.shortlist.record(summary, category)
+
+    def release_document(self, pdf_file: str):
+        """Delete any copy of a document uploaded to the provider."""
+        self.provider.release_file(pdf_file)
+
+    def close(self):
+        """Delete remaining uploads and close the result cache."""
+        self.provider.close()
+        if self.cache:
+            self.cache.close()
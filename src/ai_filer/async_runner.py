@@ -0,0 +1,133 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from .ai import AI
+from .file_manager import FileManager
+from .fulltext import FullTextBacklog
+from .jobs import JobQueue
+from .metrics import METRICS
+from .pipeline import file_document
+from .types import Config, Document
+
+
+class AsyncRunner:
+    """asyncio-based document runner.
+
+    All documents are processed as tasks on one event loop. LLM requests use
+    each provider's native async client and are limited by the provider's
+    rate limiter (at most ``llm_concurrency`` in flight), so hundreds of
+    requests to a remote provider can be in flight without a thread per
+    request. Local OCR still
+    runs in a process pool, and extraction and filing are limited by
+    ``extract_workers`` and ``finalize_workers``. With a job queue, documents
+    are claimed and resumed as in the threaded pipeline, and a text budget
+    works as it does there.
+    """
+
+    def __init__(self, config: Config, ai: AI, file_manager: FileManager, tree, jobs: JobQueue = None,
+                 fulltext: FullTextBacklog = None):
+        """Initialize the runner.
+
+        Args:
+            config (Config): The application config.
+            ai (AI): The AI used for extraction and LLM calls.
+            file_manager (FileManager): The file manager used to file documents.
+            tree: The filing system tree used for classification.
+            jobs (JobQueue): Optional job queue to claim documents from.
+            fulltext (FullTextBacklog): Optional backlog to record documents
+                filed with only their first pages' text in.
+        """
+        self.config = config
+        self.ai = ai
+        self.file_manager = file_manager
+        self.tree = tree
+        self.jobs = jobs
+        self.fulltext = fulltext
+
+    def run(self, pdf_files: list[str]):
+        """Process a batch of PDF files and wait for them to finish."""
+        asyncio.run(self.arun(pdf_files))
+
+    async def arun(self, pdf_files: list[str]):
+        """Process a batch of PDF files on the running event loop."""
+        self.extract_semaphore = asyncio.Semaphore(max(1, self.config['extract_workers']))
+        self.finalize_semaphore = asyncio.Semaphore(max(1, self.config['finalize_workers']))
+
+        with ProcessPoolExecutor(max_workers=self.config['ocr_workers']) as ocr_pool:
+            self.ai.set_ocr_executor(ocr_pool)
+            try:
+                await asyncio.gather(*(self._process(pdf_file) for pdf_file in pdf_files))
+            finally:
+                self.ai.set_ocr_executor(None)
+
+    async def _process(self, pdf_file: str):
+        """Process one document, logging rather than raising on failure."""
+        doc: Document = {'pdf_file': pdf_file}
+        if self.jobs:
+            doc = await asyncio.to_thread(self.jobs.claim, pdf_file)
+            if doc is None:
+                logger.debug(f"Skipping {os.path.basename(pdf_file)}: done, failed or claimed by another worker")
+                return
+        ok = False
+        # Reported under the same stage names as the threaded pipeline
+        stage = 'extract'
+        try:
+            if 'text' not in doc:
+                async with self.extract_semaphore:
+                    logger.info(f"Processing {os.path.basename(pdf_file)} with {self.config['model']}")
+                    with METRICS.timer('ai_filer_stage_seconds', stage=stage):
+                        doc['text'] = await self.ai.aextract_leading_text(pdf_file)
+                METRICS.inc('ai_filer_stage_documents_total', stage=stage, status='ok')
+                await self._checkpoint(doc, stage)
+
+            stage = 'llm'
+            if 'filename' not in doc:
+                await self._run_llm(doc)
+                if not doc['filename']:
+                    METRICS.inc('ai_filer_stage_documents_total', stage=stage, status='dropped')
+                    return
+                METRICS.inc('ai_filer_stage_documents_total', stage=stage, status='ok')
+                logger.info(f"Generated filename: {doc['filename']}")
+                await self._checkpoint(doc, stage)
+
+            stage = 'finalize'
+            async with self.finalize_semaphore:
+                with METRICS.timer('ai_filer_stage_seconds', stage=stage):
+                    # Adding metadata changes the file, so let go of its uploads first
+                    await asyncio.to_thread(self.ai.release_document, pdf_file)
+                    file_path = await asyncio.to_thread(file_document, self.file_manager, doc)
+                    await asyncio.to_thread(self.ai.record_filing, doc['summary'], doc['directory'])
+                    if self.fulltext and self.ai.is_partial_text(doc['text']):
+                        await asyncio.to_thread(self.fulltext.add, file_path)
+            METRICS.inc('ai_filer_stage_documents_total', stage=stage, status='ok')
+            ok = True
+        except Exception as e:
+            logger.error(f"Failed to process {pdf_file}: {str(e)}")
+            METRICS.inc('ai_filer_stage_documents_total', stage=stage, status='failed')
+        finally:
+            if self.jobs:
+                await asyncio.to_thread(self.jobs.finish, doc, ok)
+
+    async def _checkpoint(self, doc: Document, stage: str):
+        """Record a completed stage, so a crash later on resumes after it."""
+        if self.jobs:
+            await asyncio.to_thread(self.jobs.complete_stage, doc, stage)
+
+    async def _run_llm(self, doc: Document):
+        """Summarize, classify and name a document."""
+        pdf_file = doc['pdf_file']
+        with METRICS.timer('ai_filer_stage_seconds', stage='llm'):
+            if self.config['combined_mode']:
+                doc['summary'], doc['directory'], doc['filename'] = await self.ai.aanalyze_document(
+                    doc['text'], pdf_file, self.tree)
+                logger.info(f"Analysis completed: {doc['summary']}")
+            else:
+                doc['summary'] = await self.ai.asummarize_document(text=doc['text'], pdf_file=pdf_file)
+                logger.info(f"Summary completed: {doc['summary']}")
+
+                # Classification and filename only depend on the summary, so run them together
+                doc['directory'], doc['filename'] = await asyncio.gather(
+                    self.ai.aclassify_document(doc['summary'], self.tree),
+                    self.ai.agenerate_filename(doc['summary']))
+        logger.info(f"Classification completed: {doc['directory']}")
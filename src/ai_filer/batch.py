@@ -0,0 +1,160 @@
+import os
+from loguru import logger
+from .ai import AI
+from .cache import sha256_file, sha256_text
+from .file_manager import FileManager
+from .jobs import JobQueue
+from .metrics import METRICS
+from .pipeline import file_document
+from .providers.batch_api import BatchAPI
+from .types import Config, Document
+
+# Batch rounds in order, with the stages whose requests each one holds. Classification and
+# the filename are made from the summary, so they wait for the round that produces it
+ROUNDS = (('extract', 'summarize'), ('classify', 'filename'))
+
+# Document field each stage fills in
+_FIELDS = {'extract': 'text', 'summarize': 'summary', 'classify': 'directory', 'filename': 'filename'}
+
+
+class BatchRunner:
+    """Runner that files a backlog of documents through the provider's batch API.
+
+    Instead of one call per prompt, the prompts of every pending document
+    are collected and submitted together as batch jobs, which the provider
+    runs at a discount and outside the per-minute rate limits, and which
+    are polled until they finish. It takes two rounds, as classification
+    and filename generation need the summary:
+
+    1. extract and summarize, with the PDF attached
+    2. classify and generate a filename from the summary
+
+    Results go through the same validation, result cache, fast classifier
+    and filing as the other runners. Documents whose requests failed are
+    left in the watch folder. With a job queue, documents are claimed and
+    resumed as in the threaded pipeline.
+    """
+
+    def __init__(self, config: Config, ai: AI, file_manager: FileManager, tree, jobs: JobQueue = None):
+        """Initialize the runner.
+
+        Args:
+            config (Config): The application config.
+            ai (AI): The AI whose provider runs the batches.
+            file_manager (FileManager): The file manager used to file documents.
+            tree: The filing system tree used for classification.
+            jobs (JobQueue): Optional job queue to claim documents from.
+        """
+        if not isinstance(ai.provider, BatchAPI):
+            raise ValueError(f"The {ai.provider.name} provider has no batch API; use the pipeline or async runner")
+        self.config = config
+        self.ai = ai
+        self.file_manager = file_manager
+        self.tree = tree
+        self.jobs = jobs
+
+    def run(self, pdf_files: list[str]):
+        """Process a batch of PDF files and wait for them to finish."""
+        docs = []
+        for pdf_file in pdf_files:
+            doc: Document = {'pdf_file': pdf_file}
+            if self.jobs:
+                doc = self.jobs.claim(pdf_file)
+                if doc is None:
+                    logger.debug(f"Skipping {os.path.basename(pdf_file)}: done, failed or claimed by another worker")
+                    continue
+            docs.append(doc)
+
+        filed = set()
+        try:
+            for stages in ROUNDS:
+                with METRICS.timer('ai_filer_stage_seconds', stage='batch'):
+                    self._run_round(docs, stages)
+                for doc in docs:
+                    if 'extract' in stages and doc.get('text'):
+                        self._checkpoint(doc, 'extract')
+                    elif 'filename' in stages and doc.get('directory') and doc.get('filename'):
+                        self._checkpoint(doc, 'llm')
+
+            for index, doc in enumerate(docs):
+                if not (doc.get('summary') and doc.get('directory') and doc.get('filename')):
+                    logger.error(f"Failed to process {doc['pdf_file']}: no usable batch results")
+                    METRICS.inc('ai_filer_stage_documents_total', stage='batch', status='failed')
+                    continue
+                METRICS.inc('ai_filer_stage_documents_total', stage='batch', status='ok')
+                # Filed without OCR text if only the extraction failed
+                doc.setdefault('text', '')
+                try:
+                    with METRICS.timer('ai_filer_stage_seconds', stage='finalize'):
+                        file_document(self.file_manager, doc)
+                        self.ai.record_filing(doc['summary'], doc['directory'])
+                except Exception as e:
+                    logger.error(f"Failed to file {doc['pdf_file']}: {str(e)}")
+                    METRICS.inc('ai_filer_stage_documents_total', stage='finalize', status='failed')
+                    continue
+                METRICS.inc('ai_filer_stage_documents_total', stage='finalize', status='ok')
+                filed.add(index)
+        finally:
+            if self.jobs:
+                for index, doc in enumerate(docs):
+                    self.jobs.finish(doc, index in filed)
+
+    def _checkpoint(self, doc: Document, stage: str):
+        """Record a completed stage, so a crash later on resumes after it."""
+        if self.jobs:
+            self.jobs.complete_stage(doc, stage)
+
+    def _content_hash(self, stage: str, doc: Document) -> str:
+        """Hash of a stage's input, matching the one the online calls cache their results under."""
+        if stage in ('extract', 'summarize'):
+            return sha256_file(doc['pdf_file'])
+        if stage == 'classify':
+            return sha256_text(doc['summary'], str(self.tree))
+        return sha256_text(doc['summary'])
+
+    def _run_round(self, docs: list[Document], stages: tuple[str, ...]):
+        """Fill in the given stages of every document, with one batch for all requests that need the LLM."""
+        provider = self.ai.provider
+        requests = {}
+        pending = {}
+        for index, doc in enumerate(docs):
+            for stage in stages:
+                field = _FIELDS[stage]
+                if doc.get(field) or (stage in ('classify', 'filename') and not doc.get('summary')):
+                    continue
+                if stage == 'classify':
+                    # Routine documents are classified locally, as they are online
+                    category = self.ai.fast_classifier.predict(doc['summary'], self.tree)
+                    if category:
+                        doc[field] = category
+                        continue
+
+                content_hash = self._content_hash(stage, doc)
+                value = self.ai.cached(stage, content_hash)
+                if value is not None:
+                    doc[field] = value
+                    continue
+
+                tree = self.ai.shortlist.candidates(doc['summary'], self.tree) if stage == 'classify' else None
+                key = f"{index}-{stage}"
+                requests[key] = provider.batch_request(stage, text=doc.get('summary'), pdf_file=doc['pdf_file'],
+                                                       tree=tree)
+                pending[key] = (doc, stage, content_hash, tree)
+
+        if not requests:
+            return
+        logger.info(f"Batching {len(requests)} {' and '.join(stages)} requests for {len(docs)} documents")
+        results = provider.run_batch(requests)
+
+        for key, (doc, stage, content_hash, tree) in pending.items():
+            if key not in results:
+                continue
+            try:
+                value = provider.batch_result(stage, results[key], tree)
+            except Exception as e:
+                # One bad response fails its document only
+                logger.warning(f"Invalid {stage} result for {os.path.basename(doc['pdf_file'])}: {str(e)}")
+                continue
+            doc[_FIELDS[stage]] = value
+            self.ai.remember(stage, content_hash, value)
+            logger.debug(f"Batch {stage} result for {os.path.basename(doc['pdf_file'])}: {value[:200]}")
@@ -0,0 +1,157 @@
+import os
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from loguru import logger
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), 'prompts')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+# Evict again after this many stores, or this many seconds, so a long-running daemon stays within its limits
+_EVICT_EVERY = 100
+_EVICT_INTERVAL = 3600
+
+# File digests remembered, enough for every document in flight in the daemon
+_FILE_HASH_MEMO_SIZE = 4096
+
+
+def sha256_text(*parts: str) -> str:
+    """Return the SHA-256 hex digest of one or more strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        # Separator so ("ab", "c") and ("a", "bc") hash differently
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's bytes.
+
+    Digests of the most recently hashed files are memoized per path, size
+    and mtime, so stages of the same document only read the file once.
+    """
+    stat = os.stat(path)
+    return _sha256_file(path, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=_FILE_HASH_MEMO_SIZE)
+def _sha256_file(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@functools.cache
+def load_prompt(name: str) -> str:
+    """Return a prompt template from the prompts directory, read from disk once per process."""
+    with open(os.path.join(PROMPTS_DIR, name), 'r') as f:
+        return f.read()
+
+
+def prompt_hash(*names: str) -> str:
+    """Return a hash of the given prompt templates, so editing a prompt invalidates its results."""
+    return sha256_text(*(load_prompt(name) for name in names))
+
+
+class ResultCache:
+    """Persistent, content-addressed cache of pipeline stage results.
+
+    Results are keyed by the hash of the stage input (the PDF bytes, or the
+    text fed to the stage), the stage name, the provider, the model and a
+    hash of the prompt templates used. Entries are evicted by age and by
+    total count, least recently used first, when the cache is opened and
+    then every ``_EVICT_EVERY`` stores or ``_EVICT_INTERVAL`` seconds.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_age_days: float = 90):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            max_entries (int): Maximum number of results to keep. 0 means unlimited.
+            max_age_days (float): Drop results not used for this many days. 0 means never.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+        self.stores = 0
+        self.evicted_at = 0.0
+        self.evict()
+
+    @staticmethod
+    def make_key(content_hash: str, stage: str, provider: str, model: str, prompt_hash: str) -> str:
+        """Build the cache key for a stage result."""
+        return sha256_text(content_hash, stage, provider, model, prompt_hash)
+
+    def get(self, key: str) -> str | None:
+        """Return the cached value for a key, or None."""
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+        return row[0]
+
+    def set(self, key: str, value: str, content_hash: str, stage: str, provider: str, model: str,
+            prompt_hash: str):
+        """Store a stage result."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results '
+                '(key, content_hash, stage, provider, model, prompt_hash, value, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, content_hash, stage, provider, model, prompt_hash, value, now, now))
+            self.conn.commit()
+            self.stores += 1
+            due = self.stores >= _EVICT_EVERY or time.monotonic() - self.evicted_at >= _EVICT_INTERVAL
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop results that are too old, then the least recently used beyond max_entries."""
+        with self.lock:
+            self.stores = 0
+            self.evicted_at = time.monotonic()
+            removed = 0
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self.conn.execute('DELETE FROM results WHERE accessed < ?', (cutoff,)).rowcount
+            if self.max_entries:
+                removed += self.conn.execute(
+                    'DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)).rowcount
+            self.conn.commit()
+        if removed:
+            logger.debug(f"Evicted {removed} cached results")
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
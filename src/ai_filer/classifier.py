@@ -0,0 +1,190 @@
+import os
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from ai_filer.shortlist import tokenize
+from ai_filer.pdf_metadata import read_info
+
+# Bump when the on-disk index format changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+# Number of most similar filed documents that vote on a category
+NEIGHBOURS = 5
+
+# Where documents the LLM could not place end up. They say nothing about which
+# folder a document belongs in, so they are never learnt from
+FALLBACK_CATEGORIES = frozenset({'Unsorted'})
+
+
+def _read_example(root: str, pdf_file: str):
+    """Return (category, summary) for a filed PDF with an ai_filer summary, else None."""
+    try:
+        summary = read_info(pdf_file).get('Summary')
+    except Exception as e:
+        logger.debug(f"Skipping {pdf_file}: {str(e)}")
+        return None
+    if not summary or not summary.strip():
+        return None
+    # The folder the document is in now is the label; it reflects any manual corrections to /Category
+    category = os.path.relpath(os.path.dirname(pdf_file), root)
+    if category == os.curdir or category in FALLBACK_CATEGORIES:
+        return None
+    return category, summary.strip()
+
+
+def train(root: str, index_path: str, workers: int = 8) -> int:
+    """Harvest the summaries and categories of the documents filed under ``root``.
+
+    Documents whose size and mtime match the previous index are not read
+    again.
+
+    Args:
+        root (str): The filing system root.
+        index_path (str): Where the index is written.
+        workers (int): Number of PDFs read concurrently.
+
+    Returns:
+        int: The number of labelled documents in the index.
+    """
+    previous = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                previous = {example['path']: example for example in data['examples']}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    files = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.lower().endswith('.pdf'):
+                files.append(os.path.join(dir_path, file_name))
+
+    examples = []
+    to_read = []
+    for pdf_file in files:
+        try:
+            stat = os.stat(pdf_file)
+        except OSError:
+            continue
+        path = os.path.relpath(pdf_file, root)
+        known = previous.get(path)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            examples.append(known)
+        else:
+            to_read.append((pdf_file, path, stat))
+
+    logger.info(f"Reading metadata of {len(to_read)} of {len(files)} filed documents")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(lambda entry: _read_example(root, entry[0]), to_read)
+        for (pdf_file, path, stat), result in zip(to_read, results):
+            if result is None:
+                continue
+            category, summary = result
+            examples.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                             'category': category, 'summary': summary})
+
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'root': root, 'examples': examples}, f)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Indexed {len(examples)} labelled documents")
+    return len(examples)
+
+
+class FastClassifier:
+    """Nearest-neighbour classifier over the summaries of already filed documents.
+
+    The ``NEIGHBOURS`` filed documents most similar to a summary (TF-IDF
+    cosine similarity) vote for their folder. The winner's confidence is
+    the summed similarity of its voters divided by ``NEIGHBOURS``, so it is
+    only high when several close neighbours agree. Predictions below
+    ``threshold`` are left to the LLM.
+    """
+
+    def __init__(self, index_path: str, threshold: float):
+        """Initialize the classifier.
+
+        Args:
+            index_path (str): The index written by ``train``.
+            threshold (float): Minimum confidence to skip the LLM. 0 disables
+                the classifier.
+        """
+        self.index_path = index_path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.model = None
+
+    def _load(self):
+        """Load the index and build the term vectors, once."""
+        with self.lock:
+            if self.model is not None:
+                return self.model
+            examples = []
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, 'r') as f:
+                        data = json.load(f)
+                    if data.get('version') == INDEX_VERSION:
+                        # Indexes trained before fallback folders were left out may still hold them
+                        examples = [(e['category'], Counter(tokenize(e['summary']))) for e in data['examples']
+                                    if e['category'] not in FALLBACK_CATEGORIES]
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Ignoring unreadable classifier index {self.index_path}: {str(e)}")
+
+            document_frequency = Counter()
+            for _, counts in examples:
+                document_frequency.update(counts.keys())
+            idf = {term: math.log(1 + len(examples) / df) for term, df in document_frequency.items()}
+
+            categories = []
+            postings = defaultdict(list)
+            for i, (category, counts) in enumerate(examples):
+                vector = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+                norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+                for term, weight in vector.items():
+                    postings[term].append((i, weight / norm))
+                categories.append(category)
+
+            logger.debug(f"Fast classifier loaded {len(categories)} filed documents")
+            self.model = (categories, postings, idf)
+            return self.model
+
+    def predict(self, summary: str, tree) -> str:
+        """Return the category for a summary if the classifier is confident, else None."""
+        if not self.threshold or not summary:
+            return None
+        categories, postings, idf = self._load()
+        if not categories:
+            return None
+
+        query = {term: (1 + math.log(count)) * idf[term]
+                 for term, count in Counter(tokenize(summary)).items() if term in idf}
+        norm = math.sqrt(sum(w * w for w in query.values()))
+        if not norm:
+            return None
+
+        similarities = defaultdict(float)
+        for term, weight in query.items():
+            for i, example_weight in postings[term]:
+                similarities[i] += weight / norm * example_weight
+        neighbours = sorted(similarities.items(), key=lambda item: -item[1])[:NEIGHBOURS]
+
+        votes = defaultdict(float)
+        for i, similarity in neighbours:
+            votes[categories[i]] += similarity
+        category, score = max(votes.items(), key=lambda item: item[1])
+        confidence = score / NEIGHBOURS
+
+        # Folders that have since been removed or renamed are not valid answers
+        if confidence < self.threshold or category not in tree:
+            logger.debug(f"Fast classifier unsure ({category}, {confidence:.2f}), asking the LLM")
+            return None
+        logger.info(f"Fast classifier chose {category} ({confidence:.2f}), skipping the LLM")
+        return category
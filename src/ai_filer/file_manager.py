@@ -1,8 +1,61 @@
 import os
+import stat
+import errno
+import tempfile
+import threading
 from loguru import logger
 import shutil
 from ai_filer.types import Config
-from PyPDF2 import PdfReader, PdfWriter
+from ai_filer.filing_tree import FilingTree
+from ai_filer.pdf_metadata import incremental_update, write_metadata, write_rewritten
+from ai_filer.search import SearchIndex
+
+
+def _copy_contents(src, dst, size: int):
+    """Copy a whole file between open file objects, offloading the copy to the kernel where possible.
+
+    ``copy_file_range`` lets the filesystem share extents or copy
+    server-side; ``sendfile`` at least avoids copying through user space.
+    Anything the platform doesn't support falls back to a buffered copy.
+    """
+    offset = 0
+    try:
+        while offset < size:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), size - offset, offset, offset)
+            if not copied:
+                break
+            offset += copied
+    except (AttributeError, OSError):
+        pass
+    if offset < size:
+        try:
+            os.lseek(dst.fileno(), offset, os.SEEK_SET)
+            while offset < size:
+                copied = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                if not copied:
+                    break
+                offset += copied
+        except (AttributeError, OSError):
+            pass
+    if offset < size:
+        src.seek(offset)
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst)
+    dst.seek(0, os.SEEK_END)
+
+
+def _fsync_dir(path: str):
+    """Flush a directory entry change to disk, where the platform allows it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 class FileManager:
@@ -12,71 +65,127 @@ class FileManager:
         """Initialize the file object."""
         self.config = config
         self.logger = logger
-
-    def move_file(self, file_path, destination_folder):
-        """Move the file to the correct folder.
-        Args:
-            file_path (str): The path to the file to move.
-            destination_folder (str): The folder to move the file to.
+        # Filing tree index per root folder, kept between refreshes
+        self.trees = {}
+        self._search_index = None
+        self._search_index_lock = threading.Lock()
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """The full-text index of the filing system, opened on first use."""
+        with self._search_index_lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.config['dest_folder'])
+            return self._search_index
+
+    def close(self):
+        """Close the search index."""
+        with self._search_index_lock:
+            if self._search_index is not None:
+                self._search_index.close()
+                self._search_index = None
+
+    def get_tree_of_filing_system(self, root_folder: str) -> FilingTree:
         """
-        if os.environ.get('TESTING'):
-            logger.info(f"Would move {file_path} to {destination_folder}")
-            return
-        if not os.path.exists(destination_folder):
-            os.makedirs(destination_folder)
-        shutil.move(file_path, os.path.join(destination_folder, os.path.basename(file_path)))
-        logger.info(f"Moved {file_path} to {destination_folder}")
-
-    def get_tree_of_filing_system(self, root_folder: str):
-        """
-        Get the tree of the filing system recursively, including all subdirectories.
-        Returns a comma separated list of quoted directories
+        Get the tree of the filing system, including all subdirectories.
+        The tree is indexed under the watch folder and refreshed incrementally,
+        so only directories that changed since the last call are listed.
         """
         self.logger.debug("Getting tree of filing system")
 
-        def walk_dir(current_dir):
-            dirs = []
-            for item in os.listdir(current_dir):
-                full_path = os.path.join(current_dir, item)
-                if os.path.isdir(full_path):
-                    # Get relative path from DEST_FOLDER
-                    rel_path = os.path.relpath(full_path, root_folder)
-                    dirs.append(rel_path)
-                    # Recursively get subdirectories
-                    dirs.extend(walk_dir(full_path))
-            return dirs
-        return ','.join([f'"{d}"' for d in walk_dir(root_folder)])
-
-    def rename_and_move_file(self, file_path, new_name, relative_path, extension):
-        """Renames a file to a new name and moves it to the correct folder.
+        tree = self.trees.get(root_folder)
+        if tree is None:
+            index_path = os.path.join(self.config['watch_folder'], '.ai_filer', 'tree.json')
+            tree = FilingTree.load(root_folder, index_path)
+            self.trees[root_folder] = tree
+        tree.refresh()
+        return tree
+
+    def file_pdf(self, file_path: str, new_name: str, relative_path: str, metadata: dict) -> str:
+        """Add metadata to a PDF and file it under a new name in a single pass.
+
+        The metadata-augmented copy is written straight into a temporary file
+        in the destination folder: the original bytes are copied with kernel
+        copy offload and an incremental metadata update is appended (or, for
+        PDFs that can't be updated incrementally, a full rewrite is written).
+        The copy is fsynced and linked into place under a free name, and only
+        then is the original removed, so a crash never leaves a partial file
+        in the filing system or loses the original.
+
         Args:
-            file_path (str): The path to the file to rename.
-            new_name (str): The new name for the file.
+            file_path (str): The PDF in the watch folder.
+            new_name (str): The new name for the file, without extension.
+            relative_path (str): The folder within the filing system.
+            metadata (dict): Metadata to add, keyed without the leading slash.
+
+        Returns:
+            str: The path the document was filed at.
         """
-        self.logger.debug(f"Renaming file {os.path.basename(file_path)} to {new_name}.{extension}")
+        destination_folder = os.path.join(self.config['dest_folder'], relative_path)
         if os.environ.get('TESTING'):
-            self.logger.info(f"Would rename file {os.path.basename(file_path)} to {new_name}.{extension}")
-            return
+            self.logger.info(f"Would file {os.path.basename(file_path)} as {new_name}.pdf in {destination_folder} "
+                             f"with metadata {metadata}")
+            return os.path.join(destination_folder, f"{new_name}.pdf")
+
+        os.makedirs(destination_folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=destination_folder, prefix='.', suffix='.tmp')
         try:
-            # Get the directory of the original file
-            original_dir = os.path.dirname(file_path)
-            # Create new path in the same directory as the original file
-            new_file_path = os.path.join(original_dir, f"{new_name}.{extension}")
-
-            os.rename(file_path, new_file_path)
-            self.logger.info(f"File renamed {os.path.basename(file_path)} to {new_name}.{extension}")
-            # Move the file to the correct folder
-            self.move_file(new_file_path, os.path.join(self.config['dest_folder'], relative_path))
-            self.logger.info(
-                f"File moved {os.path.basename(file_path)} to {os.path.join(self.config['dest_folder'],
-                                                                            relative_path)}")
-        except Exception as e:
-            self.logger.error(
-                        "Failed to rename file",
-                        file_name=os.path.basename(file_path),
-                        error=str(e))
+            with open(file_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                update = incremental_update(src, metadata)
+                if update is not None:
+                    size = os.fstat(src.fileno()).st_size
+                    _copy_contents(src, dst, size)
+                    dst.write(update)
+                else:
+                    self.logger.debug(f"Can't update {os.path.basename(file_path)} incrementally, rewriting it")
+                    write_rewritten(file_path, metadata, dst)
+                # mkstemp creates the file owner-only; keep the original's permissions like a move would
+                os.fchmod(dst.fileno(), stat.S_IMODE(os.fstat(src.fileno()).st_mode))
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            new_file_path = self._commit(tmp_path, destination_folder, new_name, 'pdf')
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
             raise
 
+        os.remove(file_path)
+        self.logger.info(f"Filed {os.path.basename(file_path)} as {new_file_path}")
+
+        if self.config['search_index']:
+            try:
+                self.search_index.add(new_file_path, metadata.get('Summary'), metadata.get('Category'),
+                                      metadata.get('OCRText'))
+            except Exception as e:
+                # The document is filed; it will be picked up by the next reindex
+                self.logger.warning(f"Failed to add {new_file_path} to the search index: {str(e)}")
+        return new_file_path
+
+    def _commit(self, tmp_path: str, folder: str, name: str, extension: str) -> str:
+        """Give a finished temporary file its final name, never overwriting an existing file."""
+        for attempt in range(1000):
+            suffix = f" ({attempt})" if attempt else ""
+            new_file_path = os.path.join(folder, f"{name}{suffix}.{extension}")
+            try:
+                # link fails if the name is taken, so concurrent workers can't clobber each other
+                os.link(tmp_path, new_file_path)
+            except FileExistsError:
+                continue
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV):
+                    raise
+                # Filesystems without hard links
+                if os.path.exists(new_file_path):
+                    continue
+                os.replace(tmp_path, new_file_path)
+                _fsync_dir(folder)
+                return new_file_path
+            os.unlink(tmp_path)
+            _fsync_dir(folder)
+            return new_file_path
+        raise FileExistsError(f"No free name for {name}.{extension} in {folder}")
+
     def get_all_pdf_files_in_folder(self, folder: str) -> list[str]:
         """Get all pdf files in a folder. Returns a list of full paths."""
         return [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.pdf')]
@@ -92,24 +201,8 @@ class FileManager:
             return
 
         try:
-            reader = PdfReader(file_path)
-            writer = PdfWriter()
-
-            # Copy all pages
-            for page in reader.pages:
-                writer.add_page(page)
-
-            # Format metadata with proper PDF prefix
-            pdf_metadata = {
-                f'/{k}': str(v) for k, v in metadata.items()
-            }
-
-            # Add metadata
-            writer.add_metadata(pdf_metadata)
-
-            # Save the file with metadata
-            with open(file_path, 'wb') as output_file:
-                writer.write(output_file)
+            # Appends a new Info dictionary instead of rewriting every page
+            write_metadata(file_path, metadata)
 
             self.logger.info(f"Added metadata to {os.path.basename(file_path)}")
         except Exception as e:
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import threading
+from loguru import logger
+
+# Bump when the on-disk index format changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+# Directories modified this recently are listed again on the next refresh,
+# since another change within the same mtime tick would go unnoticed
+_RACY_NS = 2 * 1_000_000_000
+
+
+class FilingTree:
+    """Index of the directories in the filing system.
+
+    The directories are held as a trie of directory names, mapping each
+    directory (relative to the root, ``''`` for the root itself) to its
+    subdirectories, and as a set of relative paths for exact category
+    lookups. The index is persisted together with each directory's mtime.
+    Adding, removing or renaming a subdirectory changes its parent's mtime,
+    so ``refresh`` only has to stat every known directory and list the few
+    whose mtime changed.
+    """
+
+    def __init__(self, root: str, index_path: str = None):
+        """Initialize an empty tree.
+
+        Args:
+            root (str): The root of the filing system.
+            index_path (str): Where the index is persisted, if anywhere.
+        """
+        self.root = root
+        self.index_path = index_path
+        self.mtimes = {}
+        self.children = {}
+        self.directories = frozenset()
+        self.lock = threading.Lock()
+        self._prompt = None
+
+    @classmethod
+    def load(cls, root: str, index_path: str = None) -> 'FilingTree':
+        """Load the persisted index for a root, or start an empty one. Call refresh to bring it up to date."""
+        tree = cls(root, index_path)
+        if not index_path or not os.path.exists(index_path):
+            return tree
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and data.get('root') == root:
+                tree._set(data['mtimes'], {rel: tuple(names) for rel, names in data['children'].items()})
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable filing tree index {index_path}: {str(e)}")
+        return tree
+
+    def save(self):
+        """Persist the index, replacing the previous one atomically."""
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        data = {
+            'version': INDEX_VERSION,
+            'root': self.root,
+            'mtimes': self.mtimes,
+            'children': {rel: list(names) for rel, names in self.children.items()},
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> bool:
+        """Bring the index up to date with the filing system, saving it if it changed.
+
+        Returns:
+            bool: Whether any directory was added or removed.
+        """
+        with self.lock:
+            now = time.time_ns()
+            mtimes = {}
+            children = {}
+            listed = 0
+            stack = ['']
+            while stack:
+                rel = stack.pop()
+                path = os.path.join(self.root, rel) if rel else self.root
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    if not rel:
+                        raise
+                    # Removed since its parent was listed
+                    continue
+
+                if rel in self.children and self.mtimes.get(rel) == mtime:
+                    names = self.children[rel]
+                else:
+                    names = self._list(path)
+                    listed += 1
+                mtimes[rel] = mtime if now - mtime > _RACY_NS else None
+                children[rel] = names
+                stack.extend(os.path.join(rel, name) if rel else name for name in names)
+
+            changed = children != self.children
+            if changed or mtimes != self.mtimes:
+                self._set(mtimes, children)
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.warning(f"Failed to save filing tree index: {str(e)}")
+            logger.debug(f"Filing tree has {len(self.directories)} directories, listed {listed}")
+            return changed
+
+    @staticmethod
+    def _list(path: str) -> tuple[str, ...]:
+        """Return the sorted names of a directory's subdirectories."""
+        try:
+            with os.scandir(path) as entries:
+                return tuple(sorted(entry.name for entry in entries if entry.is_dir()))
+        except OSError as e:
+            logger.warning(f"Failed to list {path}: {str(e)}")
+            return ()
+
+    def _set(self, mtimes: dict, children: dict):
+        self.mtimes = mtimes
+        self.children = children
+        # Readers only ever see a complete set, so lookups need no lock
+        self.directories = frozenset(rel for rel in children if rel)
+
+    def subdirectories(self, category: str = '') -> tuple[str, ...]:
+        """Return the names of a directory's subdirectories, or of the top level ones."""
+        return self.children.get(os.path.normpath(category) if category else '', ())
+
+    def as_prompt(self) -> str:
+        """Return the directories as a comma separated list of quoted paths, for prompts."""
+        directories = self.directories
+        cached = self._prompt
+        if cached is None or cached[0] is not directories:
+            cached = (directories, ','.join(f'"{d}"' for d in sorted(directories)))
+            self._prompt = cached
+        return cached[1]
+
+    def __contains__(self, category) -> bool:
+        """Return whether a category is exactly a directory in the tree."""
+        if not isinstance(category, str) or not category:
+            return False
+        return os.path.normpath(category) in self.directories
+
+    def __iter__(self):
+        return iter(sorted(self.directories))
+
+    def __len__(self) -> int:
+        return len(self.directories)
+
+    def __str__(self) -> str:
+        return self.as_prompt()
@@ -0,0 +1,157 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from .file_manager import FileManager
+from .pdf_metadata import read_info
+from .types import Config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    path TEXT PRIMARY KEY,
+    added REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+# A claimed document is offered again after this long, in case its worker died
+_LEASE_SECONDS = 3600
+
+
+def _lower_priority(niceness: int):
+    """Process pool initializer: make the worker yield the CPU to everything else."""
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+class FullTextBacklog:
+    """Durable list of filed documents whose /OCRText holds only their first pages.
+
+    With a text budget, documents are filed as soon as the text the LLM calls
+    need has been extracted. The paths they were filed at are recorded here,
+    and ``complete_full_text`` later extracts the whole text of each and adds
+    it to its metadata and to the search index. Like the job queue, it keys
+    documents by path relative to a folder, the destination folder here, so
+    workers that mount it at different paths can share the backlog.
+    """
+
+    def __init__(self, path: str, dest_folder: str):
+        """Open (and create if needed) the backlog.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            dest_folder (str): The folder documents are filed into.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.dest_folder = dest_folder
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        # Shared by every worker on the watch folder, possibly over a network file system
+        self.conn.execute('PRAGMA journal_mode=DELETE')
+        self.conn.executescript(_SCHEMA)
+
+    def _name(self, pdf_file: str) -> str:
+        return os.path.relpath(pdf_file, self.dest_folder)
+
+    def add(self, pdf_file: str):
+        """Record a filed document whose full text is still to be extracted."""
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO pending (path, added) VALUES (?, ?)',
+                              (self._name(pdf_file), time.time()))
+
+    def claim(self) -> str | None:
+        """Return the oldest document nobody else is working on, or None when there is none."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'UPDATE pending SET lease_until = ? WHERE path = '
+                '(SELECT path FROM pending WHERE lease_until < ? ORDER BY added LIMIT 1) RETURNING path',
+                (now + _LEASE_SECONDS, now)).fetchone()
+        return os.path.join(self.dest_folder, row[0]) if row else None
+
+    def done(self, pdf_file: str):
+        """Remove a document from the backlog."""
+        with self.lock:
+            self.conn.execute('DELETE FROM pending WHERE path = ?', (self._name(pdf_file),))
+
+    def count(self) -> int:
+        """Return the number of documents waiting for their full text."""
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.conn.close()
+
+
+def backlog_path(config: Config) -> str:
+    """Return the path of the full-text backlog database."""
+    return os.path.join(config['watch_folder'], '.ai_filer', 'fulltext.sqlite')
+
+
+def complete_full_text(config: Config, backlog: FullTextBacklog, file_manager: FileManager,
+                       stop: threading.Event = None) -> int:
+    """Extract the whole text of the documents in the backlog and add it to their metadata.
+
+    Runs at low priority: OCR uses its own pool of ``fulltext_workers``
+    processes, niced by ``fulltext_nice``, so filing new documents keeps
+    the CPU. The pool is only started once there is a document to complete,
+    as the daemon calls this every poll interval. The metadata is appended
+    as an incremental update.
+
+    Args:
+        config (Config): The application config.
+        backlog (FullTextBacklog): The documents to complete.
+        file_manager (FileManager): The file manager used to write metadata and update the search index.
+        stop (threading.Event): Stops the pass after the current document when set.
+
+    Returns:
+        int: The number of documents completed.
+    """
+    completed = 0
+    pool = None
+    ocr = None
+    try:
+        while not (stop and stop.is_set()):
+            pdf_file = backlog.claim()
+            if pdf_file is None:
+                break
+            if not os.path.exists(pdf_file):
+                logger.debug(f"{pdf_file} was moved or deleted before its full text was extracted")
+                backlog.done(pdf_file)
+                continue
+
+            if pool is None:
+                # Imported here, as OCR pulls in Pillow, which a pass with nothing to do shouldn't load
+                from .providers.ocr import OCR
+
+                pool = ProcessPoolExecutor(max_workers=max(1, config['fulltext_workers']),
+                                           initializer=_lower_priority, initargs=(config['fulltext_nice'],))
+                ocr = OCR(config, executor=pool)
+
+            logger.info(f"Extracting the full text of {os.path.basename(pdf_file)}")
+            text = ocr.extract_text_from_pdf(pdf_file)
+            if not text:
+                # Extraction already logged why; the first pages' text stays in place
+                backlog.done(pdf_file)
+                continue
+            try:
+                file_manager.add_metadata_to_pdf(pdf_file, {'OCRText': text})
+                if config['search_index'] and not os.environ.get('TESTING'):
+                    info = read_info(pdf_file)
+                    file_manager.search_index.add(pdf_file, info.get('Summary'), info.get('Category'), text)
+            except Exception as e:
+                # Keeps its claim, so it is retried once that expires rather than in this pass
+                logger.error(f"Failed to store the full text of {pdf_file}: {str(e)}")
+                continue
+            backlog.done(pdf_file)
+            completed += 1
+    finally:
+        if pool:
+            pool.shutdown()
+    if completed:
+        logger.info(f"Stored the full text of {completed} documents")
+    return completed
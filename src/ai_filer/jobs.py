@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from loguru import logger
+from .types import Document
+
+# Stages in pipeline order; a job's stage is the last one it completed
+STAGES = ('extract', 'llm', 'finalize')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT '',
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,  -- claims whose worker never released the document
+    text TEXT,
+    summary TEXT,
+    directory TEXT,
+    filename TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner);
+"""
+
+# Stage outputs saved when a stage completes, so a resumed job can skip it
+_OUTPUTS = {
+    'extract': ('text',),
+    'llm': ('summary', 'directory', 'filename'),
+    'finalize': (),
+}
+
+
+def _signature(pdf_file: str) -> str:
+    """Size and mtime of a file, to notice when a name is reused for a different document."""
+    stat = os.stat(pdf_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class JobQueue:
+    """Durable table of the documents in the watch folder and how far each got.
+
+    Every worker (thread pool, process or machine) sharing the table claims
+    a document before working on it by taking a lease, which a heartbeat
+    thread renews while the worker is alive. Leases of workers that died
+    expire and the document can be claimed again. Each completed stage is
+    recorded together with its output, so a claimed document resumes after
+    the last stage that finished. A document whose workers keep dying on it
+    is given up; documents that merely failed are retried by every run.
+
+    Documents are identified by their name in the watch folder, so workers
+    on different machines may mount the folder at different paths. The
+    database uses SQLite's rollback journal rather than WAL, as WAL does not
+    work across machines on a network file system.
+    """
+
+    def __init__(self, path: str, watch_folder: str, lease_seconds: float = 120, max_attempts: int = 3):
+        """Open (and create if needed) the job table.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            watch_folder (str): The folder the documents are in.
+            lease_seconds (float): How long a claim lasts without a heartbeat.
+            max_attempts (int): Give up on a document after this many workers died on it. 0 means never.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.watch_folder = watch_folder
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=DELETE')
+        self.conn.executescript(_SCHEMA)
+
+        self.stop = threading.Event()
+        self.heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        self.heartbeat.start()
+
+    def _name(self, pdf_file: str) -> str:
+        return os.path.relpath(pdf_file, self.watch_folder)
+
+    def _transaction(self, func):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't both read a job as free
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func()
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    def claim(self, pdf_file: str) -> Document | None:
+        """Take the lease on a document.
+
+        Returns:
+            Document: The document, with the outputs of the stages it already
+                completed, or None if another live worker holds it, it is
+                done, or it was given up.
+        """
+        try:
+            signature = _signature(pdf_file)
+        except FileNotFoundError:
+            # Filed by another worker in the meantime
+            return None
+        name = self._name(pdf_file)
+
+        def claim():
+            now = time.time()
+            row = self.conn.execute(
+                'SELECT signature, status, stage, owner, lease_until, attempts, text, summary, directory, filename '
+                'FROM jobs WHERE name = ?', (name,)).fetchone()
+            if row is None or row[0] != signature:
+                # New document, or a different document under a name that was used before
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO jobs (name, signature, status, stage, owner, lease_until, attempts, '
+                    'updated) VALUES (?, ?, ?, ?, ?, ?, 1, ?)',
+                    (name, signature, 'leased', '', self.owner, now + self.lease_seconds, now))
+                return {'pdf_file': pdf_file}
+
+            _, status, stage, owner, lease_until, attempts, text, summary, directory, filename = row
+            if status in ('done', 'given_up'):
+                return None
+            if status == 'leased' and owner != self.owner and lease_until > now:
+                return None
+            if status == 'leased' and self.max_attempts and attempts >= self.max_attempts:
+                # Its workers keep dying on it (out of memory, a crash in OCR); stop handing it out
+                logger.error(f"Giving up on {name} after {attempts} attempts whose workers died; "
+                             f"run 'ai_filer jobs --retry' to try it again")
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'given_up', owner = NULL, lease_until = 0, updated = ? WHERE name = ?",
+                    (now, name))
+                return None
+            if status == 'leased' and owner != self.owner:
+                logger.info(f"Reclaiming {name} from {owner}, whose lease expired")
+
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated = ? '
+                'WHERE name = ?', ('leased', self.owner, now + self.lease_seconds, now, name))
+            doc: Document = {'pdf_file': pdf_file}
+            outputs = {'text': text, 'summary': summary, 'directory': directory, 'filename': filename}
+            for completed in STAGES[:STAGES.index(stage) + 1] if stage else ():
+                for key in _OUTPUTS[completed]:
+                    doc[key] = outputs[key]
+            if stage:
+                logger.info(f"Resuming {name} after the {stage} stage")
+            return doc
+
+        return self._transaction(claim)
+
+    def complete_stage(self, doc: Document, stage: str):
+        """Record that a stage finished, with its outputs."""
+        columns = _OUTPUTS[stage]
+        assignments = ''.join(f', {column} = ?' for column in columns)
+        with self.lock:
+            self.conn.execute(
+                f'UPDATE jobs SET stage = ?, updated = ?{assignments} WHERE name = ? AND owner = ?',
+                (stage, time.time(), *(doc.get(column) for column in columns), self._name(doc['pdf_file']),
+                 self.owner))
+
+    def finish(self, doc: Document, ok: bool):
+        """Release a document: done when it was filed, failed otherwise.
+
+        Failed documents are claimed again by every later run. The attempt
+        is taken back, as the worker survived it: only attempts whose
+        worker died count towards max_attempts.
+        """
+        with self.lock:
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, owner = NULL, lease_until = 0, updated = ?, '
+                'stage = CASE WHEN ? THEN ? ELSE stage END, '
+                'attempts = CASE WHEN ? THEN attempts ELSE attempts - 1 END, '
+                # The stored text is only needed to resume; don't keep it for filed documents
+                'text = CASE WHEN ? THEN NULL ELSE text END WHERE name = ? AND owner = ?',
+                ('done' if ok else 'failed', time.time(), ok, STAGES[-1], ok, ok, self._name(doc['pdf_file']),
+                 self.owner))
+
+    def retry(self) -> int:
+        """Make the documents that were given up, or that failed, claimable again with no attempts counted.
+
+        Returns:
+            int: The number of documents reset.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'failed', attempts = 0, updated = ? WHERE status IN ('given_up', 'failed')",
+                (time.time(),)).rowcount
+
+    def prune(self):
+        """Forget finished documents and expired claims on documents no longer in the watch folder."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name FROM jobs WHERE status != 'leased' OR lease_until < ?", (time.time(),)).fetchall()
+        missing = [(name,) for name, in rows if not os.path.exists(os.path.join(self.watch_folder, name))]
+        if missing:
+            with self.lock:
+                self.conn.executemany(
+                    "DELETE FROM jobs WHERE name = ? AND (status != 'leased' OR lease_until < ?)",
+                    [(name, time.time()) for name, in missing])
+            logger.debug(f"Pruned {len(missing)} jobs for documents no longer in the watch folder")
+
+    def counts(self) -> dict:
+        """Return the number of jobs by status and stage."""
+        with self.lock:
+            rows = self.conn.execute('SELECT status, stage, COUNT(*) FROM jobs GROUP BY status, stage').fetchall()
+        return {f"{status}/{stage or 'new'}": count for status, stage, count in rows}
+
+    def _heartbeat(self):
+        # Renew well before the lease runs out, so a slow write can't let it lapse
+        while not self.stop.wait(self.lease_seconds / 3):
+            try:
+                with self.lock:
+                    self.conn.execute(
+                        "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'leased'",
+                        (time.time() + self.lease_seconds, self.owner))
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to renew job leases: {str(e)}")
+
+    def close(self):
+        """Stop the heartbeat and release any documents still held, so others can claim them at once."""
+        self.stop.set()
+        self.heartbeat.join()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', owner = NULL, lease_until = 0, attempts = attempts - 1 "
+                "WHERE owner = ? AND status = 'leased'", (self.owner,))
+            self.conn.close()
@@ -1,12 +1,20 @@
 import os
 import sys
+import argparse
 import configparser
 
 from datetime import datetime
 from loguru import logger
-from .ai import AI
-from .providers.ocr import OCR
+from .ai import AI, text_budget
+from .async_runner import AsyncRunner
+from .batch import BatchRunner
+from .classifier import train
 from .file_manager import FileManager
+from .fulltext import FullTextBacklog, backlog_path, complete_full_text
+from .jobs import JobQueue
+from .metrics import METRICS, write_metrics
+from .pipeline import Pipeline
+from .search import SearchIndex
 from .types import Config
 
 
@@ -65,7 +73,64 @@ def get_config_from_file_or_env() -> Config:
         'debug': False,
         'testing': False,
         'openai_api_key': '',
-        'use_mac_keyring': False
+        'openai_base_url': '',
+        'openai_run_timeout': 300.0,
+        'gemini_base_url': '',
+        'use_mac_keyring': False,
+        'ocr_workers': os.cpu_count() or 1,
+        'ocr_batch_pages': 4,
+        'ocr_max_inflight_pages': 2 * (os.cpu_count() or 1),
+        'ocr_min_page_chars': 50,
+        'ocr_dpi': 200,
+        'ocr_max_pixels': 3500,
+        'ocr_preprocess': 'grayscale,downscale,skip_blank,deskew,binarize',
+        'ocr_blank_ink': 0.002,
+        'ocr_psm': 3,
+        'ocr_oem': 3,
+        'extract_workers': os.cpu_count() or 1,
+        'llm_workers': 4,
+        'finalize_workers': 1,
+        'queue_size': 8,
+        'settle_seconds': 5.0,
+        'poll_interval': 1.0,
+        'cache_enabled': True,
+        'cache_max_entries': 10000,
+        'cache_max_age_days': 90.0,
+        'summary_chunk_chars': 8000,
+        'summary_parallelism': 4,
+        'combined_mode': False,
+        'ollama_host': 'http://localhost:11434',
+        'ollama_connect_timeout': 5.0,
+        'ollama_read_timeout': 600.0,
+        'ollama_keep_alive': '30m',
+        'ollama_options': '',
+        'ollama_stream': False,
+        'ollama_max_response_chars': 0,
+        'runner': 'pipeline',
+        'llm_concurrency': 16,
+        'requests_per_minute': 0,
+        'tokens_per_minute': 0,
+        'adaptive_concurrency': True,
+        'max_retries': 5,
+        'retry_base_delay': 1.0,
+        'retry_max_delay': 60.0,
+        'upload_ttl': 3600.0,
+        'shortlist_size': 40,
+        'fast_classify_threshold': 0.6,
+        'search_index': True,
+        'metrics': True,
+        'metrics_dir': '',
+        'job_queue': True,
+        'jobs_db': '',
+        'job_lease_seconds': 120.0,
+        'job_max_attempts': 3,
+        'text_budget_chars': 0,
+        'text_budget_tokens': 0,
+        'fulltext_workers': 1,
+        'fulltext_nice': 10,
+        'batch_poll_interval': 30.0,
+        'batch_timeout': 86400.0,
+        'batch_max_requests': 1000
     }
 
     # Try to read from config file first
@@ -80,7 +145,109 @@ def get_config_from_file_or_env() -> Config:
             'debug': parser.getboolean(configparser.UNNAMED_SECTION, 'debug', fallback=False),
             'testing': parser.getboolean(configparser.UNNAMED_SECTION, 'testing', fallback=False),
             'openai_api_key': parser.get(configparser.UNNAMED_SECTION, 'openai_api_key', fallback=''),
-            'use_mac_keyring': parser.getboolean(configparser.UNNAMED_SECTION, 'use_mac_keyring', fallback=False)
+            'openai_base_url': parser.get(configparser.UNNAMED_SECTION, 'openai_base_url',
+                                          fallback=config['openai_base_url']),
+            'openai_run_timeout': parser.getfloat(configparser.UNNAMED_SECTION, 'openai_run_timeout',
+                                                  fallback=config['openai_run_timeout']),
+            'gemini_base_url': parser.get(configparser.UNNAMED_SECTION, 'gemini_base_url',
+                                          fallback=config['gemini_base_url']),
+            'use_mac_keyring': parser.getboolean(configparser.UNNAMED_SECTION, 'use_mac_keyring', fallback=False),
+            'ocr_workers': parser.getint(configparser.UNNAMED_SECTION, 'ocr_workers',
+                                         fallback=config['ocr_workers']),
+            'ocr_batch_pages': parser.getint(configparser.UNNAMED_SECTION, 'ocr_batch_pages',
+                                             fallback=config['ocr_batch_pages']),
+            'ocr_max_inflight_pages': parser.getint(configparser.UNNAMED_SECTION, 'ocr_max_inflight_pages',
+                                                    fallback=config['ocr_max_inflight_pages']),
+            'ocr_min_page_chars': parser.getint(configparser.UNNAMED_SECTION, 'ocr_min_page_chars',
+                                                fallback=config['ocr_min_page_chars']),
+            'ocr_dpi': parser.getint(configparser.UNNAMED_SECTION, 'ocr_dpi', fallback=config['ocr_dpi']),
+            'ocr_max_pixels': parser.getint(configparser.UNNAMED_SECTION, 'ocr_max_pixels',
+                                            fallback=config['ocr_max_pixels']),
+            'ocr_preprocess': parser.get(configparser.UNNAMED_SECTION, 'ocr_preprocess',
+                                         fallback=config['ocr_preprocess']),
+            'ocr_blank_ink': parser.getfloat(configparser.UNNAMED_SECTION, 'ocr_blank_ink',
+                                             fallback=config['ocr_blank_ink']),
+            'ocr_psm': parser.getint(configparser.UNNAMED_SECTION, 'ocr_psm', fallback=config['ocr_psm']),
+            'ocr_oem': parser.getint(configparser.UNNAMED_SECTION, 'ocr_oem', fallback=config['ocr_oem']),
+            'extract_workers': parser.getint(configparser.UNNAMED_SECTION, 'extract_workers',
+                                             fallback=config['extract_workers']),
+            'llm_workers': parser.getint(configparser.UNNAMED_SECTION, 'llm_workers',
+                                         fallback=config['llm_workers']),
+            'finalize_workers': parser.getint(configparser.UNNAMED_SECTION, 'finalize_workers',
+                                              fallback=config['finalize_workers']),
+            'queue_size': parser.getint(configparser.UNNAMED_SECTION, 'queue_size', fallback=config['queue_size']),
+            'settle_seconds': parser.getfloat(configparser.UNNAMED_SECTION, 'settle_seconds',
+                                              fallback=config['settle_seconds']),
+            'poll_interval': parser.getfloat(configparser.UNNAMED_SECTION, 'poll_interval',
+                                             fallback=config['poll_interval']),
+            'cache_enabled': parser.getboolean(configparser.UNNAMED_SECTION, 'cache_enabled',
+                                               fallback=config['cache_enabled']),
+            'cache_max_entries': parser.getint(configparser.UNNAMED_SECTION, 'cache_max_entries',
+                                               fallback=config['cache_max_entries']),
+            'cache_max_age_days': parser.getfloat(configparser.UNNAMED_SECTION, 'cache_max_age_days',
+                                                  fallback=config['cache_max_age_days']),
+            'summary_chunk_chars': parser.getint(configparser.UNNAMED_SECTION, 'summary_chunk_chars',
+                                                 fallback=config['summary_chunk_chars']),
+            'summary_parallelism': parser.getint(configparser.UNNAMED_SECTION, 'summary_parallelism',
+                                                 fallback=config['summary_parallelism']),
+            'combined_mode': parser.getboolean(configparser.UNNAMED_SECTION, 'combined_mode',
+                                               fallback=config['combined_mode']),
+            'ollama_host': parser.get(configparser.UNNAMED_SECTION, 'ollama_host', fallback=config['ollama_host']),
+            'ollama_connect_timeout': parser.getfloat(configparser.UNNAMED_SECTION, 'ollama_connect_timeout',
+                                                      fallback=config['ollama_connect_timeout']),
+            'ollama_read_timeout': parser.getfloat(configparser.UNNAMED_SECTION, 'ollama_read_timeout',
+                                                   fallback=config['ollama_read_timeout']),
+            'ollama_keep_alive': parser.get(configparser.UNNAMED_SECTION, 'ollama_keep_alive',
+                                            fallback=config['ollama_keep_alive']),
+            'ollama_options': parser.get(configparser.UNNAMED_SECTION, 'ollama_options',
+                                         fallback=config['ollama_options']),
+            'ollama_stream': parser.getboolean(configparser.UNNAMED_SECTION, 'ollama_stream',
+                                               fallback=config['ollama_stream']),
+            'ollama_max_response_chars': parser.getint(configparser.UNNAMED_SECTION, 'ollama_max_response_chars',
+                                                       fallback=config['ollama_max_response_chars']),
+            'runner': parser.get(configparser.UNNAMED_SECTION, 'runner', fallback=config['runner']),
+            'llm_concurrency': parser.getint(configparser.UNNAMED_SECTION, 'llm_concurrency',
+                                             fallback=config['llm_concurrency']),
+            'requests_per_minute': parser.getint(configparser.UNNAMED_SECTION, 'requests_per_minute',
+                                                 fallback=config['requests_per_minute']),
+            'tokens_per_minute': parser.getint(configparser.UNNAMED_SECTION, 'tokens_per_minute',
+                                               fallback=config['tokens_per_minute']),
+            'adaptive_concurrency': parser.getboolean(configparser.UNNAMED_SECTION, 'adaptive_concurrency',
+                                                      fallback=config['adaptive_concurrency']),
+            'max_retries': parser.getint(configparser.UNNAMED_SECTION, 'max_retries', fallback=config['max_retries']),
+            'retry_base_delay': parser.getfloat(configparser.UNNAMED_SECTION, 'retry_base_delay',
+                                                fallback=config['retry_base_delay']),
+            'retry_max_delay': parser.getfloat(configparser.UNNAMED_SECTION, 'retry_max_delay',
+                                               fallback=config['retry_max_delay']),
+            'upload_ttl': parser.getfloat(configparser.UNNAMED_SECTION, 'upload_ttl', fallback=config['upload_ttl']),
+            'shortlist_size': parser.getint(configparser.UNNAMED_SECTION, 'shortlist_size',
+                                            fallback=config['shortlist_size']),
+            'fast_classify_threshold': parser.getfloat(configparser.UNNAMED_SECTION, 'fast_classify_threshold',
+                                                       fallback=config['fast_classify_threshold']),
+            'search_index': parser.getboolean(configparser.UNNAMED_SECTION, 'search_index',
+                                              fallback=config['search_index']),
+            'metrics': parser.getboolean(configparser.UNNAMED_SECTION, 'metrics', fallback=config['metrics']),
+            'metrics_dir': parser.get(configparser.UNNAMED_SECTION, 'metrics_dir', fallback=config['metrics_dir']),
+            'job_queue': parser.getboolean(configparser.UNNAMED_SECTION, 'job_queue', fallback=config['job_queue']),
+            'jobs_db': parser.get(configparser.UNNAMED_SECTION, 'jobs_db', fallback=config['jobs_db']),
+            'job_lease_seconds': parser.getfloat(configparser.UNNAMED_SECTION, 'job_lease_seconds',
+                                                 fallback=config['job_lease_seconds']),
+            'job_max_attempts': parser.getint(configparser.UNNAMED_SECTION, 'job_max_attempts',
+                                              fallback=config['job_max_attempts']),
+            'text_budget_chars': parser.getint(configparser.UNNAMED_SECTION, 'text_budget_chars',
+                                               fallback=config['text_budget_chars']),
+            'text_budget_tokens': parser.getint(configparser.UNNAMED_SECTION, 'text_budget_tokens',
+                                                fallback=config['text_budget_tokens']),
+            'fulltext_workers': parser.getint(configparser.UNNAMED_SECTION, 'fulltext_workers',
+                                              fallback=config['fulltext_workers']),
+            'fulltext_nice': parser.getint(configparser.UNNAMED_SECTION, 'fulltext_nice',
+                                           fallback=config['fulltext_nice']),
+            'batch_poll_interval': parser.getfloat(configparser.UNNAMED_SECTION, 'batch_poll_interval',
+                                                   fallback=config['batch_poll_interval']),
+            'batch_timeout': parser.getfloat(configparser.UNNAMED_SECTION, 'batch_timeout',
+                                             fallback=config['batch_timeout']),
+            'batch_max_requests': parser.getint(configparser.UNNAMED_SECTION, 'batch_max_requests',
+                                                fallback=config['batch_max_requests'])
         })
 
     # Environment variables override config file
@@ -91,74 +258,218 @@ def get_config_from_file_or_env() -> Config:
         'debug': os.environ.get('DEBUG', config['debug']) in ('1', 'true', 'True'),
         'testing': os.environ.get('TESTING', config['testing']) in ('1', 'true', 'True'),
         'openai_api_key': os.environ.get('OPENAI_API_KEY', config['openai_api_key']),
-        'use_mac_keyring': os.environ.get('USE_MAC_KEYRING', config['use_mac_keyring']) in ('1', 'true', 'True')
+        'openai_base_url': os.environ.get('OPENAI_BASE_URL', config['openai_base_url']),
+        'openai_run_timeout': float(os.environ.get('OPENAI_RUN_TIMEOUT', config['openai_run_timeout'])),
+        'gemini_base_url': os.environ.get('GEMINI_BASE_URL', config['gemini_base_url']),
+        'use_mac_keyring': os.environ.get('USE_MAC_KEYRING', config['use_mac_keyring']) in ('1', 'true', 'True'),
+        'ocr_workers': int(os.environ.get('OCR_WORKERS', config['ocr_workers'])),
+        'ocr_batch_pages': int(os.environ.get('OCR_BATCH_PAGES', config['ocr_batch_pages'])),
+        'ocr_max_inflight_pages': int(os.environ.get('OCR_MAX_INFLIGHT_PAGES', config['ocr_max_inflight_pages'])),
+        'ocr_min_page_chars': int(os.environ.get('OCR_MIN_PAGE_CHARS', config['ocr_min_page_chars'])),
+        'ocr_dpi': int(os.environ.get('OCR_DPI', config['ocr_dpi'])),
+        'ocr_max_pixels': int(os.environ.get('OCR_MAX_PIXELS', config['ocr_max_pixels'])),
+        'ocr_preprocess': os.environ.get('OCR_PREPROCESS', config['ocr_preprocess']),
+        'ocr_blank_ink': float(os.environ.get('OCR_BLANK_INK', config['ocr_blank_ink'])),
+        'ocr_psm': int(os.environ.get('OCR_PSM', config['ocr_psm'])),
+        'ocr_oem': int(os.environ.get('OCR_OEM', config['ocr_oem'])),
+        'extract_workers': int(os.environ.get('EXTRACT_WORKERS', config['extract_workers'])),
+        'llm_workers': int(os.environ.get('LLM_WORKERS', config['llm_workers'])),
+        'finalize_workers': int(os.environ.get('FINALIZE_WORKERS', config['finalize_workers'])),
+        'queue_size': int(os.environ.get('QUEUE_SIZE', config['queue_size'])),
+        'settle_seconds': float(os.environ.get('SETTLE_SECONDS', config['settle_seconds'])),
+        'poll_interval': float(os.environ.get('POLL_INTERVAL', config['poll_interval'])),
+        'cache_enabled': str(os.environ.get('CACHE_ENABLED', config['cache_enabled'])) in ('1', 'true', 'True'),
+        'cache_max_entries': int(os.environ.get('CACHE_MAX_ENTRIES', config['cache_max_entries'])),
+        'cache_max_age_days': float(os.environ.get('CACHE_MAX_AGE_DAYS', config['cache_max_age_days'])),
+        'summary_chunk_chars': int(os.environ.get('SUMMARY_CHUNK_CHARS', config['summary_chunk_chars'])),
+        'summary_parallelism': int(os.environ.get('SUMMARY_PARALLELISM', config['summary_parallelism'])),
+        'combined_mode': str(os.environ.get('COMBINED_MODE', config['combined_mode'])) in ('1', 'true', 'True'),
+        'ollama_host': os.environ.get('OLLAMA_HOST', config['ollama_host']),
+        'ollama_connect_timeout': float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', config['ollama_connect_timeout'])),
+        'ollama_read_timeout': float(os.environ.get('OLLAMA_READ_TIMEOUT', config['ollama_read_timeout'])),
+        'ollama_keep_alive': os.environ.get('OLLAMA_KEEP_ALIVE', config['ollama_keep_alive']),
+        'ollama_options': os.environ.get('OLLAMA_OPTIONS', config['ollama_options']),
+        'ollama_stream': str(os.environ.get('OLLAMA_STREAM', config['ollama_stream'])) in ('1', 'true', 'True'),
+        'ollama_max_response_chars': int(os.environ.get('OLLAMA_MAX_RESPONSE_CHARS',
+                                                        config['ollama_max_response_chars'])),
+        'runner': os.environ.get('RUNNER', config['runner']),
+        'llm_concurrency': int(os.environ.get('LLM_CONCURRENCY', config['llm_concurrency'])),
+        'requests_per_minute': int(os.environ.get('REQUESTS_PER_MINUTE', config['requests_per_minute'])),
+        'tokens_per_minute': int(os.environ.get('TOKENS_PER_MINUTE', config['tokens_per_minute'])),
+        'adaptive_concurrency': str(os.environ.get('ADAPTIVE_CONCURRENCY',
+                                                   config['adaptive_concurrency'])) in ('1', 'true', 'True'),
+        'max_retries': int(os.environ.get('MAX_RETRIES', config['max_retries'])),
+        'retry_base_delay': float(os.environ.get('RETRY_BASE_DELAY', config['retry_base_delay'])),
+        'retry_max_delay': float(os.environ.get('RETRY_MAX_DELAY', config['retry_max_delay'])),
+        'upload_ttl': float(os.environ.get('UPLOAD_TTL', config['upload_ttl'])),
+        'shortlist_size': int(os.environ.get('SHORTLIST_SIZE', config['shortlist_size'])),
+        'fast_classify_threshold': float(os.environ.get('FAST_CLASSIFY_THRESHOLD',
+                                                        config['fast_classify_threshold'])),
+        'search_index': str(os.environ.get('SEARCH_INDEX', config['search_index'])) in ('1', 'true', 'True'),
+        'metrics': str(os.environ.get('METRICS', config['metrics'])) in ('1', 'true', 'True'),
+        'metrics_dir': os.environ.get('METRICS_DIR', config['metrics_dir']),
+        'job_queue': str(os.environ.get('JOB_QUEUE', config['job_queue'])) in ('1', 'true', 'True'),
+        'jobs_db': os.environ.get('JOBS_DB', config['jobs_db']),
+        'job_lease_seconds': float(os.environ.get('JOB_LEASE_SECONDS', config['job_lease_seconds'])),
+        'job_max_attempts': int(os.environ.get('JOB_MAX_ATTEMPTS', config['job_max_attempts'])),
+        'text_budget_chars': int(os.environ.get('TEXT_BUDGET_CHARS', config['text_budget_chars'])),
+        'text_budget_tokens': int(os.environ.get('TEXT_BUDGET_TOKENS', config['text_budget_tokens'])),
+        'fulltext_workers': int(os.environ.get('FULLTEXT_WORKERS', config['fulltext_workers'])),
+        'fulltext_nice': int(os.environ.get('FULLTEXT_NICE', config['fulltext_nice'])),
+        'batch_poll_interval': float(os.environ.get('BATCH_POLL_INTERVAL', config['batch_poll_interval'])),
+        'batch_timeout': float(os.environ.get('BATCH_TIMEOUT', config['batch_timeout'])),
+        'batch_max_requests': int(os.environ.get('BATCH_MAX_REQUESTS', config['batch_max_requests']))
     })
     logger.debug(f"Config: watch_folder={config['watch_folder']}, dest_folder={config['dest_folder']}")
     logger.debug(f"Config: model={config['model']}, debug={config['debug']}, testing={config['testing']}")
+    logger.debug(f"Config: ocr_workers={config['ocr_workers']}, extract_workers={config['extract_workers']}, "
+                 f"llm_workers={config['llm_workers']}, finalize_workers={config['finalize_workers']}, "
+                 f"queue_size={config['queue_size']}")
     # Validate required fields
     if not config['watch_folder'] or not config['dest_folder']:
         raise ValueError("watch_folder and dest_folder must be set in config file or environment")
+    if config['runner'] not in ('pipeline', 'async', 'batch'):
+        raise ValueError(f"runner must be 'pipeline', 'async' or 'batch', not '{config['runner']}'")
 
     return config
 
 
-def main():
+def jobs_path(config: Config) -> str:
+    """Return the path of the job queue database."""
+    return config['jobs_db'] or os.path.join(config['watch_folder'], '.ai_filer', 'jobs.sqlite')
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(prog='ai_filer', description='AI-powered document filing system.')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and process new documents as soon as they land in the watch folder')
+    parser.add_argument('--batch', action='store_true',
+                        help="submit the documents in the watch folder through the provider's batch API "
+                             "and wait for the results (same as runner = batch)")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('train', help='learn from the summaries and categories of already filed documents, '
+                                        'so similar documents are classified without an LLM call')
+    search_parser = subparsers.add_parser('search', help='full-text search the filed documents')
+    search_parser.add_argument('query', help='words to search for; FTS5 query syntax is supported')
+    search_parser.add_argument('--limit', type=int, default=10, help='maximum number of results')
+    subparsers.add_parser('reindex', help='rebuild the search index from the metadata of the filed documents')
+    jobs_parser = subparsers.add_parser('jobs', help='show how many documents in the job queue are at each status '
+                                                     'and stage')
+    jobs_parser.add_argument('--retry', action='store_true',
+                             help='make the documents that were given up or failed claimable again')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None):
     """Main function to run the AI filing system."""
 
+    args = parse_args(argv)
     setup_logger()
     config = get_config_from_file_or_env()
     setup_file_logger(config['watch_folder'])
     logger.info("Starting AI Filing System...")
+    if args.batch:
+        config['runner'] = 'batch'
+
+    if args.command == 'train':
+        train(config['dest_folder'], os.path.join(config['watch_folder'], '.ai_filer', 'classifier.json'),
+              workers=config['extract_workers'])
+        return
+
+    if args.command in ('search', 'reindex'):
+        index = SearchIndex(config['dest_folder'])
+        try:
+            if args.command == 'reindex':
+                index.reindex(workers=config['ocr_workers'])
+                return
+            for result in index.search(args.query, limit=args.limit):
+                print(f"{result.score:6.2f}  {result.path}")
+                print(f"        {result.category}: {result.snippet or result.summary}")
+        finally:
+            index.close()
+        return
+
+    if args.command == 'jobs':
+        jobs = JobQueue(jobs_path(config), config['watch_folder'])
+        try:
+            if args.retry:
+                print(f"Reset {jobs.retry()} documents")
+            for state, count in sorted(jobs.counts().items()):
+                print(f"{count:6d}  {state}")
+        finally:
+            jobs.close()
+        return
 
-    # Initialize AI
-    ai = AI(config)
+    # Metrics cover this run only
+    METRICS.reset()
 
     # Initialize FileManager
     file_manager = FileManager(config)
+    ai = None
+    jobs = None
+    fulltext = None
+    # Runs that find nothing to do leave the last real run's metrics in place
+    idle = False
 
     try:
-        pdf_files = file_manager.get_all_pdf_files_in_folder(config['watch_folder'])
+        if text_budget(config) or os.path.exists(backlog_path(config)):
+            # Documents filed with only their first pages' text get the rest later
+            fulltext = FullTextBacklog(backlog_path(config), config['dest_folder'])
+
+        if not args.daemon:
+            pdf_files = file_manager.get_all_pdf_files_in_folder(config['watch_folder'])
+            if not pdf_files:
+                # Cron runs usually find nothing; don't pay for the provider and filing tree
+                logger.info("No documents to process")
+                if fulltext and fulltext.count():
+                    complete_full_text(config, fulltext, file_manager)
+                else:
+                    idle = True
+                return
+
+        if config['job_queue']:
+            # Lets several workers share the watch folder, and resumes documents a crashed run left behind
+            jobs = JobQueue(jobs_path(config), config['watch_folder'],
+                            lease_seconds=config['job_lease_seconds'], max_attempts=config['job_max_attempts'])
+            jobs.prune()
+
+        # Initialize AI
+        ai = AI(config)
         tree = file_manager.get_tree_of_filing_system(config['dest_folder'])
 
-        for pdf_file in pdf_files:
-            try:
-                logger.info(f"Processing {os.path.basename(pdf_file)} with {ai.config['model']}")
-                
-                # Extract text from PDF - provider will handle the appropriate method
-                text = ai.extract_text_from_pdf(pdf_file)
-                
-                # Summarize the document - provider will use the appropriate method
-                summary = ai.summarize_document(text=text, pdf_file=pdf_file)
-                logger.info(f"Summary completed: {summary}")
-
-                # Classify
-                directory = ai.classify_document(summary, tree)
-                logger.info(f"Classification completed: {directory}")
-
-                # Generate filename
-                filename = ai.generate_filename(summary)
-                if filename:
-                    logger.info(f"Generated filename: {filename}")
-                    # Add OCR text and metadata before moving
-                    file_manager.add_metadata_to_pdf(
-                        pdf_file,
-                        {
-                            'OCRText': text,
-                            'Summary': summary,
-                            'Category': directory,
-                            'ProcessedDate': datetime.now().isoformat(),
-                            'Keywords': summary[:100]  # First 100 chars of summary as keywords
-                        }
-                    )
-                    file_manager.rename_and_move_file(pdf_file, filename, directory, 'pdf')
-
-            except Exception as e:
-                logger.error(f"Failed to process {pdf_file}: {str(e)}")
-                continue
+        if args.daemon:
+            # watchdog is only needed in daemon mode. Batches take too long for documents filed as they arrive,
+            # so the daemon always uses the pipeline
+            from .watcher import run_daemon
+
+            run_daemon(config, Pipeline(config, ai, file_manager, tree, jobs=jobs, fulltext=fulltext), file_manager)
+            return
+
+        if config['runner'] == 'async':
+            AsyncRunner(config, ai, file_manager, tree, jobs=jobs, fulltext=fulltext).run(pdf_files)
+        elif config['runner'] == 'batch':
+            BatchRunner(config, ai, file_manager, tree, jobs=jobs).run(pdf_files)
+        else:
+            Pipeline(config, ai, file_manager, tree, jobs=jobs, fulltext=fulltext).run(pdf_files)
+
+        if fulltext:
+            # Everything is filed; now extract the rest of the documents that were cut short
+            complete_full_text(config, fulltext, file_manager)
 
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
         sys.exit(1)
+    finally:
+        if ai:
+            ai.close()
+        if jobs:
+            jobs.close()
+        if fulltext:
+            fulltext.close()
+        file_manager.close()
+        if not idle:
+            write_metrics(config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from loguru import logger
+from .types import Config
+
+# Upper bounds of the histogram buckets, by unit
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+CHARS_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+# Batch jobs take minutes to a day
+BATCH_SECONDS_BUCKETS = (60, 300, 900, 1800, 3600, 7200, 14400, 28800, 43200, 86400)
+
+# name: (type, help, buckets)
+DEFINITIONS = {
+    'ai_filer_stage_seconds': ('histogram', 'Time a document spent in a pipeline stage.', SECONDS_BUCKETS),
+    'ai_filer_stage_documents_total': ('counter', 'Documents leaving a pipeline stage, by outcome.', None),
+    'ai_filer_llm_call_seconds': ('histogram', 'LLM call latency, including rate limit waits and retries.',
+                                  SECONDS_BUCKETS),
+    'ai_filer_llm_calls_total': ('counter', 'LLM calls, by outcome.', None),
+    'ai_filer_llm_prompt_chars': ('histogram', 'Size of LLM prompts in characters.', CHARS_BUCKETS),
+    'ai_filer_llm_response_chars': ('histogram', 'Size of LLM responses in characters.', CHARS_BUCKETS),
+    'ai_filer_llm_estimated_tokens_total': ('counter', 'Estimated tokens used by LLM calls (about 4 characters '
+                                                       'per token).', None),
+    'ai_filer_llm_retries_total': ('counter', 'LLM call attempts that failed and were retried.', None),
+    'ai_filer_batch_seconds': ('histogram', 'Time from submitting batch jobs to having all their results.',
+                               BATCH_SECONDS_BUCKETS),
+    'ai_filer_batch_requests_total': ('counter', 'Requests sent through a batch API, by outcome.', None),
+    'ai_filer_cache_requests_total': ('counter', 'Result cache lookups, by stage and result.', None),
+    'ai_filer_run_start_time_seconds': ('gauge', 'Unix time the current run started.', None),
+    'ai_filer_last_write_time_seconds': ('gauge', 'Unix time these metrics were written.', None),
+}
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket, like PromQL's histogram_quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    # Beyond the last bucket all we know is the lower bound
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms.
+
+    Series are identified by a metric name from ``DEFINITIONS`` and a set of
+    labels. The registry is exported in the Prometheus text format, for the
+    node_exporter textfile collector, and as a JSON summary of the run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop all series and start a new run."""
+        with self.lock:
+            self.values = {}
+            self.histograms = {}
+            self.started = time.time()
+            # Bumped on every update, so writers can skip unchanged metrics
+            self.version = 0
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter."""
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+            self.version += 1
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge."""
+        with self.lock:
+            self.values[(name, _labels_key(labels))] = value
+            self.version += 1
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in a histogram."""
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(DEFINITIONS[name][2])
+            histogram.observe(value)
+            self.version += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block in seconds, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def to_prometheus(self) -> str:
+        """Return all series in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            series = {}
+            for (name, key), value in self.values.items():
+                series.setdefault(name, []).append((key, value))
+            for (name, key), histogram in self.histograms.items():
+                series.setdefault(name, []).append((key, histogram))
+            for name in sorted(series):
+                kind, help_text, _ = DEFINITIONS.get(name, ('untyped', '', None))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in sorted(series[name], key=lambda item: item[0]):
+                    if not isinstance(value, Histogram):
+                        lines.append(f'{name}{_format_labels(key)} {_format_number(value)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                        cumulative += count
+                        le = (('le', _format_number(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(key, le)} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_number(value.sum)}')
+                    lines.append(f'{name}_count{_format_labels(key)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """Return a JSON-serializable summary of the run.
+
+        Histograms are reduced to count, sum, mean and estimated quantiles;
+        documents per second counts the documents that made it through the
+        finalize stage.
+        """
+        elapsed = time.time() - self.started
+        values = {'counter': {}, 'gauge': {}}
+        histograms = {}
+        with self.lock:
+            for (name, key), value in self.values.items():
+                kind = DEFINITIONS.get(name, ('counter',))[0]
+                values[kind].setdefault(name, []).append({**dict(key), 'value': value})
+            for (name, key), histogram in self.histograms.items():
+                histograms.setdefault(name, []).append({
+                    **dict(key),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'mean': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    'p50': round(histogram.quantile(0.5), 6),
+                    'p95': round(histogram.quantile(0.95), 6),
+                })
+            filed = sum(value for (name, key), value in self.values.items()
+                        if name == 'ai_filer_stage_documents_total'
+                        and ('stage', 'finalize') in key and ('status', 'ok') in key)
+        return {
+            'started': self.started,
+            'elapsed_seconds': round(elapsed, 3),
+            'documents_filed': filed,
+            'documents_per_second': round(filed / elapsed, 4) if elapsed > 0 else 0.0,
+            'counters': values['counter'],
+            'gauges': values['gauge'],
+            'histograms': histograms,
+        }
+
+
+# Process-wide registry that the pipeline, providers and cache report to
+METRICS = Metrics()
+
+
+def _write_atomic(path: str, data: str):
+    # The textfile collector may read at any moment, so never expose a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_metrics(config: Config, metrics: Metrics = METRICS):
+    """Write the metrics as ``ai_filer.prom`` and ``ai_filer.json`` to the metrics directory.
+
+    The directory is ``metrics_dir``, or ``.ai_filer`` in the watch folder
+    when that is not set. Failures are logged, never raised.
+    """
+    if not config['metrics']:
+        return
+    metrics_dir = config['metrics_dir'] or os.path.join(config['watch_folder'], '.ai_filer')
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        metrics.set('ai_filer_run_start_time_seconds', metrics.started)
+        metrics.set('ai_filer_last_write_time_seconds', time.time())
+        _write_atomic(os.path.join(metrics_dir, 'ai_filer.prom'), metrics.to_prometheus())
+        _write_atomic(os.path.join(metrics_dir, 'ai_filer.json'), json.dumps(metrics.summary(), indent=2))
+    except OSError as e:
+        logger.warning(f"Failed to write metrics to {metrics_dir}: {str(e)}")
@@ -0,0 +1,182 @@
+import os
+import stat
+import tempfile
+from io import BytesIO
+from loguru import logger
+
+# PyPDF2 is imported inside the functions: it takes a noticeable part of a
+# second to import, which runs that find nothing to file shouldn't pay
+
+# How far from the end of the file to look for the startxref keyword
+_TAIL_BYTES = 4096
+
+
+def _last_xref_offset(pdf) -> int:
+    """Return the offset of the last cross-reference section, or None if there is none."""
+    pdf.seek(0, os.SEEK_END)
+    size = pdf.tell()
+    pdf.seek(max(0, size - _TAIL_BYTES))
+    tail = pdf.read()
+    position = tail.rfind(b'startxref')
+    if position < 0:
+        return None
+    try:
+        return int(tail[position + len(b'startxref'):].split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _info_dictionary(reader, metadata: dict):
+    """Merge new metadata entries over the document's existing Info dictionary."""
+    from PyPDF2.generic import DictionaryObject, NameObject, create_string_object
+
+    info = DictionaryObject()
+    existing = reader.trailer.get('/Info')
+    if existing is not None:
+        info.update(existing.get_object())
+    for key, value in metadata.items():
+        info[NameObject(f'/{key}')] = create_string_object(str(value))
+    return info
+
+
+def read_info(file_path: str) -> dict:
+    """Return a PDF's Info dictionary as strings, keyed without the leading slash.
+
+    Only the trailer and Info dictionary are parsed, not the pages.
+    """
+    from PyPDF2 import PdfReader
+
+    with open(file_path, 'rb') as pdf:
+        metadata = PdfReader(pdf).metadata or {}
+        return {key.lstrip('/'): str(value) for key, value in metadata.items()}
+
+
+def incremental_update(pdf, metadata: dict) -> bytes:
+    """Build an incremental update that gives a PDF a new Info dictionary.
+
+    Only the new Info object, a one-entry cross-reference section and a
+    trailer pointing back at the previous section are written, so the cost
+    does not depend on the size or page count of the document. The xref
+    table and trailer are read without loading the file into memory.
+
+    Args:
+        pdf: The PDF, as a binary file object open for reading.
+        metadata (dict): Metadata entries, keyed without the leading slash.
+
+    Returns:
+        bytes: The update to append to the file, or None when the PDF can't
+            be updated incrementally (cross-reference streams, encryption or
+            a damaged trailer).
+    """
+    from PyPDF2 import PdfReader
+    from PyPDF2.generic import DictionaryObject, IndirectObject, NameObject, NumberObject
+
+    prev = _last_xref_offset(pdf)
+    if prev is None:
+        return None
+    pdf.seek(prev)
+    # Appending a classic xref table after a cross-reference stream is not
+    # read correctly by every viewer
+    if pdf.read(4) != b'xref':
+        return None
+
+    pdf.seek(0)
+    reader = PdfReader(pdf)
+    if reader.is_encrypted:
+        return None
+    trailer = reader.trailer
+    if '/Root' not in trailer or '/Size' not in trailer:
+        return None
+
+    pdf.seek(0, os.SEEK_END)
+    size = pdf.tell()
+    info_number = int(trailer['/Size'])
+
+    update = BytesIO()
+    update.write(b'\n')
+    info_offset = size + update.tell()
+    update.write(f'{info_number} 0 obj\n'.encode())
+    _info_dictionary(reader, metadata).write_to_stream(update, None)
+    update.write(b'\nendobj\n')
+
+    xref_offset = size + update.tell()
+    # Entries are exactly 20 bytes, including the two-character line end. The
+    # free-list head comes first, as many readers expect a section to start at 0
+    update.write(f'xref\n0 1\n0000000000 65535 f\r\n{info_number} 1\n{info_offset:010d} 00000 n\r\n'.encode())
+
+    new_trailer = DictionaryObject({
+        NameObject('/Size'): NumberObject(info_number + 1),
+        NameObject('/Root'): trailer.raw_get('/Root'),
+        NameObject('/Info'): IndirectObject(info_number, 0, reader),
+        NameObject('/Prev'): NumberObject(prev),
+    })
+    if '/ID' in trailer:
+        new_trailer[NameObject('/ID')] = trailer.raw_get('/ID')
+    update.write(b'trailer\n')
+    new_trailer.write_to_stream(update, None)
+    update.write(f'\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+    return update.getvalue()
+
+
+def write_rewritten(file_path: str, metadata: dict, output_file):
+    """Write a full copy of a PDF with added metadata to a binary file object.
+
+    Used when an incremental update is not possible.
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+
+    # Copy all pages
+    for page in reader.pages:
+        writer.add_page(page)
+    writer.add_metadata({f'/{k}': str(v) for k, v in metadata.items()})
+    writer.write(output_file)
+
+
+def rewrite_with_metadata(file_path: str, metadata: dict):
+    """Rewrite a whole PDF with added metadata, replacing the original atomically.
+
+    The new file is written next to the original and renamed over it, so a
+    crash leaves either the old or the new file, never a partial one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output_file:
+            write_rewritten(file_path, metadata, output_file)
+            # mkstemp creates the file owner-only; keep the original's permissions
+            os.fchmod(output_file.fileno(), stat.S_IMODE(os.stat(file_path).st_mode))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_metadata(file_path: str, metadata: dict):
+    """Add metadata to a PDF, appending an incremental update where possible.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        metadata (dict): Metadata entries, keyed without the leading slash.
+    """
+    with open(file_path, 'rb') as pdf:
+        update = incremental_update(pdf, metadata)
+
+    if update is None:
+        logger.debug(f"Can't update {os.path.basename(file_path)} incrementally, rewriting it")
+        rewrite_with_metadata(file_path, metadata)
+        return
+
+    with open(file_path, 'ab') as pdf:
+        size = pdf.tell()
+        try:
+            pdf.write(update)
+            pdf.flush()
+            os.fsync(pdf.fileno())
+        except BaseException:
+            # Don't leave a partial update behind
+            pdf.truncate(size)
+            raise
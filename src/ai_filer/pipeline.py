@@ -0,0 +1,257 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from loguru import logger
+from .ai import AI
+from .file_manager import FileManager
+from .fulltext import FullTextBacklog
+from .jobs import JobQueue
+from .metrics import METRICS
+from .types import Config, Document
+
+# Marker placed on a stage queue to tell one of its workers to exit
+_STOP = object()
+
+
+def file_document(file_manager: FileManager, doc: Document) -> str:
+    """Add metadata to a processed document and move it into the filing system.
+
+    Returns:
+        str: The path the document was filed at.
+    """
+    # The metadata-augmented copy is written straight into the filing system
+    return file_manager.file_pdf(
+        doc['pdf_file'],
+        doc['filename'],
+        doc['directory'],
+        {
+            'OCRText': doc['text'],
+            'Summary': doc['summary'],
+            'Category': doc['directory'],
+            'ProcessedDate': datetime.now().isoformat(),
+            'Keywords': doc['summary'][:100]  # First 100 chars of summary as keywords
+        }
+    )
+
+
+class Stage:
+    """A pool of worker threads consuming documents from a bounded queue."""
+
+    def __init__(self, name: str, handler, workers: int, queue_size: int, next_stage=None, done=None):
+        """Initialize the stage.
+
+        Args:
+            name (str): Name of the stage, used in log messages.
+            handler: Callable taking a Document. Returning False drops the document.
+            workers (int): Number of worker threads.
+            queue_size (int): Maximum number of documents waiting for this stage.
+            next_stage (Stage): Stage that receives documents after this one.
+            done: Callable taking a Document and a success flag, called when a
+                document leaves the pipeline at this stage.
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.next_stage = next_stage
+        self.done = done
+        self.threads = []
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, doc: Document):
+        """Queue a document, blocking while the stage is full."""
+        self.queue.put(doc)
+
+    def stop(self):
+        """Wait for queued documents to drain and stop the worker threads."""
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _run(self):
+        while True:
+            doc = self.queue.get()
+            if doc is _STOP:
+                return
+            try:
+                with METRICS.timer('ai_filer_stage_seconds', stage=self.name):
+                    keep = self.handler(doc)
+            except Exception as e:
+                # A failing document must never take down the stage
+                logger.error(f"Failed to process {doc['pdf_file']} in {self.name} stage: {str(e)}")
+                METRICS.inc('ai_filer_stage_documents_total', stage=self.name, status='failed')
+                self._finish(doc, False)
+                continue
+            status = 'dropped' if keep is False else 'ok'
+            METRICS.inc('ai_filer_stage_documents_total', stage=self.name, status=status)
+            if keep is False:
+                self._finish(doc, False)
+            elif self.next_stage:
+                self.next_stage.put(doc)
+            else:
+                self._finish(doc, True)
+
+    def _finish(self, doc: Document, ok: bool):
+        if self.done:
+            self.done(doc, ok)
+
+
+class Pipeline:
+    """Staged document processing pipeline.
+
+    Documents flow through three stages connected by bounded queues:
+
+    1. extract  - text extraction; local OCR runs in a process pool
+    2. llm      - summarize, classify and generate a filename
+    3. finalize - add metadata and move the file into the filing system
+
+    Each stage has its own configurable concurrency, so CPU-bound OCR and
+    I/O-bound LLM calls overlap instead of running one document at a time.
+
+    With a job queue, documents are claimed before they enter the pipeline
+    and each completed stage is recorded, so several pipelines (in other
+    processes or on other machines) can share a watch folder, and a
+    document whose worker crashed resumes after its last completed stage.
+
+    With a text budget, extraction stops once the LLM calls have enough
+    text, and documents cut short are recorded in the full-text backlog to
+    have their whole text extracted after filing.
+    """
+
+    def __init__(self, config: Config, ai: AI, file_manager: FileManager, tree, on_complete=None,
+                 jobs: JobQueue = None, fulltext: FullTextBacklog = None):
+        """Initialize the pipeline.
+
+        Args:
+            config (Config): The application config.
+            ai (AI): The AI used for extraction and LLM calls.
+            file_manager (FileManager): The file manager used to file documents.
+            tree: The filing system tree used for classification.
+            on_complete: Optional callable taking a PDF path and a success flag,
+                called once per submitted document when it leaves the pipeline.
+            jobs (JobQueue): Optional job queue to claim documents from.
+            fulltext (FullTextBacklog): Optional backlog to record documents
+                filed with only their first pages' text in.
+        """
+        self.config = config
+        self.ai = ai
+        self.file_manager = file_manager
+        self.tree = tree
+        self.on_complete = on_complete
+        self.jobs = jobs
+        self.fulltext = fulltext
+        self.ocr_pool = None
+
+        self.finalize_stage = Stage('finalize', self._finalize, config['finalize_workers'],
+                                    config['queue_size'], done=self._complete)
+        self.llm_stage = Stage('llm', self._run_llm, config['llm_workers'],
+                               config['queue_size'], self.finalize_stage, done=self._complete)
+        self.extract_stage = Stage('extract', self._extract, config['extract_workers'],
+                                   config['queue_size'], self.llm_stage, done=self._complete)
+        self.stages = [self.extract_stage, self.llm_stage, self.finalize_stage]
+
+    def start(self):
+        """Start the OCR process pool and all stage workers."""
+        self.ocr_pool = ProcessPoolExecutor(max_workers=self.config['ocr_workers'])
+        self.ai.set_ocr_executor(self.ocr_pool)
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def submit(self, pdf_file: str):
+        """Queue a PDF for processing, blocking while the pipeline is full."""
+        doc: Document = {'pdf_file': pdf_file}
+        if self.jobs:
+            doc = self.jobs.claim(pdf_file)
+            if doc is None:
+                logger.debug(f"Skipping {os.path.basename(pdf_file)}: done, failed or claimed by another worker")
+                if self.on_complete:
+                    self.on_complete(pdf_file, False)
+                return
+        self.extract_stage.put(doc)
+
+    def close(self):
+        """Wait for all queued documents to finish and shut the pipeline down."""
+        for stage in self.stages:
+            stage.stop()
+        self.ai.set_ocr_executor(None)
+        if self.ocr_pool:
+            self.ocr_pool.shutdown()
+            self.ocr_pool = None
+
+    def run(self, pdf_files: list[str]):
+        """Process a batch of PDF files and wait for them to finish."""
+        self.start()
+        try:
+            for pdf_file in pdf_files:
+                self.submit(pdf_file)
+        finally:
+            self.close()
+
+    def _complete(self, doc: Document, ok: bool):
+        if self.jobs:
+            self.jobs.finish(doc, ok)
+        if self.on_complete:
+            self.on_complete(doc['pdf_file'], ok)
+
+    def _checkpoint(self, doc: Document, stage: str):
+        """Record a completed stage, so a crash later on resumes after it."""
+        if self.jobs:
+            self.jobs.complete_stage(doc, stage)
+
+    def _extract(self, doc: Document):
+        if 'text' in doc:
+            # Resumed after an earlier worker extracted the text
+            return
+        logger.info(f"Processing {os.path.basename(doc['pdf_file'])} with {self.config['model']}")
+        # Extract text from PDF - provider will handle the appropriate method. Only the
+        # first pages are read when a text budget is set
+        doc['text'] = self.ai.extract_leading_text(doc['pdf_file'])
+        self._checkpoint(doc, 'extract')
+
+    def _run_llm(self, doc: Document):
+        if 'filename' in doc:
+            return
+        if self.config['combined_mode']:
+            # One structured call for summary, category and filename
+            doc['summary'], doc['directory'], doc['filename'] = self.ai.analyze_document(
+                doc['text'], doc['pdf_file'], self.tree)
+            logger.info(f"Analysis completed: {doc['summary']}")
+            logger.info(f"Classification completed: {doc['directory']}")
+            if not doc['filename']:
+                return False
+            logger.info(f"Generated filename: {doc['filename']}")
+            self._checkpoint(doc, 'llm')
+            return
+
+        # Summarize the document - provider will use the appropriate method
+        doc['summary'] = self.ai.summarize_document(text=doc['text'], pdf_file=doc['pdf_file'])
+        logger.info(f"Summary completed: {doc['summary']}")
+
+        # Classify
+        doc['directory'] = self.ai.classify_document(doc['summary'], self.tree)
+        logger.info(f"Classification completed: {doc['directory']}")
+
+        # Generate filename
+        doc['filename'] = self.ai.generate_filename(doc['summary'])
+        if not doc['filename']:
+            return False
+        logger.info(f"Generated filename: {doc['filename']}")
+        self._checkpoint(doc, 'llm')
+
+    def _finalize(self, doc: Document):
+        # Adding metadata changes the file, so let go of its uploads first
+        self.ai.release_document(doc['pdf_file'])
+        file_path = file_document(self.file_manager, doc)
+        self.ai.record_filing(doc['summary'], doc['directory'])
+        if self.fulltext and self.ai.is_partial_text(doc['text']):
+            self.fulltext.add(file_path)
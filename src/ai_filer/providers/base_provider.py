@@ -1,19 +1,131 @@
-import os
+import json
+import time
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
+from ai_filer.cache import load_prompt
+from ai_filer.metrics import METRICS
+from ai_filer.providers.ratelimit import RateLimiter
+
+# Structured-output contract for analyze_document
+DOCUMENT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'summary': {'type': 'string'},
+        'category': {'type': 'string'},
+        'filename': {'type': 'string'},
+    },
+    'required': ['summary', 'category', 'filename'],
+    'additionalProperties': False,
+}
+
+# Rounds of condensing chunk notes before the reduce prompt is cut to fit instead
+_MAX_CONDENSE_ROUNDS = 4
+
+class ProviderError(Exception):
+    """An LLM call failed, after any retries."""
+
 
 class BaseProvider(ABC):
-    """Base class for AI providers."""
+    """Base class for AI providers.
+
+    Every operation has a synchronous method and an ``a``-prefixed async
+    variant. The async variants default to running the synchronous method in
+    a thread; providers override ``_acall_llm`` and friends with their SDK's
+    native async client.
+
+    Providers implement ``_call_llm``, which raises on failure. The public
+    ``call_llm`` wraps it with the shared rate limiter, so every provider
+    gets the same quotas, retries and adaptive concurrency.
+    """
+
+    # Short provider name, used together with the model to key cached results
+    name = 'base'
+    # Whether extract_text_from_pdf reads pages lazily and takes a max_chars
+    # budget. Providers that hand the whole PDF to the model don't.
+    extracts_pages = False
 
     def __init__(self, config):
         """Initialize the provider with the specified config."""
         self.config = config
+        self.model = config['model']
+        # Text longer than this is summarized in chunks, map-reduce style
+        self.summary_chunk_chars = config['summary_chunk_chars']
+        # How many chunks of one document are summarized concurrently
+        self.summary_parallelism = max(1, config['summary_parallelism'])
+        self.limiter = RateLimiter(
+            self.name,
+            requests_per_minute=config['requests_per_minute'],
+            tokens_per_minute=config['tokens_per_minute'],
+            max_concurrency=config['llm_concurrency'],
+            adaptive=config['adaptive_concurrency'],
+            max_retries=config['max_retries'],
+            base_delay=config['retry_base_delay'],
+            max_delay=config['retry_max_delay'])
+        # Providers that take PDFs directly share one upload per document
+        self.uploads = None
+
+    @staticmethod
+    def load_prompt(name: str) -> str:
+        """Return a prompt template from the prompts directory, cached after the first read."""
+        return load_prompt(name)
+
+    def call_llm(self, prompt: str, schema: dict = None, **kwargs) -> str:
+        """Make a call to the LLM API, rate limited and retried.
+
+        Args:
+            prompt (str): The prompt to send.
+            schema (dict): Optional JSON schema the response must follow.
+
+        Raises:
+            ProviderError: If the call still fails after retrying.
+        """
+        return self._limited(lambda: self._call_llm(prompt, schema, **kwargs), prompt)
+
+    def _limited(self, func, prompt: str) -> str:
+        """Make one provider call through the rate limiter, recording it in the metrics.
+
+        Args:
+            func: Callable making one attempt at the call and returning the response text.
+            prompt (str): The prompt sent, used to estimate the tokens.
+
+        Raises:
+            ProviderError: If the call still fails after retrying.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.limiter.call(func, tokens=self.estimate_tokens(prompt))
+        except Exception as e:
+            self._record_call(start, prompt, None)
+            logger.error(f"Failed to call {self.name}: {str(e)}")
+            if isinstance(e, ProviderError):
+                raise
+            raise ProviderError(f"{self.name} call failed: {str(e)}") from e
+        self._record_call(start, prompt, response)
+        return response
+
+    def _record_call(self, start: float, prompt: str, response: str):
+        """Report an LLM call started at ``start`` to the metrics registry. ``response`` is None on failure."""
+        METRICS.observe('ai_filer_llm_call_seconds', time.perf_counter() - start, provider=self.name)
+        METRICS.inc('ai_filer_llm_calls_total', provider=self.name, status='error' if response is None else 'ok')
+        METRICS.observe('ai_filer_llm_prompt_chars', len(prompt), provider=self.name)
+        tokens = len(prompt) // 4
+        if response is not None:
+            METRICS.observe('ai_filer_llm_response_chars', len(response), provider=self.name)
+            tokens += len(response) // 4
+        METRICS.inc('ai_filer_llm_estimated_tokens_total', tokens, provider=self.name)
 
     @abstractmethod
-    def call_llm(self, prompt: str) -> str:
-        """Make a call to the LLM API."""
+    def _call_llm(self, prompt: str, schema: dict = None) -> str:
+        """Make a single call to the LLM API. Raises on failure."""
         pass
 
+    @staticmethod
+    def estimate_tokens(prompt: str) -> int:
+        """Roughly estimate the tokens a call uses: the prompt plus a short response."""
+        return len(prompt) // 4 + 256
+
     @abstractmethod
     def summarize_document(self, text: str = None, pdf_file: str = None) -> str:
         """Summarize a document's content."""
@@ -24,34 +136,214 @@ class BaseProvider(ABC):
         """Extract text from a PDF file."""
         pass
 
-    def classify_document(self, summary: str, tree: list[str]) -> str:
+    def set_ocr_executor(self, executor):
+        """Use the given process pool for local OCR. Remote providers ignore it."""
+        pass
+
+    def release_file(self, pdf_file: str):
+        """Delete the uploaded copy of a PDF, if the provider made one."""
+        if self.uploads:
+            self.uploads.release(pdf_file)
+
+    def close(self):
+        """Delete all remaining uploads."""
+        if self.uploads:
+            self.uploads.close()
+
+    async def acall_llm(self, prompt: str, schema: dict = None, **kwargs) -> str:
+        """Make an async call to the LLM API, rate limited and retried. See call_llm."""
+        return await self._alimited(lambda: self._acall_llm(prompt, schema, **kwargs), prompt)
+
+    async def _alimited(self, func, prompt: str) -> str:
+        """Async variant of _limited. ``func`` returns an awaitable."""
+        start = time.perf_counter()
+        try:
+            response = await self.limiter.acall(func, tokens=self.estimate_tokens(prompt))
+        except Exception as e:
+            self._record_call(start, prompt, None)
+            logger.error(f"Failed to call {self.name}: {str(e)}")
+            if isinstance(e, ProviderError):
+                raise
+            raise ProviderError(f"{self.name} call failed: {str(e)}") from e
+        self._record_call(start, prompt, response)
+        return response
+
+    async def _acall_llm(self, prompt: str, schema: dict = None, **kwargs) -> str:
+        """Make a single async call to the LLM API. Override with a native async client."""
+        return await asyncio.to_thread(self._call_llm, prompt, schema, **kwargs)
+
+    async def asummarize_document(self, text: str = None, pdf_file: str = None) -> str:
+        """Summarize a document's content asynchronously."""
+        return await asyncio.to_thread(self.summarize_document, text=text, pdf_file=pdf_file)
+
+    async def aextract_text_from_pdf(self, pdf_file: str) -> str:
+        """Extract text from a PDF file asynchronously."""
+        return await asyncio.to_thread(self.extract_text_from_pdf, pdf_file)
+
+    def summarize_text(self, text: str) -> str:
+        """Summarize extracted document text.
+
+        Text that fits in ``summary_chunk_chars`` is summarized with a single
+        call. Longer text is split into chunks that are summarized
+        concurrently, and the partial summaries are then reduced into the
+        final summary.
+        """
+        chunks = self.split_text(text)
+        if len(chunks) <= 1:
+            return self.call_llm(self.load_prompt('summarize_local.txt').replace('{{text}}', text))
+
+        logger.info(f"Summarizing document in {len(chunks)} chunks")
+        chunk_template = self.load_prompt('summarize_chunk.txt')
+        reduce_template = self.load_prompt('summarize_reduce.txt')
+
+        def summarize_chunk(chunk):
+            try:
+                return self.call_llm(chunk_template.replace('{{text}}', chunk))
+            except ProviderError:
+                # Already logged; _kept_notes reports the gap
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.summary_parallelism) as pool:
+            notes = self._kept_notes(list(pool.map(summarize_chunk, chunks)))
+
+            # Condense the notes in further rounds until they fit in a single reduce prompt
+            groups = self.split_text('\n\n'.join(notes))
+            for _ in range(_MAX_CONDENSE_ROUNDS):
+                if len(groups) <= 1:
+                    break
+                notes = self._kept_notes(list(pool.map(summarize_chunk, groups)))
+                groups = self.split_text('\n\n'.join(notes))
+
+        if not notes:
+            return None
+        return self.call_llm(reduce_template.replace('{{text}}', self._reduce_input(notes)))
+
+    async def asummarize_text(self, text: str) -> str:
+        """Summarize extracted document text asynchronously. See summarize_text."""
+        chunks = self.split_text(text)
+        if len(chunks) <= 1:
+            return await self.acall_llm(self.load_prompt('summarize_local.txt').replace('{{text}}', text))
+
+        logger.info(f"Summarizing document in {len(chunks)} chunks")
+        chunk_template = self.load_prompt('summarize_chunk.txt')
+        reduce_template = self.load_prompt('summarize_reduce.txt')
+        semaphore = asyncio.Semaphore(self.summary_parallelism)
+
+        async def summarize_chunk(chunk):
+            async with semaphore:
+                try:
+                    return await self.acall_llm(chunk_template.replace('{{text}}', chunk))
+                except ProviderError:
+                    return None
+
+        notes = self._kept_notes(await asyncio.gather(*map(summarize_chunk, chunks)))
+
+        # Condense the notes in further rounds until they fit in a single reduce prompt
+        groups = self.split_text('\n\n'.join(notes))
+        for _ in range(_MAX_CONDENSE_ROUNDS):
+            if len(groups) <= 1:
+                break
+            notes = self._kept_notes(await asyncio.gather(*map(summarize_chunk, groups)))
+            groups = self.split_text('\n\n'.join(notes))
+
+        if not notes:
+            return None
+        return await self.acall_llm(reduce_template.replace('{{text}}', self._reduce_input(notes)))
+
+    @staticmethod
+    def _kept_notes(results: list[str]) -> list[str]:
+        """Return the chunk notes that were produced, warning about the chunks the summary will leave out."""
+        notes = [note for note in results if note]
+        if len(notes) < len(results):
+            logger.warning(f"{len(results) - len(notes)} of {len(results)} chunks could not be summarized; "
+                           f"the summary leaves them out")
+        return notes
+
+    def _reduce_input(self, notes: list[str]) -> str:
+        """Join the notes for the reduce prompt, cut to the chunk size if condensing didn't get them there."""
+        text = '\n\n'.join(notes)
+        limit = self.summary_chunk_chars
+        if limit and len(text) > limit:
+            logger.warning(f"Notes still {len(text)} characters after {_MAX_CONDENSE_ROUNDS} rounds of "
+                           f"condensing; summarizing the first {limit}")
+            text = text[:limit]
+        return text
+
+    def split_text(self, text: str) -> list[str]:
+        """Split text into chunks of at most ``summary_chunk_chars``, on page or paragraph breaks where possible."""
+        limit = self.summary_chunk_chars
+        if not limit or len(text) <= limit:
+            return [text]
+
+        chunks = []
+        current = ''
+        for paragraph in text.split('\n\n'):
+            if not paragraph.strip():
+                continue
+            # A single paragraph longer than the limit is split hard
+            while len(paragraph) > limit:
+                if current:
+                    chunks.append(current)
+                    current = ''
+                chunks.append(paragraph[:limit])
+                paragraph = paragraph[limit:]
+            if current and len(current) + 2 + len(paragraph) > limit:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def classify_document(self, summary: str, tree) -> str:
         """Classify a document based on its summary."""
-        prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'classify.txt')
-        with open(prompt_path, 'r') as f:
-            prompt_template = f.read()
+        category = self.call_llm(self._classify_prompt(summary, tree))
+        return self._check_category(category, tree)
+
+    async def aclassify_document(self, summary: str, tree) -> str:
+        """Classify a document based on its summary asynchronously."""
+        category = await self.acall_llm(self._classify_prompt(summary, tree))
+        return self._check_category(category, tree)
+
+    def _classify_prompt(self, summary: str, tree) -> str:
+        prompt_template = self.load_prompt('classify.txt')
 
         # Apply both replacements to the template
-        prompt = prompt_template.replace('{{directories}}', tree)
-        prompt = prompt.replace('{{summary}}', summary)
+        prompt = prompt_template.replace('{{directories}}', tree.as_prompt())
+        return prompt.replace('{{summary}}', summary)
 
-        category = self.call_llm(prompt)
+    def _check_category(self, category: str, tree) -> str:
+        if category is None:
+            raise ValueError("LLM returned no category")
+        # Models sometimes echo the quotes from the directory list
+        category = category.strip().strip('"').strip()
 
         # Validate the category is in our tree or is "Unsorted"
-        if category not in tree and category != "Unsorted":
+        if not self.is_valid_category(category, tree):
             logger.warning(f"LLM returned invalid category '{category}', using 'Unsorted'")
             return "Unsorted"
 
         return category
 
+    @staticmethod
+    def is_valid_category(category: str, tree) -> bool:
+        """Return whether a category is exactly a directory in the tree or is "Unsorted"."""
+        return category == "Unsorted" or category in tree
+
     def generate_filename(self, text: str) -> str:
         """Generate a descriptive filename for a document."""
-        prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'describe.txt')
-        with open(prompt_path, 'r') as f:
-            prompt_template = f.read()
+        return self.clean_filename(self.call_llm(self._filename_prompt(text)))
 
-        prompt = prompt_template.replace('{{text}}', text)
-        filename = self.call_llm(prompt)
+    async def agenerate_filename(self, text: str) -> str:
+        """Generate a descriptive filename for a document asynchronously."""
+        return self.clean_filename(await self.acall_llm(self._filename_prompt(text)))
 
+    def _filename_prompt(self, text: str) -> str:
+        return self.load_prompt('describe.txt').replace('{{text}}', text)
+
+    @staticmethod
+    def clean_filename(filename: str) -> str:
+        """Truncate an over-long filename and strip problematic characters."""
         if filename and len(filename) > 100:
             logger.warning(f"Generated filename too long, truncating: {filename}")
             filename = filename[:50]
@@ -60,4 +352,60 @@ class BaseProvider(ABC):
             # Remove any potentially problematic characters while preserving spaces
             filename = ''.join(c for c in filename if c.isalnum() or c in '- ')
 
-        return filename 
\ No newline at end of file
+        return filename
+
+    def analyze_document(self, text: str, tree) -> dict:
+        """Summarize, classify and name a document with a single structured LLM call.
+
+        Fields that are missing or fail validation are returned as None so the
+        caller can fall back to the individual per-step calls for just those.
+
+        Returns:
+            dict: The ``summary``, ``category`` and ``filename`` of the document.
+        """
+        try:
+            response = self.call_llm(self._analyze_prompt(text, tree), schema=DOCUMENT_SCHEMA)
+        except ProviderError:
+            # Every field falls back to its own call
+            response = None
+        return self._parse_analysis(response, tree)
+
+    async def aanalyze_document(self, text: str, tree) -> dict:
+        """Summarize, classify and name a document with a single structured LLM call asynchronously."""
+        try:
+            response = await self.acall_llm(self._analyze_prompt(text, tree), schema=DOCUMENT_SCHEMA)
+        except ProviderError:
+            # Every field falls back to its own call
+            response = None
+        return self._parse_analysis(response, tree)
+
+    def _analyze_prompt(self, text: str, tree) -> str:
+        prompt = self.load_prompt('analyze.txt').replace('{{directories}}', tree.as_prompt())
+        return prompt.replace('{{text}}', text)
+
+    def _parse_analysis(self, response: str, tree) -> dict:
+        result = {'summary': None, 'category': None, 'filename': None}
+
+        try:
+            # Some models wrap JSON in a markdown code fence despite the schema
+            data = json.loads(response.strip().removeprefix('```json').strip('`'))
+        except (AttributeError, ValueError):
+            logger.warning(f"LLM returned invalid JSON for combined analysis: {response}")
+            return result
+        if not isinstance(data, dict):
+            logger.warning(f"LLM returned invalid JSON for combined analysis: {response}")
+            return result
+
+        if isinstance(data.get('summary'), str) and data['summary'].strip():
+            result['summary'] = data['summary'].strip()
+
+        category = data.get('category')
+        if isinstance(category, str) and self.is_valid_category(category.strip(), tree):
+            result['category'] = category.strip()
+        else:
+            logger.warning(f"LLM returned invalid category '{category}' in combined analysis")
+
+        if isinstance(data.get('filename'), str):
+            result['filename'] = self.clean_filename(data['filename'].strip()) or None
+
+        return result
@@ -0,0 +1,143 @@
+import time
+from abc import ABC, abstractmethod
+from loguru import logger
+from ai_filer.metrics import METRICS
+from ai_filer.providers.base_provider import ProviderError
+
+# Cancelled batch jobs are polled for this long, for the requests they finished before they stopped
+_BATCH_CANCEL_GRACE = 600
+
+
+class BatchAPI(ABC):
+    """Mixin for providers with a batch API, used by the batch runner.
+
+    Providers list it before BaseProvider and implement submitting,
+    polling, cancelling and cleaning up one batch job; ``run_batch``
+    splits the requests into jobs and waits for them. The prompts and the
+    validation of the responses are the ones the online calls use.
+    """
+
+    def run_batch(self, requests: dict[str, tuple[str, str]]) -> dict[str, str]:
+        """Run prompts through the provider's batch API and wait for the results.
+
+        Requests are submitted as batch jobs of up to ``batch_max_requests``
+        each, which are then polled every ``batch_poll_interval`` seconds
+        until they have all finished. Jobs still running after
+        ``batch_timeout`` seconds are cancelled, and polled until they stop
+        for the requests they finished.
+
+        Args:
+            requests (dict[str, tuple[str, str]]): The prompt, and the PDF to
+                attach or None, of each request by key.
+
+        Returns:
+            dict[str, str]: The response of each request that succeeded, by key.
+
+        Raises:
+            ProviderError: If a batch job could not be submitted.
+        """
+        poll_interval = self.config['batch_poll_interval']
+        timeout = self.config['batch_timeout']
+        max_requests = max(1, self.config['batch_max_requests'])
+        keys = list(requests)
+        start = time.perf_counter()
+        batches = []
+        results = {}
+        try:
+            for first in range(0, len(keys), max_requests):
+                chunk = {key: requests[key] for key in keys[first:first + max_requests]}
+                try:
+                    batches.append(self._submit_batch(chunk))
+                except Exception as e:
+                    raise ProviderError(f"Failed to submit {self.name} batch: {str(e)}") from e
+            logger.info(f"Submitted {len(keys)} requests to {self.name} in {len(batches)} batch jobs")
+
+            deadline = time.monotonic() + timeout
+            running = list(batches)
+            cancelled = False
+            while running:
+                for batch in list(running):
+                    try:
+                        batch_results = self._poll_batch(batch)
+                    except Exception as e:
+                        # The requests of a failed job are missing from the results, like failed requests
+                        logger.error(f"{self.name} batch job failed: {str(e)}")
+                        running.remove(batch)
+                        continue
+                    if batch_results is not None:
+                        results.update(batch_results)
+                        running.remove(batch)
+                if not running:
+                    break
+                if time.monotonic() > deadline:
+                    if cancelled:
+                        logger.error(f"Giving up on {len(running)} {self.name} batch jobs that did not stop")
+                        break
+                    logger.error(f"Cancelling {len(running)} {self.name} batch jobs after {timeout}s")
+                    for batch in running:
+                        try:
+                            self._cancel_batch(batch)
+                        except Exception as e:
+                            logger.warning(f"Failed to cancel {self.name} batch job: {str(e)}")
+                    cancelled = True
+                    deadline = time.monotonic() + _BATCH_CANCEL_GRACE
+                time.sleep(poll_interval)
+        finally:
+            for batch in batches:
+                self._finish_batch(batch)
+
+        METRICS.observe('ai_filer_batch_seconds', time.perf_counter() - start, provider=self.name)
+        METRICS.inc('ai_filer_batch_requests_total', len(results), provider=self.name, status='ok')
+        METRICS.inc('ai_filer_batch_requests_total', len(keys) - len(results), provider=self.name, status='error')
+        logger.info(f"{len(results)} of {len(keys)} {self.name} batch requests succeeded")
+        return results
+
+    @abstractmethod
+    def _submit_batch(self, requests: dict[str, tuple[str, str]]):
+        """Submit one batch job. Returns whatever _poll_batch needs to find it again."""
+        pass
+
+    @abstractmethod
+    def _poll_batch(self, batch) -> dict[str, str] | None:
+        """Return the responses of a finished batch job by key, or None while it is still running."""
+        pass
+
+    @abstractmethod
+    def _cancel_batch(self, batch):
+        """Cancel a batch job that is still running."""
+        pass
+
+    @abstractmethod
+    def _finish_batch(self, batch):
+        """Delete the files a batch job used. Must not raise."""
+        pass
+
+    def batch_request(self, stage: str, text: str = None, pdf_file: str = None, tree=None) -> tuple[str, str]:
+        """Return the prompt, and the PDF to attach or None, of a stage's request in a batch.
+
+        Args:
+            stage (str): ``extract`` or ``summarize``, which read the PDF,
+                or ``classify`` or ``filename``, which read ``text`` (the summary).
+            text (str): The text the prompt is about.
+            pdf_file (str): The PDF the prompt is about.
+            tree: The directories to classify into.
+        """
+        if stage == 'extract':
+            return self.load_prompt('perform_ocr.txt'), pdf_file
+        if stage == 'summarize':
+            return self.load_prompt('summarize.txt').split('{{text}}')[0].strip(), pdf_file
+        if stage == 'classify':
+            return self._classify_prompt(text, tree), None
+        if stage == 'filename':
+            return self._filename_prompt(text), None
+        raise ValueError(f"No batch request for stage {stage}")
+
+    def batch_result(self, stage: str, response: str, tree=None) -> str:
+        """Validate the response to a batch request the way the online call would."""
+        if not response or not response.strip():
+            raise ValueError("empty response")
+        if stage == 'classify':
+            return self._check_category(response, tree)
+        if stage == 'filename':
+            return self.clean_filename(response.strip())
+        return response.strip()
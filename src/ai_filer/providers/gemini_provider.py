@@ -1,14 +1,32 @@
 import os
 from loguru import logger
 from google import genai
-from ai_filer.providers.base_provider import BaseProvider
+from ai_filer.providers.base_provider import BaseProvider, ProviderError
+from ai_filer.providers.batch_api import BatchAPI
+from ai_filer.providers.uploads import UploadManager
 
-class GeminiProvider(BaseProvider):
+# Gemini deletes uploaded files after 48 hours; stop using them a little earlier
+FILE_MAX_AGE = 47 * 60 * 60
+
+# Batch job states after which the results are final
+BATCH_DONE = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED')
+BATCH_FAILED = ('JOB_STATE_FAILED',)
+
+
+class GeminiProvider(BatchAPI, BaseProvider):
     """Provider for Google Gemini API."""
 
+    name = 'gemini'
+
     def __init__(self, config):
         """Initialize the Gemini provider with the specified config."""
         super().__init__(config)
+        self.model = "gemini-2.0-flash"
+        # Alternative API endpoint, such as a proxy or a local stub; None uses the SDK default
+        self.http_options = {'base_url': config['gemini_base_url']} if config['gemini_base_url'] else None
+        self.uploads = UploadManager(self.name, lambda pdf_file: self.client.files.upload(file=pdf_file),
+                                     lambda file: self.client.files.delete(name=file.name),
+                                     ttl=config['upload_ttl'], max_age=FILE_MAX_AGE)
         
         if config.get('use_mac_keyring', True):
             self._initialize_from_keyring()
@@ -33,7 +51,7 @@ class GeminiProvider(BaseProvider):
         if not self.api_key:
             raise ValueError("Gemini API key not found in keyring")
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = genai.Client(api_key=self.api_key, http_options=self.http_options)
         except Exception as e:
             raise Exception(f"Failed to create Gemini client: {str(e)}")
 
@@ -43,71 +61,146 @@ class GeminiProvider(BaseProvider):
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable must be set")
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = genai.Client(api_key=self.api_key, http_options=self.http_options)
         except ImportError:
             raise ImportError("Please install the google-genai package to use Gemini")
 
-    def call_llm(self, prompt: str) -> str:
+    def _call_llm(self, prompt: str, schema: dict = None) -> str:
         """Make a call to the Gemini API."""
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=[prompt],
+            config=self._generation_config(schema)
+        )
+        return response.text.strip()
+
+    async def _acall_llm(self, prompt: str, schema: dict = None) -> str:
+        """Make an async call to the Gemini API."""
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=[prompt],
+            config=self._generation_config(schema)
+        )
+        return response.text.strip()
+
+    @staticmethod
+    def _generation_config(schema: dict = None) -> dict:
+        if schema:
+            # Structured output: constrain the response to the JSON schema
+            return {'response_mime_type': 'application/json', 'response_json_schema': schema}
+        return None
+
+    def _submit_batch(self, requests: dict[str, tuple[str, str]]) -> dict:
+        """Upload the PDFs and create a batch job with the requests inlined."""
+        batch = {'name': None, 'keys': list(requests), 'files': []}
+        uploads = {}
+        inlined = []
         try:
-            model = "gemini-2.0-flash"
-            response = self.client.models.generate_content(
-                model=model,
-                contents=[prompt]
-            )
-            return response.text.strip()
-        except Exception as e:
-            logger.error(f"Failed to call Gemini: {str(e)}")
+            for key, (prompt, pdf_file) in requests.items():
+                parts = [{'text': prompt}]
+                if pdf_file:
+                    if pdf_file not in uploads:
+                        uploads[pdf_file] = self.client.files.upload(file=pdf_file)
+                        batch['files'].append(uploads[pdf_file].name)
+                    parts.append({'file_data': {'file_uri': uploads[pdf_file].uri, 'mime_type': 'application/pdf'}})
+                inlined.append({'contents': [{'role': 'user', 'parts': parts}], 'metadata': {'key': key}})
+
+            batch['name'] = self.client.batches.create(model=self.model, src=inlined,
+                                                       config={'display_name': 'ai_filer'}).name
+        except BaseException:
+            self._finish_batch(batch)
+            raise
+        logger.debug(f"Created Gemini batch {batch['name']} with {len(inlined)} requests")
+        return batch
+
+    def _poll_batch(self, batch: dict) -> dict[str, str] | None:
+        """Return the responses of a finished batch job, or None while it runs."""
+        job = self.client.batches.get(name=batch['name'])
+        state = job.state.name if job.state else ''
+        if state in BATCH_FAILED:
+            raise ProviderError(f"Gemini batch {job.name} failed: {job.error}")
+        if state not in BATCH_DONE:
             return None
 
+        results = {}
+        responses = job.dest.inlined_responses if job.dest else None
+        for index, inlined in enumerate(responses or []):
+            # Responses come back in request order; the metadata says so explicitly where it is echoed
+            key = (inlined.metadata or {}).get('key') or batch['keys'][index]
+            if inlined.error or not inlined.response or not inlined.response.text:
+                logger.warning(f"Gemini batch request {key} failed: {inlined.error}")
+                continue
+            results[key] = inlined.response.text
+        return results
+
+    def _cancel_batch(self, batch: dict):
+        """Cancel a running batch job."""
+        self.client.batches.cancel(name=batch['name'])
+
+    def _finish_batch(self, batch: dict):
+        """Delete the uploaded PDFs."""
+        for name in batch['files']:
+            try:
+                self.client.files.delete(name=name)
+            except Exception as e:
+                logger.warning(f"Failed to delete Gemini file {name}: {str(e)}")
+
     def summarize_document(self, text: str = None, pdf_file: str = None) -> str:
         """Summarize a document's content."""
         if pdf_file:
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'summarize.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            return self._summarize_with_pdf(prompt, pdf_file)
+            return self._summarize_with_pdf(self.load_prompt('summarize.txt'), pdf_file)
         
         if text:
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'summarize_local.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            prompt = prompt.replace('{{text}}', text)
-            return self.call_llm(prompt)
+            return self.summarize_text(text)
         
         raise ValueError("Either text or pdf_file must be provided")
 
-    def _summarize_with_pdf(self, prompt: str, pdf_file: str) -> str:
-        """Summarize a PDF document using Gemini's API."""
-        try:
-            model = "gemini-2.0-flash"
-            staged_pdf = self.client.files.upload(file=pdf_file)
+    async def asummarize_document(self, text: str = None, pdf_file: str = None) -> str:
+        """Summarize a document's content asynchronously."""
+        if pdf_file:
+            return await self._agenerate_with_pdf(self.load_prompt('summarize.txt'), pdf_file)
+
+        if text:
+            return await self.asummarize_text(text)
+
+        raise ValueError("Either text or pdf_file must be provided")
+
+    def _generate_with_pdf(self, prompt: str, pdf_file: str) -> str:
+        """Upload a PDF and run a prompt against it, rate limited and retried.
+
+        Raises:
+            ProviderError: If the call still fails after retrying.
+        """
+        def generate():
             response = self.client.models.generate_content(
-                model=model,
-                contents=[prompt, staged_pdf]
+                model=self.model,
+                contents=[prompt, self.uploads.get(pdf_file)]
             )
-            return response.text.strip()
-        except Exception as e:
-            logger.error(f"Failed to summarize with Gemini: {str(e)}")
-            return None
+            return (response.text or '').strip()
+
+        return self._limited(generate, prompt)
+
+    async def _agenerate_with_pdf(self, prompt: str, pdf_file: str) -> str:
+        """Async variant of _generate_with_pdf, using the async client."""
+        async def generate():
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=[prompt, await self.uploads.aget(pdf_file)]
+            )
+            return (response.text or '').strip()
+
+        return await self._alimited(generate, prompt)
+
+    def _summarize_with_pdf(self, prompt: str, pdf_file: str) -> str:
+        """Summarize a PDF document using Gemini's API."""
+        return self._generate_with_pdf(prompt, pdf_file)
 
     def extract_text_from_pdf(self, pdf_file: str) -> str:
         """Extract text from a PDF file using Gemini."""
-        try:
-            # Load the OCR prompt
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'perform_ocr.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            
-            logger.info("Extracting text from PDF using Gemini")
-            
-            model = "gemini-2.0-flash"
-            staged_pdf = self.client.files.upload(file=pdf_file)
-            response = self.client.models.generate_content(
-                model=model,
-                contents=[prompt, staged_pdf]
-            )
-            return response.text.strip()
-        except Exception as e:
-            logger.error(f"Failed to extract text with Gemini: {str(e)}")
-            return "" 
\ No newline at end of file
+        logger.info("Extracting text from PDF using Gemini")
+        return self._generate_with_pdf(self.load_prompt('perform_ocr.txt'), pdf_file)
+
+    async def aextract_text_from_pdf(self, pdf_file: str) -> str:
+        """Extract text from a PDF file using Gemini asynchronously."""
+        logger.info("Extracting text from PDF using Gemini")
+        return await self._agenerate_with_pdf(self.load_prompt('perform_ocr.txt'), pdf_file)
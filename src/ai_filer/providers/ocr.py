@@ -1,66 +1,282 @@
+import os
+import re
+import tempfile
+from collections import deque
 from loguru import logger
+from ai_filer.providers.preprocess import parse_steps
+
+# An inline image in a content stream: the BI and ID operators as tokens, not inside a string like (BILL)
+_INLINE_IMAGE = re.compile(rb'(?:^|[\s\])>])BI[\s/].*?[\s\])>]ID\s', re.DOTALL)
+
+
+def _has_images(resources, depth: int = 0) -> bool:
+    """Return whether a resource dictionary draws any image XObjects, including inside forms."""
+    if not resources:
+        return False
+    xobjects = resources.get_object().get('/XObject')
+    if not xobjects:
+        return False
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        if xobject.get('/Subtype') == '/Image':
+            return True
+        if xobject.get('/Subtype') == '/Form' and depth < 3 and _has_images(xobject.get('/Resources'), depth + 1):
+            return True
+    return False
+
+
+def _extract_text_layer(pdf_file: str, min_page_chars: int, first: int = 1,
+                        last: int = None) -> tuple[list[tuple[str, bool, float]], int]:
+    """Extract the embedded text of a range of pages with PyPDF2. Runs in a worker process when pooled.
+
+    Args:
+        pdf_file (str): Path to the PDF file.
+        min_page_chars (int): Image pages with less text than this need OCR.
+        first (int): First page, 1-based.
+        last (int): Last page, inclusive. Defaults to the last page of the document.
+
+    Returns:
+        tuple[list[tuple[str, bool, float]], int]: Per page in the range, the
+            embedded text, whether the page needs OCR because it shows an
+            image but has too little text, and the length of its longer side
+            in points; and the page count of the document.
+    """
+    import PyPDF2
+
+    pages = []
+    with open(pdf_file, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        # Pages are parsed on access, so pages outside the range cost nothing
+        for index in range(first - 1, min(page_count, last or page_count)):
+            page = pdf_reader.pages[index]
+            text = page.extract_text() or ""
+            needs_ocr = False
+            if len(text.strip()) < min_page_chars:
+                contents = page.get_contents()
+                # Inline images (BI ... EI) are not XObjects, so look for them in the content stream too
+                needs_ocr = _has_images(page.get('/Resources')) or bool(
+                    contents and _INLINE_IMAGE.search(contents.get_data()))
+            box = page.mediabox
+            pages.append((text, needs_ocr, float(max(abs(box.width), abs(box.height)))))
+    return pages, page_count
+
+
+def _ocr_page(image_path: str, steps: tuple[str, ...] = (), max_pixels: int = 0, blank_ink: float = 0.0,
+              tesseract_config: str = '') -> str:
+    """Preprocess and OCR a single rendered page image. Runs in a worker process when pooled.
+
+    Blank pages are not OCRed and give an empty string.
+    """
+    import pytesseract
+    from PIL import Image
+    from ai_filer.providers.preprocess import preprocess
+
+    with Image.open(image_path) as image:
+        image = preprocess(image, steps, max_pixels=max_pixels, blank_ink=blank_ink)
+        if image is None:
+            return ''
+        return pytesseract.image_to_string(image, config=tesseract_config)
+
+
+def _contiguous_runs(page_numbers: list[int], key=None) -> list[tuple[int, int]]:
+    """Group ascending page numbers into (first, last) runs of consecutive pages.
+
+    With ``key``, a run also ends where the key of the next page differs.
+    """
+    runs = []
+    for page_num in page_numbers:
+        if runs and runs[-1][1] == page_num - 1 and (key is None or key(page_num) == key(runs[-1][0])):
+            runs[-1] = (runs[-1][0], page_num)
+        else:
+            runs.append((page_num, page_num))
+    return runs
+
 
 class OCR:
-    """Class to handle OCR (Optical Character Recognition) operations."""
-    
-    @staticmethod
-    def extract_text_from_pdf(pdf_file: str) -> str:
+    """Class to handle OCR (Optical Character Recognition) operations.
+
+    Each page is classified on its own: pages with an embedded text layer
+    keep it, and only image pages with too little text are OCRed. Those are
+    rendered to temporary image files a few at a time and OCRed in parallel,
+    so memory use is bounded by the number of pages in flight rather than by
+    the page count of the document.
+
+    Pages are rendered at ``ocr_dpi``, lowered for oversized pages (such as
+    phone photos saved as PDF) so the longer side stays within
+    ``ocr_max_pixels``. Rendered pages are cleaned up by the
+    ``ocr_preprocess`` steps before Tesseract sees them, and blank pages are
+    skipped.
+    """
+
+    def __init__(self, config, executor=None):
+        """Initialize the OCR engine.
+
+        Args:
+            config (Config): The application config.
+            executor: Optional process pool to run the CPU-bound work in.
+                When not set, all work runs in the calling thread.
+        """
+        self.executor = executor
+        self.batch_pages = max(1, config['ocr_batch_pages'])
+        self.max_inflight_pages = max(1, config['ocr_max_inflight_pages'])
+        self.min_page_chars = config['ocr_min_page_chars']
+        self.dpi = config['ocr_dpi']
+        self.max_pixels = config['ocr_max_pixels']
+        self.blank_ink = config['ocr_blank_ink']
+        self.steps = parse_steps(config['ocr_preprocess'])
+        self.tesseract_config = f"--psm {config['ocr_psm']} --oem {config['ocr_oem']}"
+
+    def _run(self, func, *args):
+        if self.executor:
+            return self.executor.submit(func, *args)
+        return _Done(func(*args))
+
+    def extract_text_from_pdf(self, pdf_file: str, max_chars: int = 0) -> str:
         """Extract text from a PDF file using local OCR tools.
-        
+
         Args:
             pdf_file (str): Path to the PDF file.
-            
+            max_chars (int): Stop after the page that reaches this many
+                characters and cut the text there. 0 extracts every page.
+
         Returns:
             str: The extracted text from the PDF.
         """
         try:
-            # Use PyPDF2 for basic text extraction
-            import PyPDF2
-            
-            text_content = ""
-            with open(pdf_file, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                num_pages = len(pdf_reader.pages)
-                
-                # Extract text from each page
-                for page_num in range(num_pages):
-                    page = pdf_reader.pages[page_num]
-                    text_content += page.extract_text() + "\n\n"
-            
-            # If we got meaningful text, return it
-            if text_content.strip() and len(text_content.strip()) > 100:
-                return text_content
-            
-            # If PyPDF2 didn't extract enough text, try with Tesseract if available
-            try:
-                import pytesseract
-                from pdf2image import convert_from_path
-                
-                logger.info("Basic text extraction yielded insufficient results, using Tesseract OCR")
-                
-                # Convert PDF to images
-                images = convert_from_path(pdf_file)
-                
-                # Extract text from each image
-                ocr_text = ""
-                for i, image in enumerate(images):
-                    page_text = pytesseract.image_to_string(image)
-                    ocr_text += f"Page {i+1}:\n{page_text}\n\n"
-                
-                # If we got meaningful text from Tesseract, return it
-                if ocr_text.strip() and len(ocr_text.strip()) > 100:
-                    return ocr_text
-            except ImportError:
-                logger.warning("Tesseract OCR not available. Install with 'pip install pytesseract pdf2image'")
-            except Exception as e:
-                logger.error(f"Failed to use Tesseract OCR: {str(e)}")
-            
-            # If we still don't have text, return what we got from PyPDF2
-            return text_content
-        
+            pages = self.iter_pages(pdf_file, lazy=bool(max_chars))
+            parts = []
+            length = 0
+            for text in pages:
+                parts.append(text + "\n\n")
+                length += len(parts[-1])
+                if max_chars and length >= max_chars:
+                    # Closing the generator leaves the remaining pages unread
+                    pages.close()
+                    return "".join(parts)[:max_chars]
+            return "".join(parts)
         except ImportError:
             logger.error("PyPDF2 not installed. Please install with 'pip install PyPDF2'")
             return ""
         except Exception as e:
             logger.error(f"Failed to extract text from PDF: {str(e)}")
             return ""
+
+    def iter_pages(self, pdf_file: str, lazy: bool = True):
+        """Yield the text of each page of a PDF in page order, extracting pages only as they are needed.
+
+        Pages are read in windows: the embedded text layer first, then
+        Tesseract for the pages in the window that need it, so a consumer
+        that stops early never pays for the remaining pages. The first window
+        is ``max_inflight_pages`` long and each one after it twice as long,
+        as every window reopens the PDF.
+
+        Args:
+            pdf_file (str): Path to the PDF file.
+            lazy (bool): When False, the whole document is one window.
+
+        Raises:
+            ImportError: If PyPDF2 is not installed.
+        """
+        first = 1
+        page_count = None
+        window = self.max_inflight_pages
+        ocr_available = True
+        while page_count is None or first <= page_count:
+            last = first + window - 1 if lazy else None
+            window *= 2
+            # Use the embedded text layer wherever a page has one
+            pages, page_count = self._run(_extract_text_layer, pdf_file, self.min_page_chars, first, last).result()
+            if not pages:
+                return
+            texts = {page_num: text for page_num, (text, _, _) in enumerate(pages, start=first)}
+            page_sizes = {page_num: size for page_num, (_, _, size) in enumerate(pages, start=first)}
+
+            # Only pages that show an image but have too little text go to Tesseract
+            ocr_page_numbers = [page_num for page_num, (_, needs_ocr, _) in enumerate(pages, start=first)
+                                if needs_ocr]
+            if ocr_page_numbers and ocr_available:
+                try:
+                    logger.info(f"{len(ocr_page_numbers)} of pages {first}-{first + len(pages) - 1} of "
+                                f"{page_count} have no usable text layer, using Tesseract OCR")
+                    for page_num, page_text in self._ocr_pages(pdf_file, ocr_page_numbers, page_sizes):
+                        if page_text.strip():
+                            texts[page_num] = page_text
+                except ImportError:
+                    logger.warning("Tesseract OCR not available. Install with 'pip install pytesseract pdf2image'")
+                    ocr_available = False
+                except Exception as e:
+                    logger.error(f"Failed to use Tesseract OCR: {str(e)}")
+
+            # Pages whose OCR failed keep whatever text PyPDF2 found
+            for page_num in range(first, first + len(pages)):
+                yield texts[page_num]
+            first += len(pages)
+
+    def _page_dpi(self, size: float) -> int:
+        """Return the render DPI for a page whose longer side is ``size`` points."""
+        if not self.max_pixels or not size:
+            return self.dpi
+        # 72 points to the inch
+        return max(1, min(self.dpi, int(self.max_pixels * 72 / size)))
+
+    def _ocr_pages(self, pdf_file: str, page_numbers, page_sizes: dict = None):
+        """OCR the given pages, yielding (page number, text) in page order.
+
+        Pages are rendered in batches of ``batch_pages`` into a temporary
+        directory, and at most ``max_inflight_pages`` rendered pages exist
+        at any time.
+
+        Args:
+            pdf_file (str): Path to the PDF file.
+            page_numbers: Ascending 1-based page numbers to OCR.
+            page_sizes (dict): Longer side of each page in points, to lower
+                the DPI of oversized pages.
+        """
+        from pdf2image import convert_from_path
+
+        page_sizes = page_sizes or {}
+
+        def dpi(page_num: int) -> int:
+            return self._page_dpi(page_sizes.get(page_num))
+
+        options = (self.steps, self.max_pixels, self.blank_ink, self.tesseract_config)
+        page_numbers = list(page_numbers)
+        in_flight = deque()
+        with tempfile.TemporaryDirectory(prefix='ai_filer_ocr_') as tmp_dir:
+            for start in range(0, len(page_numbers), self.batch_pages):
+                batch = page_numbers[start:start + self.batch_pages]
+
+                # Make room before rendering more pages to disk
+                while in_flight and len(in_flight) + len(batch) > self.max_inflight_pages:
+                    yield self._collect(in_flight.popleft())
+
+                for first, last in _contiguous_runs(batch, key=dpi):
+                    # Rendering in gray saves pdftoppm the colour work and the conversion afterwards
+                    image_paths = convert_from_path(
+                        pdf_file, dpi=dpi(first), first_page=first, last_page=last,
+                        grayscale='grayscale' in self.steps,
+                        output_folder=tmp_dir, output_file=f"p{first}", paths_only=True)
+                    for page_num, image_path in zip(range(first, last + 1), image_paths):
+                        in_flight.append((page_num, image_path, self._run(_ocr_page, image_path, *options)))
+
+            while in_flight:
+                yield self._collect(in_flight.popleft())
+
+    @staticmethod
+    def _collect(entry) -> tuple[int, str]:
+        page_num, image_path, future = entry
+        try:
+            return page_num, future.result()
+        finally:
+            os.remove(image_path)
+
+
+class _Done:
+    """Already-completed stand-in for a Future when no executor is set."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
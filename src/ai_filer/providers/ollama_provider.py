@@ -1,38 +1,136 @@
-import os
+import json
+import asyncio
+import ollama
 import requests
+from requests.adapters import HTTPAdapter
 from loguru import logger
 from ai_filer.providers.base_provider import BaseProvider
 from ai_filer.providers.ocr import OCR
 
+# Port the Ollama server listens on unless OLLAMA_HOST says otherwise
+DEFAULT_PORT = 11434
+
+
+def server_url(host: str) -> str:
+    """Return the base URL of an Ollama server.
+
+    OLLAMA_HOST, which the server itself reads, is often just a host and
+    port ('0.0.0.0', '127.0.0.1:11434'); those get a scheme, and a bare
+    host gets Ollama's port.
+    """
+    host = host.strip().rstrip('/')
+    if '://' in host:
+        return host
+    if ':' not in host.rsplit(']', 1)[-1]:
+        host = f"{host}:{DEFAULT_PORT}"
+    return f"http://{host}"
+
+
 class OllamaProvider(BaseProvider):
     """Provider for Ollama API."""
 
+    name = 'ollama'
+    extracts_pages = True
+
     def __init__(self, config):
         """Initialize the Ollama provider with the specified config."""
         super().__init__(config)
-        self.ollama_url = 'http://localhost:11434/api/generate'
-        self.model = config['model']
-        self.ocr = OCR()
-
-    def call_llm(self, prompt: str) -> str:
-        """Make a call to the Ollama API."""
-        try:
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    'model': self.model,
-                    'prompt': prompt,
-                    'stream': False
-                })
+        self.host = server_url(config['ollama_host'])
+        self.ollama_url = f"{self.host}/api/generate"
+        self.timeout = (config['ollama_connect_timeout'], config['ollama_read_timeout'])
+        self.keep_alive = config['ollama_keep_alive']
+        self.options = json.loads(config['ollama_options']) if config['ollama_options'] else {}
+        self.stream = config['ollama_stream']
+        self.max_response_chars = config['ollama_max_response_chars']
+        self.ocr = OCR(config)
 
+        # Reuse connections across calls; every concurrent LLM call may need one
+        pool_size = max(1, config['llm_workers'] * config['summary_parallelism'])
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._async_client = None
+
+    @property
+    def async_client(self) -> ollama.AsyncClient:
+        """Async Ollama client, created on first use so it binds to the running event loop."""
+        if self._async_client is None:
+            self._async_client = ollama.AsyncClient(host=self.host, timeout=self.timeout[1])
+        return self._async_client
+
+    def _call_llm(self, prompt: str, schema: dict = None, options: dict = None) -> str:
+        """Make a call to the Ollama API.
+
+        Args:
+            prompt (str): The prompt to send.
+            schema (dict): Optional JSON schema the response must follow.
+            options (dict): Generation options for this call, such as
+                ``num_ctx`` or ``num_predict``, merged over the configured ones.
+        """
+        payload = {
+            'model': self.model,
+            'prompt': prompt,
+            'stream': self.stream,
+            # Keep the model loaded between calls instead of reloading it
+            'keep_alive': self.keep_alive
+        }
+        if schema:
+            # Structured output: constrain the response to the JSON schema
+            payload['format'] = schema
+        if self.options or options:
+            payload['options'] = {**self.options, **(options or {})}
+
+        with self.session.post(self.ollama_url, json=payload, timeout=self.timeout,
+                               stream=self.stream) as response:
             if response.status_code != 200:
-                logger.error(f"Error calling Ollama: {response.text}")
-                return None
+                raise requests.HTTPError(f"Error calling Ollama: {response.text}", response=response)
+
+            if not self.stream:
+                return response.json()['response'].strip()
+            return self._read_stream(response)
+
+    def _read_stream(self, response) -> str:
+        """Collect a streamed response, cutting it off at max_response_chars."""
+        parts = []
+        length = 0
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise Exception(chunk['error'])
+            parts.append(chunk.get('response', ''))
+            length += len(parts[-1])
+            if chunk.get('done'):
+                break
+            if self.max_response_chars and length >= self.max_response_chars:
+                # Closing the connection makes Ollama stop generating
+                logger.debug(f"Cutting off Ollama response at {length} characters")
+                break
+        return ''.join(parts).strip()
 
-            return response.json()['response'].strip()
-        except Exception as e:
-            logger.error(f"Failed to call Ollama: {str(e)}")
-            return None
+    async def _acall_llm(self, prompt: str, schema: dict = None, options: dict = None) -> str:
+        """Make an async call to the Ollama API. See _call_llm."""
+        response = await self.async_client.generate(
+            model=self.model,
+            prompt=prompt,
+            format=schema,
+            options={**self.options, **(options or {})} or None,
+            keep_alive=self.keep_alive,
+            stream=self.stream)
+        if not self.stream:
+            return response.response.strip()
+
+        parts = []
+        length = 0
+        async for chunk in response:
+            parts.append(chunk.response)
+            length += len(chunk.response)
+            if self.max_response_chars and length >= self.max_response_chars:
+                logger.debug(f"Cutting off Ollama response at {length} characters")
+                break
+        await response.aclose()
+        return ''.join(parts).strip()
 
     def summarize_document(self, text: str = None, pdf_file: str = None) -> str:
         """Summarize a document's content."""
@@ -44,14 +142,31 @@ class OllamaProvider(BaseProvider):
                 raise ValueError("Failed to extract text from PDF")
         
         if text:
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'summarize_local.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            prompt = prompt.replace('{{text}}', text)
-            return self.call_llm(prompt)
+            return self.summarize_text(text)
         
         raise ValueError("Either text or pdf_file must be provided")
 
-    def extract_text_from_pdf(self, pdf_file: str) -> str:
-        """Extract text from a PDF file."""
-        return self.ocr.extract_text_from_pdf(pdf_file) 
\ No newline at end of file
+    async def asummarize_document(self, text: str = None, pdf_file: str = None) -> str:
+        """Summarize a document's content asynchronously."""
+        if pdf_file and not text:
+            logger.info("Extracting text from PDF using local OCR")
+            text = await self.aextract_text_from_pdf(pdf_file)
+            if not text:
+                raise ValueError("Failed to extract text from PDF")
+
+        if text:
+            return await self.asummarize_text(text)
+
+        raise ValueError("Either text or pdf_file must be provided")
+
+    def extract_text_from_pdf(self, pdf_file: str, max_chars: int = 0) -> str:
+        """Extract text from a PDF file, stopping at ``max_chars`` if set."""
+        return self.ocr.extract_text_from_pdf(pdf_file, max_chars)
+
+    async def aextract_text_from_pdf(self, pdf_file: str, max_chars: int = 0) -> str:
+        """Extract text from a PDF file asynchronously. The OCR work itself runs in the OCR process pool."""
+        return await asyncio.to_thread(self.ocr.extract_text_from_pdf, pdf_file, max_chars)
+
+    def set_ocr_executor(self, executor):
+        """Run local OCR in the given process pool."""
+        self.ocr.executor = executor
@@ -1,15 +1,44 @@
 import os
+import json
 import time
+import asyncio
 from loguru import logger
-from openai import OpenAI
-from ai_filer.providers.base_provider import BaseProvider
+from openai import OpenAI, AsyncOpenAI, APITimeoutError, AssistantEventHandler
+from ai_filer.providers.base_provider import BaseProvider, ProviderError
+from ai_filer.providers.batch_api import BatchAPI
+from ai_filer.providers.uploads import UploadManager
 
-class OpenAIProvider(BaseProvider):
+# Batch job statuses after which the output files are final
+BATCH_DONE = ('completed', 'expired', 'cancelled')
+BATCH_FAILED = ('failed',)
+
+
+class _RunHandler(AssistantEventHandler):
+    """Stream event handler that notes when the stream stalled past the client's timeout."""
+
+    timed_out = False
+
+    def on_timeout(self):
+        # The transport's timeout class depends on the SDK's HTTP backend; this hook doesn't
+        self.timed_out = True
+
+
+class OpenAIProvider(BatchAPI, BaseProvider):
     """Provider for OpenAI API."""
 
+    name = 'openai'
+
     def __init__(self, config):
         """Initialize the OpenAI provider with the specified config."""
         super().__init__(config)
+        self.model = "gpt-4o-mini"
+        # Alternative API endpoint, such as a proxy or a local stub; None uses the SDK default
+        self.base_url = config['openai_base_url'] or None
+        # Longest an assistant run may take before it is cancelled
+        self.run_timeout = config['openai_run_timeout']
+        self.uploads = UploadManager(self.name, self._upload_file,
+                                     lambda file: self.client.files.delete(file.id),
+                                     ttl=config['upload_ttl'])
         
         if config.get('use_mac_keyring', True):
             self._initialize_from_keyring()
@@ -33,159 +62,217 @@ class OpenAIProvider(BaseProvider):
         self.api_key = self._get_from_keyring('ai_filer', 'openai_api_key')
         if not self.api_key:
             raise ValueError("OpenAI API key not found in keyring")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
 
     def _initialize_from_env(self):
         """Initialize API client using credentials from environment variables or config."""
         self.api_key = os.environ.get('OPENAI_API_KEY', self.config.get('openai_api_key'))
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable must be set")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+
+    def _upload_file(self, pdf_file: str):
+        """Upload a PDF for use by the Assistants API."""
+        with open(pdf_file, "rb") as file:
+            return self.client.files.create(
+                file=file,
+                purpose="assistants"
+            )
 
-    def call_llm(self, prompt: str) -> str:
+    def _chat_request(self, prompt: str, schema: dict = None) -> dict:
+        """Build the chat completion request for a prompt."""
+        request = {
+            'model': self.model,
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': 0
+        }
+        if schema:
+            # Structured output: constrain the response to the JSON schema
+            request['response_format'] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": schema, "strict": True}
+            }
+        return request
+
+    def _call_llm(self, prompt: str, schema: dict = None) -> str:
         """Make a call to the OpenAI API."""
+        response = self.client.chat.completions.create(**self._chat_request(prompt, schema))
+        return response.choices[0].message.content.strip()
+
+    async def _acall_llm(self, prompt: str, schema: dict = None) -> str:
+        """Make an async call to the OpenAI API."""
+        response = await self.async_client.chat.completions.create(**self._chat_request(prompt, schema))
+        return response.choices[0].message.content.strip()
+
+    def _submit_batch(self, requests: dict[str, tuple[str, str]]) -> dict:
+        """Upload the PDFs and a JSONL file of chat completion requests, and create a batch job from them."""
+        batch = {'id': None, 'files': []}
+        uploads = {}
+        lines = []
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Failed to call OpenAI: {str(e)}")
+            for key, (prompt, pdf_file) in requests.items():
+                body = self._chat_request(prompt)
+                if pdf_file:
+                    if pdf_file not in uploads:
+                        with open(pdf_file, 'rb') as file:
+                            uploads[pdf_file] = self.client.files.create(file=file, purpose='user_data')
+                        batch['files'].append(uploads[pdf_file].id)
+                    body['messages'][0]['content'] = [
+                        {'type': 'file', 'file': {'file_id': uploads[pdf_file].id}},
+                        {'type': 'text', 'text': prompt},
+                    ]
+                lines.append(json.dumps({'custom_id': key, 'method': 'POST', 'url': '/v1/chat/completions',
+                                         'body': body}))
+
+            input_file = self.client.files.create(file=('batch.jsonl', '\n'.join(lines).encode()), purpose='batch')
+            batch['files'].append(input_file.id)
+            batch['id'] = self.client.batches.create(input_file_id=input_file.id, endpoint='/v1/chat/completions',
+                                                     completion_window='24h').id
+        except BaseException:
+            self._finish_batch(batch)
+            raise
+        logger.debug(f"Created OpenAI batch {batch['id']} with {len(lines)} requests")
+        return batch
+
+    def _poll_batch(self, batch: dict) -> dict[str, str] | None:
+        """Return the responses of a finished batch job, or None while it runs."""
+        job = self.client.batches.retrieve(batch['id'])
+        if job.status in BATCH_FAILED:
+            errors = '; '.join(error.message or '' for error in (job.errors.data or [])) if job.errors else ''
+            raise ProviderError(f"OpenAI batch {job.id} failed: {errors}")
+        if job.status not in BATCH_DONE:
             return None
 
+        # Expired and cancelled jobs still return the requests that finished
+        results = {}
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            batch['files'].append(file_id)
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response') or {}
+                content = None
+                if response.get('status_code') == 200:
+                    content = response['body']['choices'][0]['message'].get('content')
+                if content:
+                    results[entry['custom_id']] = content
+                else:
+                    logger.warning(f"OpenAI batch request {entry['custom_id']} failed: "
+                                   f"{entry.get('error') or response.get('body')}")
+        return results
+
+    def _cancel_batch(self, batch: dict):
+        """Cancel a running batch job."""
+        self.client.batches.cancel(batch['id'])
+
+    def _finish_batch(self, batch: dict):
+        """Delete the uploaded PDFs, the request file and the output files."""
+        for file_id in batch['files']:
+            try:
+                self.client.files.delete(file_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete OpenAI file {file_id}: {str(e)}")
+
     def summarize_document(self, text: str = None, pdf_file: str = None) -> str:
         """Summarize a document's content."""
         if pdf_file:
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'summarize.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            return self._summarize_with_pdf(prompt, pdf_file)
+            return self._summarize_with_pdf(self.load_prompt('summarize.txt'), pdf_file)
         
         if text:
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'summarize_local.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            prompt = prompt.replace('{{text}}', text)
-            return self.call_llm(prompt)
+            return self.summarize_text(text)
         
         raise ValueError("Either text or pdf_file must be provided")
 
+    async def asummarize_document(self, text: str = None, pdf_file: str = None) -> str:
+        """Summarize a document's content asynchronously."""
+        if pdf_file:
+            # The Assistants file flow stays synchronous; run it off the event loop
+            return await asyncio.to_thread(self._summarize_with_pdf, self.load_prompt('summarize.txt'), pdf_file)
+
+        if text:
+            return await self.asummarize_text(text)
+
+        raise ValueError("Either text or pdf_file must be provided")
+
     def _summarize_with_pdf(self, prompt_template: str, pdf_file: str) -> str:
         """Summarize a PDF document using OpenAI's API with file upload capability."""
-        try:
-            # First, upload the file
-            with open(pdf_file, "rb") as file:
-                file_upload = self.client.files.create(
-                    file=file,
-                    purpose="assistants"
-                )
-            
-            # Create a message with the file attachment
-            thread = self.client.beta.threads.create()
-            
-            # Extract the prompt instruction part from the template
-            prompt_instruction = prompt_template.split('{{text}}')[0].strip()
-            
-            # Create a message with the file and instruction
-            message = self.client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=prompt_instruction,
-                file_ids=[file_upload.id]
-            )
-            
-            # Run the assistant on the thread
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.config.get('openai_assistant_id', 'asst_abc123'),
-                instructions="Summarize the PDF document"
-            )
-            
-            # Wait for completion
-            while run.status != "completed":
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                if run.status in ["failed", "cancelled", "expired"]:
-                    logger.error(f"OpenAI run failed with status: {run.status}")
-                    return None
-                time.sleep(1)
-            
-            # Get the response
-            messages = self.client.beta.threads.messages.list(
-                thread_id=thread.id
-            )
-            
-            # Return the assistant's response
-            for message in messages.data:
-                if message.role == "assistant":
-                    return message.content[0].text.value
-            
-            return None
-        except Exception as e:
-            logger.error(f"Failed to summarize with OpenAI: {str(e)}")
-            return None
+        # Extract the prompt instruction part from the template
+        prompt_instruction = prompt_template.split('{{text}}')[0].strip()
+        return self._run_assistant(prompt_instruction, "Summarize the PDF document", pdf_file)
 
     def extract_text_from_pdf(self, pdf_file: str) -> str:
         """Extract text from a PDF file using OpenAI."""
+        logger.info("Extracting text from PDF using OpenAI")
+        return self._run_assistant(self.load_prompt('perform_ocr.txt'),
+                                   "Extract all text content from the PDF document", pdf_file)
+
+    def _run_assistant(self, prompt: str, instructions: str, pdf_file: str) -> str:
+        """Run the assistant on a PDF and return its reply, rate limited and retried.
+
+        The run is streamed, so the reply is returned as soon as the run
+        finishes instead of on the next poll.
+
+        Raises:
+            ProviderError: If the run fails, times out or doesn't reply.
+        """
+        return self._limited(lambda: self._stream_run(prompt, instructions, pdf_file), prompt)
+
+    def _stream_run(self, prompt: str, instructions: str, pdf_file: str) -> str:
+        """Stream one assistant run on a new thread, deleting the thread afterwards."""
+        # Upload the file, or reuse an earlier upload of it
+        file_upload = self.uploads.get(pdf_file)
+
+        # Create a thread holding the instruction with the file attached
+        thread = self.client.beta.threads.create(messages=[{
+            "role": "user",
+            "content": prompt,
+            "attachments": [{"file_id": file_upload.id, "tools": [{"type": "file_search"}]}]
+        }])
         try:
-            # Load the OCR prompt
-            prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompts', 'perform_ocr.txt')
-            with open(prompt_path, 'r') as f:
-                prompt = f.read()
-            
-            logger.info("Extracting text from PDF using OpenAI")
-            
-            # Upload the file
-            with open(pdf_file, "rb") as file:
-                file_upload = self.client.files.create(
-                    file=file,
-                    purpose="assistants"
-                )
-            
-            # Create a thread
-            thread = self.client.beta.threads.create()
-            
-            # Create a message with the file and instruction
-            message = self.client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=prompt,
-                file_ids=[file_upload.id]
-            )
-            
-            # Run the assistant on the thread
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.config.get('openai_assistant_id', 'asst_abc123'),
-                instructions="Extract all text content from the PDF document"
-            )
-            
-            # Wait for completion
-            while run.status != "completed":
-                run = self.client.beta.threads.runs.retrieve(
+            deadline = time.monotonic() + self.run_timeout
+            handler = _RunHandler()
+            try:
+                with self.client.beta.threads.runs.stream(
                     thread_id=thread.id,
-                    run_id=run.id
-                )
-                if run.status in ["failed", "cancelled", "expired"]:
-                    logger.error(f"OpenAI run failed with status: {run.status}")
-                    return ""
-                time.sleep(1)
-            
-            # Get the response
-            messages = self.client.beta.threads.messages.list(
-                thread_id=thread.id
-            )
-            
+                    assistant_id=self.config.get('openai_assistant_id', 'asst_abc123'),
+                    instructions=instructions,
+                    timeout=self.run_timeout,
+                    event_handler=handler
+                ) as stream:
+                    for event in stream:
+                        if time.monotonic() > deadline:
+                            raise TimeoutError
+                    run = stream.get_final_run()
+                    messages = stream.get_final_messages()
+            except Exception as e:
+                # A slow run, or a stalled stream, which the limiter would otherwise retry as a transient error
+                if not (handler.timed_out or isinstance(e, (TimeoutError, APITimeoutError))):
+                    raise
+                run = handler.current_run
+                if run:
+                    try:
+                        self.client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                    except Exception as cancel_error:
+                        logger.warning(f"Failed to cancel OpenAI run {run.id}: {str(cancel_error)}")
+                # Not retried: a run this slow would most likely time out again
+                raise ProviderError(f"OpenAI run took longer than {self.run_timeout}s")
+
+            if run.status != "completed":
+                raise ProviderError(f"OpenAI run failed with status: {run.status}")
+
             # Return the assistant's response
-            for message in messages.data:
+            for message in messages:
                 if message.role == "assistant":
-                    return message.content[0].text.value
-            
-            return ""
-        except Exception as e:
-            logger.error(f"Failed to extract text with OpenAI: {str(e)}")
-            return "" 
\ No newline at end of file
+                    return "".join(block.text.value for block in message.content if block.type == "text")
+            raise ProviderError("OpenAI run finished without a reply")
+        finally:
+            # Threads are single-use; don't leave them behind on the account
+            try:
+                self.client.beta.threads.delete(thread.id)
+            except Exception as e:
+                logger.warning(f"Failed to delete OpenAI thread: {str(e)}")
@@ -0,0 +1,202 @@
+import time
+import random
+import asyncio
+import threading
+from loguru import logger
+from ai_filer.metrics import METRICS
+
+# HTTP statuses that mean "try again later" rather than "this request is wrong"
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def error_status(error: Exception) -> int | None:
+    """Return the HTTP status of an SDK or requests exception, if it has one."""
+    for attr in ('status_code', 'code', 'status'):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return whether a failed LLM call is worth retrying.
+
+    Rate limiting, server errors, timeouts and dropped connections are
+    retryable; anything else (bad request, auth failure) is not.
+    """
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # SDKs wrap transport failures in their own classes, e.g. APIConnectionError or ReadTimeout
+    return any('Timeout' in cls.__name__ or 'Connection' in cls.__name__ for cls in type(error).__mro__)
+
+
+def retry_after(error: Exception) -> float | None:
+    """Return the delay the server asked for in a Retry-After header, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate.
+
+    Used both for requests per minute (one token per call) and for tokens per
+    minute (estimated prompt tokens per call).
+    """
+
+    def __init__(self, per_minute: float):
+        """Initialize a full bucket holding one minute's worth of tokens."""
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return how long to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Requests larger than the bucket are allowed through once it is full
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Rate limiting, retries and adaptive concurrency for LLM calls.
+
+    Every call first takes from the requests-per-minute and tokens-per-minute
+    buckets, then waits for a concurrency slot. The number of slots adapts
+    AIMD-style: it grows by one for every window of successful calls and is
+    halved whenever the provider throttles us. Retryable failures are
+    retried with exponential backoff and full jitter, honouring Retry-After.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 16, adaptive: bool = True, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        """Initialize the limiter.
+
+        Args:
+            name (str): Provider name, used in log messages.
+            requests_per_minute (float): Request quota. 0 means unlimited.
+            tokens_per_minute (float): Token quota. 0 means unlimited.
+            max_concurrency (int): Upper bound on calls in flight.
+            adaptive (bool): Adapt the concurrency limit to throttling.
+            max_retries (int): Retries per call before giving up.
+            base_delay (float): First backoff delay in seconds.
+            max_delay (float): Longest backoff delay in seconds.
+        """
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.adaptive = adaptive
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self._async_condition = None
+
+    def _reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        return wait
+
+    def _try_enter(self) -> bool:
+        with self.condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def _leave(self, throttled: bool):
+        with self.condition:
+            self.in_flight -= 1
+            if self.adaptive and throttled:
+                # Multiplicative decrease
+                self.limit = max(1.0, self.limit / 2)
+                logger.debug(f"{self.name} throttled, concurrency limit now {int(self.limit)}")
+            elif self.adaptive:
+                # Additive increase: about +1 per limit's worth of successful calls
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0)
+
+    def call(self, func, tokens: int = 0):
+        """Call ``func`` under the rate limits, retrying retryable failures.
+
+        Args:
+            func: Callable making one attempt at the LLM call.
+            tokens (int): Estimated tokens the call consumes.
+        """
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._reserve(tokens))
+            with self.condition:
+                while not self._try_enter():
+                    self.condition.wait()
+            try:
+                result = func()
+            except Exception as e:
+                throttled = is_retryable(e)
+                self._leave(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"{self.name} call failed ({str(e)}), retrying in {delay:.1f}s")
+                METRICS.inc('ai_filer_llm_retries_total', provider=self.name)
+                time.sleep(delay)
+                continue
+            self._leave(False)
+            return result
+
+    async def acall(self, func, tokens: int = 0):
+        """Async variant of call. ``func`` returns an awaitable."""
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._reserve(tokens))
+            async with self._async_condition:
+                await self._async_condition.wait_for(self._try_enter)
+            try:
+                result = await func()
+            except Exception as e:
+                throttled = is_retryable(e)
+                await self._aleave(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"{self.name} call failed ({str(e)}), retrying in {delay:.1f}s")
+                METRICS.inc('ai_filer_llm_retries_total', provider=self.name)
+                await asyncio.sleep(delay)
+                continue
+            await self._aleave(False)
+            return result
+
+    async def _aleave(self, throttled: bool):
+        self._leave(throttled)
+        async with self._async_condition:
+            self._async_condition.notify_all()
@@ -0,0 +1,57 @@
+from importlib import import_module
+from loguru import logger
+
+# Entry point group other packages register providers under, e.g. in pyproject.toml:
+#   [project.entry-points."ai_filer.providers"]
+#   mistral = "ai_filer_mistral:MistralProvider"
+ENTRY_POINT_GROUP = 'ai_filer.providers'
+
+# Built-in providers as "module:class", so a provider's SDK is only imported when it is used
+BUILTIN_PROVIDERS = {
+    'openai': 'ai_filer.providers.openai_provider:OpenAIProvider',
+    'gemini': 'ai_filer.providers.gemini_provider:GeminiProvider',
+    'ollama': 'ai_filer.providers.ollama_provider:OllamaProvider',
+}
+
+# Any model that doesn't name a provider is assumed to be an Ollama model
+DEFAULT_PROVIDER = 'ollama'
+
+# Characters that appear in Ollama model names (llama3.2, qwen2.5:7b, user/model) but not in provider names
+_OLLAMA_NAME_CHARS = ('.', ':', '/')
+
+
+def _import(target: str):
+    module_name, _, attribute = target.partition(':')
+    return getattr(import_module(module_name), attribute)
+
+
+def _entry_point(name: str):
+    # importlib.metadata is slow to import, so get_provider_class only calls this when a plugin may be wanted
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP, name=name):
+        return entry_point
+    return None
+
+
+def get_provider_class(model: str) -> type:
+    """Return the provider class for the configured model, importing only that provider.
+
+    ``model`` selects a provider by name: a built-in one (``openai``,
+    ``gemini``), then one registered under the ``ai_filer.providers`` entry
+    point group. Anything else is an Ollama model name. Names shaped like
+    Ollama's, with a version, tag or namespace, skip the entry point lookup.
+
+    Args:
+        model (str): The configured model.
+    """
+    if model in BUILTIN_PROVIDERS:
+        return _import(BUILTIN_PROVIDERS[model])
+
+    if not any(char in model for char in _OLLAMA_NAME_CHARS):
+        entry_point = _entry_point(model)
+        if entry_point is not None:
+            logger.debug(f"Using provider {entry_point.value} for {model}")
+            return entry_point.load()
+
+    return _import(BUILTIN_PROVIDERS[DEFAULT_PROVIDER])
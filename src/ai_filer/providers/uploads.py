@@ -0,0 +1,152 @@
+import time
+import asyncio
+import threading
+from loguru import logger
+from ai_filer.cache import sha256_file
+
+
+class _Upload:
+    """A remote copy of one document."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handle = None
+        self.uploaded = 0.0
+        self.used = 0.0
+
+
+class UploadManager:
+    """Uploads each document to a provider once and shares the remote file.
+
+    Remote files are keyed by the SHA-256 of the PDF, so the extract and
+    summarize stages, and retries of a document that failed, all reuse a
+    single upload. A remote file expires after ``ttl`` seconds without use,
+    or ``max_age`` seconds after upload for providers that delete files on
+    their own schedule. Released and expired files are deleted in a
+    background thread.
+    """
+
+    def __init__(self, name: str, upload, delete, ttl: float, max_age: float = None):
+        """Initialize the manager.
+
+        Args:
+            name (str): Provider name, used in log messages.
+            upload: Callable taking a PDF path and returning the remote file.
+            delete: Callable taking a remote file and deleting it.
+            ttl (float): Seconds an unused remote file is kept.
+            max_age (float): Seconds after upload the provider keeps a file,
+                if it expires files itself.
+        """
+        self.name = name
+        self.upload = upload
+        self.delete = delete
+        self.ttl = ttl
+        self.max_age = max_age
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.pending_deletes = []
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def get(self, pdf_file: str):
+        """Return the remote file for a PDF, uploading it if needed."""
+        content_hash = sha256_file(pdf_file)
+        with self.lock:
+            entry = self.uploads.setdefault(content_hash, _Upload())
+            self._start_cleanup()
+
+        # Concurrent stages of the same document wait for one upload
+        with entry.lock:
+            now = time.monotonic()
+            if entry.handle is not None and self._expired(entry, now):
+                self._schedule_delete(entry.handle)
+                entry.handle = None
+            if entry.handle is None:
+                logger.debug(f"Uploading {pdf_file} to {self.name}")
+                entry.handle = self.upload(pdf_file)
+                entry.uploaded = now
+            else:
+                logger.debug(f"Reusing {self.name} upload of {pdf_file}")
+            entry.used = now
+            return entry.handle
+
+    async def aget(self, pdf_file: str):
+        """Return the remote file for a PDF asynchronously. See get."""
+        return await asyncio.to_thread(self.get, pdf_file)
+
+    def release(self, pdf_file: str):
+        """Delete the remote file for a PDF that no stage needs any more."""
+        content_hash = sha256_file(pdf_file)
+        with self.lock:
+            entry = self.uploads.pop(content_hash, None)
+        if entry is None:
+            return
+        with entry.lock:
+            if entry.handle is not None:
+                self._schedule_delete(entry.handle)
+                entry.handle = None
+
+    def close(self):
+        """Stop the cleanup thread and delete every remaining remote file."""
+        with self.lock:
+            self.stopping = True
+            entries = list(self.uploads.values())
+            self.uploads.clear()
+        for entry in entries:
+            with entry.lock:
+                if entry.handle is not None:
+                    self._schedule_delete(entry.handle)
+                    entry.handle = None
+        self.wake.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self._delete_pending()
+
+    def _expired(self, entry: _Upload, now: float) -> bool:
+        if now - entry.used > self.ttl:
+            return True
+        return self.max_age is not None and now - entry.uploaded > self.max_age
+
+    def _schedule_delete(self, handle):
+        with self.lock:
+            self.pending_deletes.append(handle)
+        self.wake.set()
+
+    def _start_cleanup(self):
+        # Called with self.lock held
+        if self.thread is None and not self.stopping:
+            self.thread = threading.Thread(target=self._cleanup, name=f"{self.name}-uploads", daemon=True)
+            self.thread.start()
+
+    def _cleanup(self):
+        """Delete released and expired remote files until closed."""
+        interval = max(1.0, min(self.ttl, self.max_age or self.ttl) / 4)
+        while not self.stopping:
+            self.wake.wait(interval)
+            self.wake.clear()
+            now = time.monotonic()
+            with self.lock:
+                entries = list(self.uploads.values())
+            for entry in entries:
+                # Skip entries a stage is using right now
+                if not entry.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if entry.handle is not None and self._expired(entry, now):
+                        with self.lock:
+                            self.pending_deletes.append(entry.handle)
+                        entry.handle = None
+                finally:
+                    entry.lock.release()
+            self._delete_pending()
+
+    def _delete_pending(self):
+        with self.lock:
+            handles, self.pending_deletes = self.pending_deletes, []
+        for handle in handles:
+            try:
+                self.delete(handle)
+            except Exception as e:
+                logger.warning(f"Failed to delete {self.name} upload: {str(e)}")
@@ -0,0 +1,175 @@
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from ai_filer.pdf_metadata import read_info
+
+# Kept as a file in the filing system root, so it never shows up as a category
+INDEX_NAME = '.ai_filer_search.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    filename TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    category TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    filename, summary, category, text,
+    content='documents', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, filename, summary, category, text)
+    VALUES (new.id, new.filename, new.summary, new.category, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, filename, summary, category, text)
+    VALUES ('delete', old.id, old.filename, old.summary, old.category, old.text);
+END;
+"""
+
+# Column weights for ranking: filename, summary, category, OCR text
+_WEIGHTS = (5.0, 3.0, 2.0, 1.0)
+
+
+def _read_document(pdf_file: str):
+    """Return the indexed metadata of a filed PDF. Runs in a worker process."""
+    try:
+        info = read_info(pdf_file)
+    except Exception as e:
+        return pdf_file, None, str(e)
+    return pdf_file, (info.get('Summary', ''), info.get('Category', ''), info.get('OCRText', '')), None
+
+
+class SearchResult:
+    """One document matching a search."""
+
+    def __init__(self, path: str, category: str, summary: str, snippet: str, score: float):
+        self.path = path
+        self.category = category
+        self.summary = summary
+        self.snippet = snippet
+        self.score = score
+
+
+class SearchIndex:
+    """SQLite FTS5 full-text index of the documents in the filing system.
+
+    Each filed document's path, summary, category and OCR text are indexed,
+    ranked with BM25 weighted towards the filename and summary. Paths are
+    stored relative to the filing system root.
+    """
+
+    def __init__(self, root: str):
+        """Open (and create if needed) the index of a filing system.
+
+        Args:
+            root (str): The filing system root.
+        """
+        self.root = root
+        self.path = os.path.join(root, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+
+    def add(self, file_path: str, summary: str, category: str, text: str):
+        """Index a filed document, replacing any previous entry for its path."""
+        stat = os.stat(file_path)
+        with self.lock:
+            self._insert(file_path, stat, summary, category, text)
+            self.conn.commit()
+
+    def _insert(self, file_path: str, stat, summary: str, category: str, text: str):
+        path = os.path.relpath(file_path, self.root)
+        # Not INSERT OR REPLACE: the delete trigger has to see the old row
+        self.conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+        self.conn.execute(
+            'INSERT INTO documents (path, filename, summary, category, text, size, mtime) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, os.path.splitext(os.path.basename(path))[0], summary or '', category or '', text or '',
+             stat.st_size, stat.st_mtime_ns))
+
+    def search(self, query: str, limit: int = 10) -> list[SearchResult]:
+        """Return the documents best matching a query, best first.
+
+        The query may use FTS5 syntax (``"exact phrase"``, ``OR``,
+        ``summary:water``); anything that isn't valid FTS5 is searched as
+        plain words.
+        """
+        sql = (
+            'SELECT d.path, d.category, d.summary, '
+            "snippet(documents_fts, -1, '[', ']', '...', 12), "
+            'bm25(documents_fts, ?, ?, ?, ?) AS score '
+            'FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid '
+            'WHERE documents_fts MATCH ? ORDER BY score LIMIT ?')
+        with self.lock:
+            try:
+                rows = self.conn.execute(sql, (*_WEIGHTS, query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                words = re.findall(r'\w+', query)
+                if not words:
+                    return []
+                plain = ' '.join(f'"{word}"' for word in words)
+                rows = self.conn.execute(sql, (*_WEIGHTS, plain, limit)).fetchall()
+        return [SearchResult(os.path.join(self.root, path), category, summary, snippet, -score)
+                for path, category, summary, snippet, score in rows]
+
+    def reindex(self, workers: int = None) -> int:
+        """Bring the index in line with the PDFs in the filing system.
+
+        New and changed PDFs (by size and mtime) have their metadata read in
+        a process pool; entries for PDFs that no longer exist are dropped.
+
+        Args:
+            workers (int): Number of worker processes. Defaults to the CPU count.
+
+        Returns:
+            int: The number of documents in the index.
+        """
+        with self.lock:
+            known = {path: (size, mtime) for path, size, mtime in
+                     self.conn.execute('SELECT path, size, mtime FROM documents')}
+
+        to_read = {}
+        seen = set()
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if not file_name.lower().endswith('.pdf'):
+                    continue
+                pdf_file = os.path.join(dir_path, file_name)
+                path = os.path.relpath(pdf_file, self.root)
+                try:
+                    stat = os.stat(pdf_file)
+                except OSError:
+                    continue
+                seen.add(path)
+                if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                    to_read[pdf_file] = stat
+
+        logger.info(f"Indexing {len(to_read)} new or changed documents")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_read_document, to_read, chunksize=16)
+            with self.lock:
+                for pdf_file, document, error in results:
+                    if document is None:
+                        logger.warning(f"Failed to read {pdf_file}: {error}")
+                        continue
+                    self._insert(pdf_file, to_read[pdf_file], *document)
+                removed = [(path,) for path in known if path not in seen]
+                self.conn.executemany('DELETE FROM documents WHERE path = ?', removed)
+                self.conn.commit()
+                count = self.conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        logger.info(f"Search index has {count} documents, removed {len(removed)}")
+        return count
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from loguru import logger
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+document documents letter regarding your you our we dated date page pages
+""".split())
+
+# Summaries kept per directory; older ones add little once a directory's vocabulary is known
+_HISTORY_PER_DIRECTORY = 50
+# The history file is compacted when it holds this many times more entries than after the last compaction
+_COMPACT_GROWTH = 2
+# Filings added to the index incrementally, with the word weights of the last rebuild, before it is rebuilt
+_REBUILD_EVERY = 200
+
+
+def _stem(token: str) -> str:
+    # Crude plural folding, so "Bills" matches "bill"
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word tokens, dropping stopwords and single characters."""
+    return [_stem(token) for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in _STOPWORDS]
+
+
+class Candidates:
+    """The part of the filing tree shown to the LLM for one document.
+
+    Prompts list only the shortlisted directories, but any directory in the
+    full tree is still accepted as the answer.
+    """
+
+    def __init__(self, tree, directories: list[str]):
+        """Initialize the candidates.
+
+        Args:
+            tree: The full filing tree.
+            directories (list[str]): The shortlisted directories, best first.
+        """
+        self.tree = tree
+        self.directories = directories
+
+    def as_prompt(self) -> str:
+        """Return the candidates as a comma separated list of quoted paths, for prompts."""
+        return ','.join(f'"{d}"' for d in self.directories)
+
+    def __contains__(self, category) -> bool:
+        return category in self.tree
+
+    def __iter__(self):
+        return iter(self.directories)
+
+    def __len__(self) -> int:
+        return len(self.directories)
+
+    def __str__(self) -> str:
+        return self.as_prompt()
+
+
+class Shortlister:
+    """Picks the directories most likely to fit a document before classification.
+
+    Each directory is scored against the document with TF-IDF over the
+    words in its path and in the summaries of documents filed there before,
+    so the classify prompt holds ``size`` candidates however large the
+    filing tree grows. The history of filed summaries is appended to a
+    JSON Lines file, which keeps the latest summaries of each directory.
+    The index is rebuilt when the tree changes; new filings are added to it
+    as they happen, and it is only rebuilt every ``_REBUILD_EVERY`` of them
+    to bring the word weights up to date.
+    """
+
+    def __init__(self, history_path: str, size: int):
+        """Initialize the shortlister.
+
+        Args:
+            history_path (str): JSON Lines file of previously filed summaries.
+            size (int): Number of candidates to keep. 0 disables shortlisting.
+        """
+        self.history_path = history_path
+        self.size = size
+        self.lock = threading.Lock()
+        self.history = self._load_history()
+        self.compacted_size = len(self.history)
+        if len(self.history) > _HISTORY_PER_DIRECTORY:
+            self._compact()
+        self.index = None
+        self.index_directories = None
+        # Number of history entries in the index, and in it as of the last full rebuild
+        self.index_history = 0
+        self.rebuilt_history = 0
+
+    def _load_history(self) -> list[tuple[str, str]]:
+        history = []
+        if not os.path.exists(self.history_path):
+            return history
+        try:
+            with open(self.history_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        history.append((entry['category'], entry['summary']))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError as e:
+            logger.warning(f"Failed to read filing history {self.history_path}: {str(e)}")
+        return history
+
+    def record(self, summary: str, category: str):
+        """Remember that a document with this summary was filed in this category."""
+        if not summary or not category or category == "Unsorted":
+            return
+        with self.lock:
+            self.history.append((category, summary))
+            try:
+                os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+                with open(self.history_path, 'a') as f:
+                    f.write(json.dumps({'category': category, 'summary': summary}) + '\n')
+            except OSError as e:
+                logger.warning(f"Failed to record filing history: {str(e)}")
+            if len(self.history) > _COMPACT_GROWTH * max(self.compacted_size, _HISTORY_PER_DIRECTORY):
+                self._compact()
+
+    def _compact(self):
+        """Keep only the latest summaries of each directory, in memory and in the history file."""
+        kept = Counter()
+        history = []
+        for category, summary in reversed(self.history):
+            if kept[category] < _HISTORY_PER_DIRECTORY:
+                kept[category] += 1
+                history.append((category, summary))
+        history.reverse()
+        if len(history) < len(self.history):
+            try:
+                temp_path = f"{self.history_path}.tmp"
+                with open(temp_path, 'w') as f:
+                    for category, summary in history:
+                        f.write(json.dumps({'category': category, 'summary': summary}) + '\n')
+                os.replace(temp_path, self.history_path)
+            except OSError as e:
+                logger.warning(f"Failed to compact filing history: {str(e)}")
+            # Entries were dropped, so the index can't be updated incrementally
+            self.index = None
+        self.history = history
+        self.compacted_size = len(history)
+
+    def candidates(self, text: str, tree):
+        """Return the part of the tree to show the LLM for a document.
+
+        Args:
+            text (str): The summary, or the document text, to match against.
+            tree: The full filing tree.
+
+        Returns:
+            The tree itself if it is small enough, otherwise Candidates.
+        """
+        if not self.size or len(tree) <= self.size:
+            return tree
+
+        words = set(tokenize(text or ''))
+        # Score under the lock: another worker's _get_index reweighs the same postings in place
+        with self.lock:
+            postings, norms, popularity = self._get_index(tree)
+            scores = defaultdict(float)
+            for term in words:
+                for directory, weight in postings.get(term, {}).items():
+                    scores[directory] += weight
+            ranked = sorted(scores, key=lambda d: (-scores[d] / norms[d], d))
+
+        # Pad with the directories used most, for documents with no matching words
+        chosen = []
+        seen = set()
+        for directory in ranked + popularity:
+            if len(chosen) >= self.size:
+                break
+            if directory not in seen and directory in tree:
+                seen.add(directory)
+                chosen.append(directory)
+        if len(chosen) < self.size:
+            for directory in tree.subdirectories():
+                if len(chosen) >= self.size:
+                    break
+                if directory not in seen:
+                    seen.add(directory)
+                    chosen.append(directory)
+
+        logger.debug(f"Shortlisted {len(chosen)} of {len(tree)} directories")
+        return Candidates(tree, chosen)
+
+    def _get_index(self, tree):
+        """Return the TF-IDF index for the tree, rebuilding or updating it if the tree or history changed."""
+        if self.index is not None and self.index_directories is tree.directories:
+            if self.index_history == len(self.history):
+                return self.index
+            if len(self.history) - self.rebuilt_history < _REBUILD_EVERY:
+                self._add_history()
+                return self.index
+
+        terms = {}
+        for directory in tree.directories:
+            leaf = os.path.basename(directory)
+            # The leaf name counts twice: it is the most specific part of the path
+            terms[directory] = Counter(tokenize(directory.replace(os.sep, ' ')) + tokenize(leaf))
+        usage = Counter()
+        for category, summary in self.history:
+            if category in terms:
+                terms[category].update(tokenize(summary))
+                usage[category] += 1
+
+        document_frequency = Counter()
+        for counts in terms.values():
+            document_frequency.update(counts.keys())
+
+        self.terms = terms
+        self.document_frequency = document_frequency
+        self.usage = usage
+        self.index = (defaultdict(dict), {}, [directory for directory, _ in usage.most_common()])
+        for directory in terms:
+            self._weigh(directory)
+        self.index_directories = tree.directories
+        self.index_history = self.rebuilt_history = len(self.history)
+        return self.index
+
+    def _weigh(self, directory: str):
+        """Set a directory's term weights and norm in the index from its term counts."""
+        postings, norms, _ = self.index
+        total = len(self.terms)
+        norm = 0.0
+        for term, count in self.terms[directory].items():
+            weight = (1 + math.log(count)) * math.log(1 + total / self.document_frequency[term])
+            postings[term][directory] = weight
+            norm += weight * weight
+        norms[directory] = math.sqrt(norm) or 1.0
+
+    def _add_history(self):
+        """Add the filings recorded since the index was built to it.
+
+        Only the directories filed into are reweighed, so the weights of
+        other directories sharing their words lag until the next rebuild.
+        """
+        changed = set()
+        for category, summary in self.history[self.index_history:]:
+            counts = self.terms.get(category)
+            if counts is None:
+                continue
+            tokens = tokenize(summary)
+            self.document_frequency.update(set(tokens) - counts.keys())
+            counts.update(tokens)
+            self.usage[category] += 1
+            changed.add(category)
+        for directory in changed:
+            self._weigh(directory)
+        if changed:
+            postings, norms, _ = self.index
+            self.index = (postings, norms, [directory for directory, _ in self.usage.most_common()])
+        self.index_history = len(self.history)
@@ -9,3 +9,70 @@ class Config(TypedDict):
     debug: bool
     testing: bool
     openai_api_key: str
+    openai_base_url: str
+    openai_run_timeout: float
+    gemini_base_url: str
+    use_mac_keyring: bool
+    ocr_workers: int
+    ocr_batch_pages: int
+    ocr_max_inflight_pages: int
+    ocr_min_page_chars: int
+    ocr_dpi: int
+    ocr_max_pixels: int
+    ocr_preprocess: str
+    ocr_blank_ink: float
+    ocr_psm: int
+    ocr_oem: int
+    extract_workers: int
+    llm_workers: int
+    finalize_workers: int
+    queue_size: int
+    settle_seconds: float
+    poll_interval: float
+    cache_enabled: bool
+    cache_max_entries: int
+    cache_max_age_days: float
+    summary_chunk_chars: int
+    summary_parallelism: int
+    combined_mode: bool
+    ollama_host: str
+    ollama_connect_timeout: float
+    ollama_read_timeout: float
+    ollama_keep_alive: str
+    ollama_options: str
+    ollama_stream: bool
+    ollama_max_response_chars: int
+    runner: str
+    llm_concurrency: int
+    requests_per_minute: int
+    tokens_per_minute: int
+    adaptive_concurrency: bool
+    max_retries: int
+    retry_base_delay: float
+    retry_max_delay: float
+    upload_ttl: float
+    shortlist_size: int
+    fast_classify_threshold: float
+    search_index: bool
+    metrics: bool
+    metrics_dir: str
+    job_queue: bool
+    jobs_db: str
+    job_lease_seconds: float
+    job_max_attempts: int
+    text_budget_chars: int
+    text_budget_tokens: int
+    fulltext_workers: int
+    fulltext_nice: int
+    batch_poll_interval: float
+    batch_timeout: float
+    batch_max_requests: int
+
+
+class Document(TypedDict, total=False):
+    """State of a single document as it moves through the pipeline."""
+    pdf_file: str
+    text: str
+    summary: str
+    directory: str
+    filename: str
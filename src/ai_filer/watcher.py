@@ -0,0 +1,189 @@
+import os
+import signal
+import threading
+import time
+from loguru import logger
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from .file_manager import FileManager
+from .fulltext import FullTextBacklog, complete_full_text
+from .metrics import METRICS, write_metrics
+from .pipeline import Pipeline
+from .types import Config
+
+
+class SettleTracker:
+    """Track candidate PDFs until their size and mtime stop changing.
+
+    Files synced from a phone or a cloud drive appear long before they are
+    fully written. A file is only considered ready once its size and mtime
+    have been stable for ``settle_seconds``.
+    """
+
+    def __init__(self, settle_seconds: float):
+        """Initialize the tracker.
+
+        Args:
+            settle_seconds (float): How long a file must stay unchanged.
+        """
+        self.settle_seconds = settle_seconds
+        self.pending = {}
+        self.in_flight = set()
+        self.deferred = {}
+        self.lock = threading.Lock()
+
+    def touch(self, path: str):
+        """Record that a file was created or changed."""
+        with self.lock:
+            if path in self.in_flight:
+                return
+            self.pending[path] = (None, time.monotonic())
+
+    def discard(self, path: str):
+        """Stop tracking a file that was deleted or moved away."""
+        with self.lock:
+            self.pending.pop(path, None)
+            self.deferred.pop(path, None)
+
+    def defer(self, path: str, delay: float):
+        """Offer a file again after ``delay`` seconds, even if it doesn't change."""
+        with self.lock:
+            self.deferred[path] = time.monotonic() + delay
+
+    def done(self, path: str):
+        """Mark a file as no longer being processed."""
+        with self.lock:
+            self.in_flight.discard(path)
+
+    def pop_ready(self) -> list[str]:
+        """Return the files that have settled and mark them as in flight."""
+        ready = []
+        now = time.monotonic()
+        with self.lock:
+            for path, due in list(self.deferred.items()):
+                if due <= now and path not in self.in_flight:
+                    del self.deferred[path]
+                    self.pending.setdefault(path, (None, now))
+            for path, (signature, changed_at) in list(self.pending.items()):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    del self.pending[path]
+                    continue
+                current = (stat.st_size, stat.st_mtime_ns)
+                if current != signature:
+                    self.pending[path] = (current, now)
+                elif stat.st_size > 0 and now - changed_at >= self.settle_seconds:
+                    del self.pending[path]
+                    self.in_flight.add(path)
+                    ready.append(path)
+        return ready
+
+
+class PdfEventHandler(FileSystemEventHandler):
+    """Feed PDF file system events from the watch folder into a SettleTracker."""
+
+    def __init__(self, tracker: SettleTracker):
+        """Initialize the handler with the tracker to notify."""
+        super().__init__()
+        self.tracker = tracker
+
+    def on_created(self, event):
+        self._touch(event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        self._touch(event.src_path, event.is_directory)
+
+    def on_closed(self, event):
+        self._touch(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self.tracker.discard(event.src_path)
+        self._touch(event.dest_path, event.is_directory)
+
+    def on_deleted(self, event):
+        self.tracker.discard(event.src_path)
+
+    def _touch(self, path, is_directory: bool):
+        path = os.fsdecode(path)
+        if not is_directory and path.endswith('.pdf'):
+            self.tracker.touch(path)
+
+
+def _complete_full_text_loop(config: Config, backlog: FullTextBacklog, file_manager: FileManager,
+                             stop: threading.Event):
+    """Extract the rest of documents filed with only their first pages' text, until stopped."""
+    while not stop.wait(config['poll_interval']):
+        try:
+            complete_full_text(config, backlog, file_manager, stop)
+        except Exception as e:
+            logger.error(f"Full text pass failed: {str(e)}")
+
+
+def run_daemon(config: Config, pipeline: Pipeline, file_manager: FileManager):
+    """Watch the watch folder and process PDFs as soon as they settle.
+
+    Runs until interrupted with Ctrl-C or SIGTERM.
+
+    Args:
+        config (Config): The application config.
+        pipeline (Pipeline): The pipeline to feed documents into.
+        file_manager (FileManager): The file manager used to rescan the filing system.
+    """
+    tracker = SettleTracker(config['settle_seconds'])
+
+    def on_complete(pdf_file: str, ok: bool):
+        tracker.done(pdf_file)
+        if not ok and pipeline.jobs and os.path.exists(pdf_file):
+            # Held by another worker, or failed: claim it again once a dead worker's lease would have
+            # expired. The job queue decides whether it is due, and gives up after job_max_attempts
+            tracker.defer(pdf_file, config['job_lease_seconds'])
+
+    pipeline.on_complete = on_complete
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    observer = Observer()
+    observer.schedule(PdfEventHandler(tracker), config['watch_folder'], recursive=False)
+    observer.start()
+    pipeline.start()
+    logger.info(f"Watching {config['watch_folder']} for new documents")
+
+    # The rest of long documents' text is extracted in the background, at low priority
+    fulltext_thread = None
+    if pipeline.fulltext:
+        fulltext_thread = threading.Thread(target=_complete_full_text_loop, name='fulltext', daemon=True,
+                                           args=(config, pipeline.fulltext, file_manager, stop))
+        fulltext_thread.start()
+
+    # Pick up anything that arrived while the daemon was not running
+    for pdf_file in file_manager.get_all_pdf_files_in_folder(config['watch_folder']):
+        tracker.touch(pdf_file)
+
+    written = METRICS.version
+    try:
+        while not stop.wait(config['poll_interval']):
+            # Keep the exported metrics current while the daemon runs
+            if METRICS.version != written:
+                write_metrics(config)
+                written = METRICS.version
+
+            ready = tracker.pop_ready()
+            if not ready:
+                continue
+            # The filing system may have changed since the last batch
+            pipeline.tree = file_manager.get_tree_of_filing_system(config['dest_folder'])
+            for pdf_file in ready:
+                logger.info(f"New document settled: {os.path.basename(pdf_file)}")
+                pipeline.submit(pdf_file)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping AI Filing System daemon...")
+        stop.set()
+        observer.stop()
+        observer.join()
+        if fulltext_thread:
+            fulltext_thread.join()
+        pipeline.close()